@@ -0,0 +1,43 @@
+"""
+战斗结算宏基准：AOE 伤害、回合结算和状态显示，按战斗规模（2/10/50/200 人）分别计时
+"""
+
+from character.status_formatter import format_character_status
+from database.queries import get_battle_characters, get_character, get_skill
+from database.unit_of_work import unit_of_work
+from game.turn_manager import turn_manager
+from skill.skill_effects import get_skill_registry
+
+# 修改战斗状态的基准每轮执行一次，每轮前恢复战斗
+ROUNDS = 20
+
+
+def bench_execute_aoe_damage(benchmark, battle):
+    skill_info = get_skill(battle.skill_ids['sweep'])
+    effect = get_skill_registry().get_effect(skill_info['id'])
+    attacker_id = battle.friendly_ids[0]
+
+    def execute():
+        # 与 execute_skill 相同：整个结算在一个带战斗快照的工作单元中完成
+        with unit_of_work(battle_state=True):
+            attacker = get_character(attacker_id)
+            return effect.execute_aoe_damage(attacker, None, skill_info)
+
+    result = benchmark.pedantic(battle.scoped(execute), setup=battle.restore, rounds=ROUNDS, iterations=1)
+    assert result['total_damage'] > 0
+
+
+def bench_end_battle_turn(benchmark, battle):
+    messages = benchmark.pedantic(battle.scoped(turn_manager.end_battle_turn), setup=battle.restore,
+                                  rounds=ROUNDS, iterations=1)
+    assert messages
+
+
+def bench_format_character_status(benchmark, battle):
+    # 与 /battle 相同：格式化所有参战角色的状态
+    characters = battle.scoped(get_battle_characters)()
+
+    def format_all():
+        return [format_character_status(character) for character in characters]
+
+    assert len(benchmark(battle.scoped(format_all))) == battle.size
@@ -0,0 +1,51 @@
+"""
+伤害计算微基准：骰子公式、公式伤害、完整的伤害计算和添加状态效果
+（在 10 人战斗中执行，攻击者和目标都带有状态效果）
+"""
+
+import pytest
+
+from character.status_effects import add_status_effect
+from database.queries import get_character, get_skill
+from game.damage_calculator import calculate_advanced_damage, calculate_damage_from_formula, parse_dice_formula
+
+# 骰子公式（含常量、多组骰子和大数量骰子）
+FORMULAS = ('1d6', '5+2d3+1d6', '3d4+2', '20d6+4d8+10', '12')
+
+MICRO_BATTLE_SIZE = 10
+
+
+@pytest.fixture
+def micro_battle(battle_factory):
+    fixture_battle = battle_factory(MICRO_BATTLE_SIZE)
+    fixture_battle.restore()
+    return fixture_battle
+
+
+@pytest.mark.parametrize('formula', FORMULAS)
+def bench_parse_dice_formula(benchmark, formula):
+    benchmark(parse_dice_formula, formula)
+
+
+@pytest.mark.parametrize('formula', FORMULAS)
+def bench_calculate_damage_from_formula(benchmark, micro_battle, formula):
+    # 传入攻击者ID时会检查麻痹状态
+    attacker_id = micro_battle.friendly_ids[0]
+    benchmark(micro_battle.scoped(calculate_damage_from_formula), formula, attacker_id)
+
+
+@pytest.mark.parametrize('skill', ('strike', 'fireball'))
+def bench_calculate_advanced_damage(benchmark, micro_battle, skill):
+    run = micro_battle.scoped
+    skill_info = get_skill(micro_battle.skill_ids[skill])
+    attacker = run(get_character)(micro_battle.friendly_ids[0])
+    target = run(get_character)(micro_battle.enemy_ids[0])
+    benchmark(run(calculate_advanced_damage), skill_info, attacker, target)
+
+
+@pytest.mark.parametrize('effect', ('burn', 'shield'))
+def bench_add_status_effect(benchmark, micro_battle, effect):
+    # 同名效果叠加强度，每次调用都是一次读加一次写
+    effect_type = 'debuff' if effect == 'burn' else 'buff'
+    target_id = micro_battle.enemy_ids[-1]
+    benchmark(micro_battle.scoped(add_status_effect), target_id, effect_type, effect, 1, 2)
@@ -0,0 +1,284 @@
+"""
+战斗引擎基准（pytest-benchmark）
+
+在机器人数据库的副本中为 2、10、50、200 名参战角色各搭一场战斗，友方敌方各半，
+每名角色带两种状态效果（烧伤、破裂、护盾、硬血、黑夜领域、削弱光环轮流分配），
+对伤害公式、伤害计算、状态效果、AOE 结算、回合结算和状态显示计时：
+
+    pip install pytest-benchmark
+    pytest benchmarks                                         # 只运行
+    pytest benchmarks --bench-db src/data/dewbot.db           # 指定源数据库（默认为机器人使用的数据库）
+    pytest benchmarks --benchmark-save=baseline               # 保存基线到 benchmarks/baselines
+    pytest benchmarks --benchmark-compare                     # 与最近一次基线比较
+
+与基线比较时，未指定 --benchmark-compare-fail 则使用 REGRESSION_THRESHOLD，
+中位数变慢超过阈值的基准判为失败（部署前检查性能回退）。基线按机器分目录保存，
+换机器后需先在新机器上保存一次基线。
+
+test_ 开头的文件是使用同一个数据库副本的检查（热点查询的执行计划、战斗命令的查询预算、工作单元的提交语义），
+不计时，只需检查时用 --benchmark-disable 运行。
+
+副本中原有的参战角色全部撤出战斗，源数据库不会被修改。
+会修改战斗状态的基准（AOE 结算、回合结算）每轮开始前把战斗恢复到初始状态，恢复不计时。
+"""
+
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from typing import Callable, Dict, List
+
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import database.db_connection as db_connection
+from database.battles import battle_scope, get_or_create_battle
+from database.db_connection import backup_database, get_db_connection
+from database.db_migration import run_migrations
+from database.log_sink import log_sink
+from database.queries import (
+    add_skill_to_character, create_character, reset_all_characters, set_character_battle_status
+)
+from database.query_stats import query_budget
+from database.unit_of_work import unit_of_work
+from character.status_effects import add_status_effect
+
+# 基线保存位置
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+# 与基线比较时默认的回退阈值
+REGRESSION_THRESHOLD = 'median:25%'
+
+# 战斗规模（参战角色数）
+COMBATANT_COUNTS = (2, 10, 50, 200)
+
+# 角色生命值（足够大时基准中不会有角色倒下）
+COMBATANT_HEALTH = 100000
+
+# 状态效果组合 (效果类型, 效果名, 强度, 持续回合)
+EFFECT_MIX = (
+    ('debuff', 'burn', 3, 3),
+    ('debuff', 'rupture', 2, 3),
+    ('buff', 'shield', 10, 3),
+    ('hardblood', 'hardblood', 6, 999),
+    ('buff', 'dark_domain', 1, 3),
+    ('special', 'weaken_aura', 1, 3),
+)
+
+# 基准使用的技能 (名称, 冷却, 伤害公式, 效果, 伤害类型, 技能类别)
+BENCH_SKILLS = {
+    'strike': ('基准·重击', 0, '2d6+3', '{}', 'physical', 'damage'),
+    'fireball': ('基准·火球', 0, '5+2d3+1d6',
+                 '{"status": [{"effect": "burn", "value": 3, "turns": 2, "target": "skill_target"}]}',
+                 'magic', 'damage'),
+    'sweep': ('基准·横扫', 0, '2d6',
+              '{"status": [{"effect": "rupture", "value": 2, "turns": 3, "target": "all_enemies"}]}',
+              'physical', 'aoe_damage'),
+}
+
+
+def pytest_addoption(parser):
+    parser.addoption('--bench-db', default=None, help="源数据库路径（默认使用机器人数据库，只读取副本）")
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    """默认把基线保存在 benchmarks/baselines，并给基线比较加上回退阈值"""
+    if not hasattr(config.option, 'benchmark_storage'):
+        return
+    if config.option.benchmark_storage == 'file://./.benchmarks':
+        config.option.benchmark_storage = 'file://' + BASELINE_DIR
+    if config.option.benchmark_compare and not config.option.benchmark_compare_fail:
+        from pytest_benchmark.utils import parse_compare_fail
+        config.option.benchmark_compare_fail = [parse_compare_fail(REGRESSION_THRESHOLD)]
+
+
+class FixtureBattle:
+    """一场基准用的战斗：参战角色、技能，以及把战斗恢复到初始状态的快照"""
+
+    def __init__(self, battle_id: int, friendly_ids: List[int], enemy_ids: List[int], skill_ids: Dict[str, int]):
+        self.battle_id = battle_id
+        self.friendly_ids = friendly_ids
+        self.enemy_ids = enemy_ids
+        self.skill_ids = skill_ids
+        self._characters = []
+        self._character_columns = []
+        self._status_effects = []
+        self._emotion_effects = []
+
+    @property
+    def size(self) -> int:
+        return len(self.friendly_ids) + len(self.enemy_ids)
+
+    def scoped(self, func: Callable) -> Callable:
+        """在本场战斗的范围内执行 func 的包装"""
+        def run(*args, **kwargs):
+            with battle_scope(self.battle_id):
+                return func(*args, **kwargs)
+        return run
+
+    def snapshot(self):
+        """记录参战角色、状态效果和情感效果的当前状态"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("SELECT * FROM characters WHERE battle_id = ?", (self.battle_id,))
+            self._character_columns = [column[0] for column in cursor.description if column[0] != 'id']
+            self._characters = [dict(row) for row in cursor.fetchall()]
+            cursor.execute(
+                """SELECT character_id, effect_type, effect_name, intensity, duration FROM character_status_effects
+                   WHERE character_id IN (SELECT id FROM characters WHERE battle_id = ?)""",
+                (self.battle_id,)
+            )
+            self._status_effects = [tuple(row) for row in cursor.fetchall()]
+            cursor.execute(
+                """SELECT character_id, effect_type, effect_name, intensity FROM character_emotion_effects
+                   WHERE character_id IN (SELECT id FROM characters WHERE battle_id = ?)""",
+                (self.battle_id,)
+            )
+            self._emotion_effects = [tuple(row) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    def restore(self):
+        """把战斗恢复到快照时的状态（基准每轮开始前调用，不计时）"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        try:
+            assignments = ", ".join(f"{column} = ?" for column in self._character_columns)
+            cursor.executemany(
+                f"UPDATE characters SET {assignments} WHERE id = ?",
+                [tuple(row[column] for column in self._character_columns) + (row['id'],) for row in self._characters]
+            )
+            ids = [row['id'] for row in self._characters]
+            placeholders = ",".join("?" * len(ids))
+            cursor.execute(f"DELETE FROM character_status_effects WHERE character_id IN ({placeholders})", ids)
+            cursor.executemany(
+                """INSERT INTO character_status_effects (character_id, effect_type, effect_name, intensity, duration)
+                   VALUES (?, ?, ?, ?, ?)""",
+                self._status_effects
+            )
+            cursor.execute(f"DELETE FROM character_emotion_effects WHERE character_id IN ({placeholders})", ids)
+            cursor.executemany(
+                """INSERT INTO character_emotion_effects (character_id, effect_type, effect_name, intensity)
+                   VALUES (?, ?, ?, ?)""",
+                self._emotion_effects
+            )
+            cursor.execute("UPDATE battles SET current_turn = 0, turn_in_progress = 0 WHERE id = ?", (self.battle_id,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+
+def _insert_skills() -> Dict[str, int]:
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        skill_ids = {}
+        for key, (name, cooldown, formula, effects, damage_type, category) in BENCH_SKILLS.items():
+            cursor.execute(
+                """INSERT INTO skills (name, description, cooldown, damage_formula, effects, damage_type, skill_category)
+                   VALUES (?, '基准技能', ?, ?, ?, ?, ?)""",
+                (name, cooldown, formula, effects, damage_type, category)
+            )
+            skill_ids[key] = cursor.lastrowid
+        conn.commit()
+        return skill_ids
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def build_battle(size: int, skill_ids: Dict[str, int]) -> FixtureBattle:
+    """创建一场有 size 名参战角色的战斗（友方敌方各半），每名角色带两种状态效果"""
+    battle_id = get_or_create_battle(-3000000 - size)
+    friendly_ids, enemy_ids = [], []
+    with battle_scope(battle_id):
+        with unit_of_work():
+            for index in range(size):
+                character_type = 'friendly' if index % 2 == 0 else 'enemy'
+                character_id = create_character(f"基准{size}-{index}", character_type, health=COMBATANT_HEALTH,
+                                                attack=12, defense=6, actions_per_turn=2)
+                for skill_id in skill_ids.values():
+                    add_skill_to_character(character_id, skill_id)
+                set_character_battle_status(character_id, True)
+                for offset in (0, 3):
+                    add_status_effect(character_id, *EFFECT_MIX[(index + offset) % len(EFFECT_MIX)])
+                (friendly_ids if character_type == 'friendly' else enemy_ids).append(character_id)
+
+    battle = FixtureBattle(battle_id, friendly_ids, enemy_ids, skill_ids)
+    battle.snapshot()
+    return battle
+
+
+@pytest.fixture(scope='session')
+def bench_db(pytestconfig):
+    """迁移源数据库的副本并撤出原有的参战角色，基准结束后删除副本"""
+    source_db = pytestconfig.getoption('bench_db') or db_connection.DB_PATH
+    if not os.path.exists(source_db):
+        pytest.exit(f"数据库不存在: {source_db}（用 --bench-db 指定）", returncode=4)
+
+    logging.disable(logging.WARNING)
+    original_db_path = db_connection.DB_PATH
+    work_dir = tempfile.mkdtemp(prefix='dewbot-bench-')
+    try:
+        db_connection.configure(backup_database(source_db, os.path.join(work_dir, 'bench.db')))
+        run_migrations()
+        reset_all_characters()
+        yield _insert_skills()
+    finally:
+        # 基准产生的日志写入副本，不能留到进程退出时写进机器人数据库
+        log_sink.flush()
+        db_connection.configure(original_db_path)
+        shutil.rmtree(work_dir, ignore_errors=True)
+        logging.disable(logging.NOTSET)
+
+
+@pytest.fixture(scope='session')
+def battle_factory(bench_db):
+    """按规模创建（并缓存）基准战斗"""
+    battles: Dict[int, FixtureBattle] = {}
+
+    def get(size: int) -> FixtureBattle:
+        if size not in battles:
+            battles[size] = build_battle(size, bench_db)
+        return battles[size]
+
+    return get
+
+
+@pytest.fixture
+def within_budget():
+    """
+    断言战斗命令执行的查询条数不超过预算（事务控制语句不计），返回命令的结果
+
+    与战斗执行者相同，命令在战斗范围内的一个工作单元中执行：
+
+        within_budget(battle, 8, perform_attack, attacker_id, target_id, skill_id)
+    """
+    def run(battle: FixtureBattle, max_statements: int, func: Callable, *args, **kwargs):
+        with battle_scope(battle.battle_id):
+            with query_budget(max_statements, func.__name__):
+                with unit_of_work():
+                    return func(*args, **kwargs)
+    return run
+
+
+@pytest.fixture(params=COMBATANT_COUNTS, ids=lambda size: f"{size}_combatants")
+def battle(request, battle_factory) -> FixtureBattle:
+    """各种规模的战斗（恢复到初始状态）"""
+    fixture_battle = battle_factory(request.param)
+    fixture_battle.restore()
+    return fixture_battle
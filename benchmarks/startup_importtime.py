@@ -0,0 +1,167 @@
+"""
+启动耗时基准（基于 python -X importtime）
+
+分别在新的解释器中导入战斗引擎模块和 Telegram 处理函数模块，统计导入耗时和最慢的模块；
+再测量「首个更新可处理」的时间：解释器启动 + 导入 + 数据库迁移（快速路径）+ 第一次引擎调用。
+每项都在独立的子进程中测量，互不影响模块缓存。
+
+    python benchmarks/startup_importtime.py --db src/data/dewbot.db
+
+数据库只使用副本。未安装 python-telegram-bot 时处理函数模块标记为跳过，引擎部分照常测量。
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Sequence
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+# 不依赖 telegram 的战斗引擎
+ENGINE_MODULES = (
+    'game.actions',
+    'game.turn_manager',
+    'game.damage_distribution',
+    'skill.skill_effects',
+)
+
+# main.py 启动时导入的处理函数模块
+HANDLER_MODULES = (
+    'character.character_management',
+    'character.race_management',
+    'character.persona_management',
+    'skill.skill_management',
+    'game.attack',
+)
+
+# import time:     self [us] |   cumulative | imported package
+_IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+# 首个更新：迁移走 user_version 快速路径后，在一场空战斗的范围内完成第一次查询和技能注册表创建
+_FIRST_UPDATE_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+from database import db_connection
+db_connection.configure(sys.argv[1])
+from database.db_migration import run_migrations
+from database.battles import NO_BATTLE, battle_scope
+from database.queries import get_characters_by_type
+from game.turn_manager import turn_manager
+imported = time.perf_counter()
+run_migrations()
+migrated = time.perf_counter()
+with battle_scope(NO_BATTLE):
+    get_characters_by_type('enemy', in_battle=True)
+    turn_manager.get_current_turn()
+from skill.skill_effects import get_skill_registry
+get_skill_registry()
+engine_ready = time.perf_counter()
+print(json.dumps({
+    'import': imported - started,
+    'migrations': migrated - imported,
+    'first_call': engine_ready - migrated,
+}))
+"""
+
+
+def _run_python(args: Sequence[str]) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], cwd=SRC_DIR, capture_output=True, text=True)
+
+
+def measure_imports(modules: Sequence[str]) -> Dict:
+    """
+    在新的解释器中导入模块并解析 -X importtime 的输出
+
+    Returns:
+        {'ok': 是否导入成功, 'error': 失败原因, 'total_ms': 导入总耗时,
+         'slowest': [(模块, 自身耗时ms, 累计耗时ms), ...]}
+    """
+    result = _run_python(['-X', 'importtime', '-c', 'import ' + ', '.join(modules)])
+    if result.returncode != 0:
+        missing = re.search(r"No module named '([^']+)'", result.stderr)
+        error = f"缺少依赖: {missing.group(1)}" if missing else result.stderr.strip().splitlines()[-1]
+        return {'ok': False, 'error': error, 'total_ms': 0.0, 'slowest': []}
+
+    entries = []
+    total_us = 0
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = int(match.group(1)), int(match.group(2)), match.group(3), match.group(4)
+        entries.append((name, self_us / 1000, cumulative_us / 1000))
+        if len(indent) == 1:
+            # 顶层导入（缩进一格）的累计耗时之和即为总耗时
+            total_us += cumulative_us
+
+    entries.sort(key=lambda entry: entry[1], reverse=True)
+    return {'ok': True, 'error': None, 'total_ms': total_us / 1000, 'slowest': entries}
+
+
+def measure_first_update(db_path: str) -> Dict[str, float]:
+    """测量一次「首个更新可处理」的时间（毫秒），数据库需已迁移到最新版本"""
+    started = time.perf_counter()
+    result = _run_python(['-c', _FIRST_UPDATE_SCRIPT, db_path])
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    phases = json.loads(result.stdout.strip().splitlines()[-1])
+    phases = {phase: seconds * 1000 for phase, seconds in phases.items()}
+    phases['wall'] = wall * 1000
+    return phases
+
+
+def _format_imports(title: str, measurement: Dict, top: int) -> List[str]:
+    if not measurement['ok']:
+        return [f"{title}: 跳过（{measurement['error']}）"]
+    lines = [f"{title}: {measurement['total_ms']:.1f}ms"]
+    for name, self_ms, cumulative_ms in measurement['slowest'][:top]:
+        lines.append(f"    {name:<48} 自身 {self_ms:>7.1f}ms  累计 {cumulative_ms:>7.1f}ms")
+    return lines
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="启动耗时基准（-X importtime）")
+    parser.add_argument('--db', default=os.path.join(SRC_DIR, 'data', 'dewbot.db'),
+                        help="数据库路径（只使用副本）")
+    parser.add_argument('--runs', type=int, default=5, help="首个更新的测量次数（取中位数）")
+    parser.add_argument('--top', type=int, default=10, help="列出最慢的模块数")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        parser.error(f"数据库不存在: {args.db}")
+
+    lines = []
+    lines.extend(_format_imports("战斗引擎导入", measure_imports(ENGINE_MODULES), args.top))
+    lines.extend(_format_imports("处理函数导入", measure_imports(HANDLER_MODULES), args.top))
+
+    work_dir = tempfile.mkdtemp(prefix='dewbot_startup_')
+    try:
+        db_copy = os.path.join(work_dir, 'dewbot.db')
+        shutil.copyfile(args.db, db_copy)
+
+        # 第一次运行完成迁移（慢速路径），不计入结果
+        cold = measure_first_update(db_copy)
+        runs = [measure_first_update(db_copy) for _ in range(max(args.runs, 1))]
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    lines.append(f"首个更新可处理（中位数，{len(runs)} 次）:")
+    for phase, label in (('import', '导入'), ('migrations', '迁移检查'),
+                         ('first_call', '首次引擎调用'), ('wall', '总计（含解释器启动）')):
+        lines.append(f"    {label:<20} {statistics.median(run[phase] for run in runs):>8.1f}ms")
+    lines.append(f"    首次运行（执行迁移）   {cold['wall']:>8.1f}ms")
+
+    print("\n".join(lines))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,50 @@
+"""
+战斗命令的查询预算
+
+在各种规模的战斗中执行攻击和回合结算，查询条数（不含事务控制语句）超出预算时测试失败：
+单体攻击的预算与战斗规模无关，AOE 和回合结算按参战角色数线性增长，出现 N+1 查询时会超出。
+
+    pytest benchmarks -k query_budget --benchmark-disable --bench-db src/data/dewbot.db
+"""
+
+from game.actions import perform_attack
+from game.turn_manager import turn_manager
+
+# 单体攻击（无附加状态）：攻击者、目标、技能各读一次，状态效果、生命值、冷却各写一次
+SINGLE_TARGET_BUDGET = 8
+
+# 附加一个新状态效果的单体攻击（多一次插入和读取新行ID）
+STATUS_SKILL_BUDGET = 10
+
+# AOE 攻击：固定部分 + 每名敌人的生命值和状态效果写入
+AOE_BASE_BUDGET = 8
+AOE_PER_ENEMY_BUDGET = 3
+
+# 回合结算：固定部分 + 每名参战角色的状态效果、生命值和行动次数写入
+END_TURN_BASE_BUDGET = 4
+END_TURN_PER_COMBATANT_BUDGET = 5
+
+
+def test_query_budget_single_target_attack(battle, within_budget):
+    message = within_budget(battle, SINGLE_TARGET_BUDGET, perform_attack,
+                            battle.friendly_ids[0], battle.enemy_ids[0], battle.skill_ids['strike'])
+    assert '攻击失败' not in message
+
+
+def test_query_budget_status_skill_attack(battle, within_budget):
+    message = within_budget(battle, STATUS_SKILL_BUDGET, perform_attack,
+                            battle.friendly_ids[0], battle.enemy_ids[0], battle.skill_ids['fireball'])
+    assert '攻击失败' not in message
+
+
+def test_query_budget_aoe_attack(battle, within_budget):
+    budget = AOE_BASE_BUDGET + AOE_PER_ENEMY_BUDGET * len(battle.enemy_ids)
+    message = within_budget(battle, budget, perform_attack,
+                            battle.friendly_ids[0], battle.enemy_ids[0], battle.skill_ids['sweep'])
+    assert '攻击失败' not in message
+
+
+def test_query_budget_end_turn(battle, within_budget):
+    budget = END_TURN_BASE_BUDGET + END_TURN_PER_COMBATANT_BUDGET * battle.size
+    _, turn_messages = within_budget(battle, budget, turn_manager.end_turn)
+    assert turn_messages
@@ -0,0 +1,96 @@
+"""
+热点查询执行计划检查
+
+在迁移后的数据库副本上查看各热点查询的 EXPLAIN QUERY PLAN，
+出现全表扫描（索引被删除、迁移漏掉索引、查询改写后用不上索引）时测试失败：
+
+    pytest benchmarks -k query_plan --bench-db src/data/dewbot.db
+"""
+
+import re
+import sqlite3
+from typing import List, Sequence
+
+import pytest
+
+import database.db_connection as db_connection
+from database.battle_state import _LOAD_SQL
+from database.db_migration import BATTLE_SESSION_INDEXES, BATTLE_TURN_INDEXES, HOT_QUERY_INDEXES
+
+# 热点查询 (说明, SQL, 参数)
+HOT_QUERIES = [
+    ("参战角色", "SELECT * FROM characters WHERE in_battle = 1", ()),
+    ("战斗快照加载", _LOAD_SQL.format(where="c.in_battle = 1"), ()),
+    ("按阵营查询参战角色", "SELECT * FROM characters WHERE character_type = ? AND in_battle = 1", ('enemy',)),
+    ("本场战斗角色", "SELECT * FROM characters WHERE battle_id = ?", (1,)),
+    ("本场战斗快照加载", _LOAD_SQL.format(where="c.battle_id = ?"), (1,)),
+    ("按阵营查询本场战斗角色", "SELECT * FROM characters WHERE character_type = ? AND battle_id = ?", ('enemy', 1)),
+    ("聊天进行中的战斗", "SELECT id FROM battles WHERE chat_id = ? AND status = 'active'", (1,)),
+    ("中断的回合结算",
+     "SELECT id, chat_id, turn_in_progress FROM battles WHERE turn_in_progress > 0 AND status = 'active' ORDER BY id",
+     ()),
+    ("按阵营查询角色", "SELECT * FROM characters WHERE character_type = ?", ('friendly',)),
+    ("按名称查询角色", "SELECT * FROM characters WHERE name = ?", ('name',)),
+    ("按名称和阵营查询角色", "SELECT * FROM characters WHERE name = ? AND character_type = ?", ('name', 'enemy')),
+    ("角色状态效果",
+     "SELECT effect_type, effect_name, intensity, duration FROM character_status_effects WHERE character_id = ? ORDER BY id",
+     (1,)),
+    ("角色指定状态效果",
+     "SELECT intensity, duration FROM character_status_effects WHERE character_id = ? AND effect_name = ?",
+     (1, 'haste')),
+    ("角色技能",
+     "SELECT s.* FROM skills s JOIN character_skills cs ON s.id = cs.skill_id WHERE cs.character_id = ?",
+     (1,)),
+    ("技能可用性",
+     """SELECT s.*, c.status, c.emotion_level FROM character_skills cs
+        JOIN skills s ON s.id = cs.skill_id JOIN characters c ON c.id = cs.character_id
+        WHERE cs.character_id = ? ORDER BY cs.skill_id""",
+     (1,)),
+    ("战斗日志",
+     """SELECT bl.id, bl.damage, bl.timestamp FROM battle_logs bl
+        WHERE bl.attacker_id = ? OR bl.defender_id = ?
+        ORDER BY bl.timestamp DESC LIMIT ?""",
+     (1, 1, 10)),
+    ("情感硬币日志",
+     "SELECT * FROM emotion_coin_log WHERE character_id = ? ORDER BY created_at DESC LIMIT 10",
+     (1,)),
+]
+
+# 不带索引的全表扫描，如 "SCAN characters"、"SCAN bl"
+_FULL_SCAN = re.compile(r'^SCAN \w+$')
+
+
+def explain(conn: sqlite3.Connection, sql: str, params: Sequence = ()) -> List[str]:
+    """返回查询计划的各行说明"""
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def has_full_scan(plan: Sequence[str]) -> bool:
+    """查询计划中是否有全表扫描"""
+    return any(_FULL_SCAN.match(detail.strip()) for detail in plan)
+
+
+@pytest.fixture(scope='module')
+def plan_conn(bench_db):
+    """迁移后的数据库副本的连接（不缓存语句，删除索引后 EXPLAIN 才会重新生成计划）"""
+    conn = sqlite3.connect(db_connection.DB_PATH, cached_statements=0)
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize('label, sql, params', HOT_QUERIES, ids=[label for label, _, _ in HOT_QUERIES])
+def test_hot_query_uses_index(plan_conn, label, sql, params):
+    plan = explain(plan_conn, sql, params)
+    assert not has_full_scan(plan), f"{label} 为全表扫描: {' | '.join(plan)}"
+
+
+def test_full_scan_detected_without_indexes(plan_conn):
+    """删除热点索引后应能查出全表扫描（确认上面的检查不是空检查），检查完回滚"""
+    plan_conn.execute("BEGIN")
+    try:
+        for name, _ in HOT_QUERY_INDEXES + BATTLE_SESSION_INDEXES + BATTLE_TURN_INDEXES:
+            plan_conn.execute(f"DROP INDEX IF EXISTS {name}")
+        scanning = [label for label, sql, params in HOT_QUERIES if has_full_scan(explain(plan_conn, sql, params))]
+    finally:
+        plan_conn.rollback()
+    assert scanning
@@ -0,0 +1,100 @@
+"""
+工作单元中的提交语义
+
+借用者 commit() 后的修改必须保留：外层借用者只查询、不提交就归还（先查询、再调用写入函数的常见写法）
+时也不能回滚它们；嵌套的工作单元仍然整体成功或整体回滚。
+
+    pytest benchmarks -k transactions --benchmark-disable --bench-db src/data/dewbot.db
+"""
+
+import pytest
+
+from database.battles import battle_scope
+from database.db_connection import get_db_connection
+from database.queries import get_character, update_character_health
+from database.unit_of_work import unit_of_work
+from game.turn_manager import turn_manager
+
+
+@pytest.fixture
+def small_battle(battle_factory):
+    """两名参战角色的战斗（测试前后都恢复到初始状态）"""
+    battle = battle_factory(2)
+    battle.restore()
+    yield battle
+    battle.restore()
+
+
+def test_nested_commit_survives_uncommitted_outer_borrow(small_battle):
+    character_id = small_battle.friendly_ids[0]
+    with battle_scope(small_battle.battle_id):
+        with unit_of_work():
+            conn = get_db_connection()
+            try:
+                conn.execute("SELECT health FROM characters WHERE id = ?", (character_id,)).fetchone()
+                update_character_health(character_id, 1234)
+            finally:
+                conn.close()
+        assert get_character(character_id)['health'] == 1234
+
+
+def test_nested_commit_survives_outer_rollback(small_battle):
+    character_id = small_battle.friendly_ids[0]
+    with battle_scope(small_battle.battle_id):
+        with unit_of_work():
+            conn = get_db_connection()
+            try:
+                update_character_health(character_id, 1234)
+                conn.rollback()
+            finally:
+                conn.close()
+        assert get_character(character_id)['health'] == 1234
+
+
+def test_uncommitted_borrow_is_rolled_back(small_battle):
+    character_id = small_battle.friendly_ids[0]
+    original_health = get_character(character_id)['health']
+    with battle_scope(small_battle.battle_id):
+        with unit_of_work():
+            conn = get_db_connection()
+            try:
+                conn.execute("UPDATE characters SET health = 1 WHERE id = ?", (character_id,))
+            finally:
+                conn.close()
+        assert get_character(character_id)['health'] == original_health
+
+
+def test_failed_nested_unit_of_work_is_rolled_back(small_battle):
+    character_id = small_battle.friendly_ids[0]
+    original_health = get_character(character_id)['health']
+    with battle_scope(small_battle.battle_id):
+        with unit_of_work():
+            with pytest.raises(RuntimeError):
+                with unit_of_work():
+                    update_character_health(character_id, 777)
+                    raise RuntimeError("结算失败")
+            update_character_health(small_battle.enemy_ids[0], 4321)
+        assert get_character(character_id)['health'] == original_health
+        assert get_character(small_battle.enemy_ids[0])['health'] == 4321
+
+
+def test_emotion_upgrade_persists_after_end_turn(small_battle):
+    """回合开始的情感升级先查询待升级角色、再逐个写入，升级结果必须保存"""
+    character_id = small_battle.friendly_ids[0]
+    conn = get_db_connection()
+    try:
+        conn.execute("UPDATE characters SET pending_emotion_upgrade = 1, positive_emotion_coins = 3 WHERE id = ?",
+                     (character_id,))
+        conn.commit()
+    finally:
+        conn.close()
+    original_level = get_character(character_id)['emotion_level']
+
+    with battle_scope(small_battle.battle_id):
+        with unit_of_work():
+            emotion_messages, _ = turn_manager.end_turn()
+
+    assert emotion_messages
+    character = get_character(character_id)
+    assert character['emotion_level'] == original_level + 1
+    assert character['pending_emotion_upgrade'] == 0
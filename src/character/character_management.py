@@ -18,8 +18,7 @@ from database.queries import (
     reset_character,
     update_character_status,
     set_character_battle_status,
-    reset_all_characters,
-    remove_all_from_battle
+    reset_all_characters
 )
 from character.status_formatter import format_character_status, format_character_list, format_battle_participants
 from character.persona import (
@@ -32,6 +31,8 @@ from character.persona import (
     get_current_persona
 )
 from game.turn_manager import turn_manager
+from game.battle_actor import battle_actors, battle_key_for
+from game.actions import set_battle_status_many, end_current_battle
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -208,15 +209,11 @@ async def battle_join(update: Update, context: CallbackContext) -> None:
                 await update.message.reply_text(f"没有未参战的{type_name}角色。")
                 return
             
-            success_count = 0
-            failed_characters = []
-            
-            for character in characters:
-                if character['health'] > 0:  # 只有活着的角色才能加入战斗
-                    if set_character_battle_status(character['id'], True):
-                        success_count += 1
-                    else:
-                        failed_characters.append(character['name'])
+            alive_characters = [character for character in characters if character['health'] > 0]  # 只有活着的角色才能加入战斗
+            results = await battle_actors.submit(battle_key_for(update), 'join', set_battle_status_many,
+                                                 [character['id'] for character in alive_characters], True)
+            success_count = sum(results)
+            failed_characters = [character['name'] for character, ok in zip(alive_characters, results) if not ok]
             
             type_name = "友方" if character_type == "friendly" else "敌方"
             result_message = f"批量加入战斗完成！\n\n✅ 成功加入 {success_count} 个{type_name}角色"
@@ -236,15 +233,11 @@ async def battle_join(update: Update, context: CallbackContext) -> None:
                 await update.message.reply_text("没有未参战的角色。")
                 return
             
-            success_count = 0
-            failed_characters = []
-            
-            for character in all_chars:
-                if character['health'] > 0:  # 只有活着的角色才能加入战斗
-                    if set_character_battle_status(character['id'], True):
-                        success_count += 1
-                    else:
-                        failed_characters.append(character['name'])
+            alive_characters = [character for character in all_chars if character['health'] > 0]  # 只有活着的角色才能加入战斗
+            results = await battle_actors.submit(battle_key_for(update), 'join', set_battle_status_many,
+                                                 [character['id'] for character in alive_characters], True)
+            success_count = sum(results)
+            failed_characters = [character['name'] for character, ok in zip(alive_characters, results) if not ok]
             
             result_message = f"批量加入战斗完成！\n\n✅ 成功加入 {success_count} 个角色"
             
@@ -260,6 +253,7 @@ async def battle_join(update: Update, context: CallbackContext) -> None:
         failed_characters = []
         not_found_characters = []
         dead_characters = []
+        joining_characters = []
         
         for character_name in args:
             # 查找角色
@@ -273,7 +267,12 @@ async def battle_join(update: Update, context: CallbackContext) -> None:
                 dead_characters.append(character['name'])
                 continue
                 
-            if set_character_battle_status(character['id'], True):
+            joining_characters.append(character)
+        
+        results = await battle_actors.submit(battle_key_for(update), 'join', set_battle_status_many,
+                                             [character['id'] for character in joining_characters], True)
+        for character, ok in zip(joining_characters, results):
+            if ok:
                 success_characters.append(character['name'])
             else:
                 failed_characters.append(character['name'])
@@ -316,7 +315,7 @@ async def battle_join(update: Update, context: CallbackContext) -> None:
         await update.message.reply_text(f"角色 '{character['name']}' 已经无法战斗（生命值为0）。")
         return
     
-    if set_character_battle_status(character['id'], True):
+    if await battle_actors.submit(battle_key_for(update), 'join', set_character_battle_status, character['id'], True):
         await update.message.reply_text(f"角色 '{character['name']}' 已加入战斗！")
     else:
         await update.message.reply_text("将角色加入战斗时出错，请稍后再试。")
@@ -343,7 +342,7 @@ async def battle_leave(update: Update, context: CallbackContext) -> None:
         await update.message.reply_text("找不到该角色。请检查ID或名称是否正确。")
         return
     
-    if set_character_battle_status(character['id'], False):
+    if await battle_actors.submit(battle_key_for(update), 'leave', set_character_battle_status, character['id'], False):
         await update.message.reply_text(f"角色 '{character['name']}' 已撤出战斗！")
     else:
         await update.message.reply_text("将角色撤出战斗时出错，请稍后再试。")
@@ -470,7 +469,7 @@ async def reset_all_characters_command(update: Update, context: CallbackContext)
 
 async def remove_all_from_battle_command(update: Update, context: CallbackContext) -> None:
     """将所有角色移出战斗命令"""
-    count = remove_all_from_battle()
+    count = await battle_actors.submit(battle_key_for(update), 'end_battle', end_current_battle)
     if count > 0:
         await update.message.reply_text(f"✅ 已将所有角色移出战斗。")
     else:
@@ -478,7 +477,7 @@ async def remove_all_from_battle_command(update: Update, context: CallbackContex
 
 async def show_battle_status(update: Update, context: CallbackContext) -> None:
     """显示当前战斗状态"""
-    message = format_battle_participants()
+    message = await battle_actors.read(battle_key_for(update), format_battle_participants)
     await update.message.reply_text(message)
 
 async def show_personas(update: Update, context: CallbackContext) -> None:
@@ -0,0 +1,126 @@
+"""状态效果处理器注册表
+
+按「效果名称 + 触发时机」登记状态效果的处理函数，取代各处理流程中的 if/elif 链：
+
+- on_turn_end:    回合结束（烧伤、中毒、黑夜领域、削弱光环……）
+- on_hit:         受击时修正伤害（守护、易伤、护盾、破裂……）
+- on_action:      行动后（流血……）
+- on_crit_rate:   攻击时累计暴击率（呼吸法……）
+- on_damage_calc: 攻击时修正伤害（强壮、虚弱……）
+
+角色的状态效果加载后先按触发时机分桶，每个流程只遍历与自己相关的效果（保持原有的添加顺序）。
+新效果只需在自己的模块中注册处理函数：
+
+    @effect_registry.register('hardblood', ON_HIT)
+    def _hardblood_on_hit(ctx, effect):
+        ...
+
+处理函数签名为 handler(ctx: EffectContext, effect)，通过修改 ctx.damage / ctx.crit_rate
+和向 ctx.messages 追加消息输出结果。
+"""
+
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+ON_TURN_END = 'on_turn_end'
+ON_HIT = 'on_hit'
+ON_ACTION = 'on_action'
+ON_CRIT_RATE = 'on_crit_rate'
+ON_DAMAGE_CALC = 'on_damage_calc'
+
+TRIGGERS = (ON_TURN_END, ON_HIT, ON_ACTION, ON_CRIT_RATE, ON_DAMAGE_CALC)
+
+EffectHandler = Callable[['EffectContext', object], None]
+
+
+class EffectContext:
+    """一次触发流程中在各处理函数之间传递的状态"""
+
+    __slots__ = ('character', 'damage', 'crit_rate', 'messages')
+
+    def __init__(self, character: Dict, damage: int = 0):
+        self.character = character
+        self.damage = damage
+        self.crit_rate = 0
+        self.messages: List[str] = []
+
+    @property
+    def character_id(self) -> int:
+        return self.character['id']
+
+    @property
+    def character_name(self) -> str:
+        return self.character['name']
+
+
+class EffectHandlerRegistry:
+    """状态效果处理器注册表"""
+
+    def __init__(self):
+        self._handlers: Dict[str, Dict[str, EffectHandler]] = {trigger: {} for trigger in TRIGGERS}
+        self._triggers_by_name: Dict[str, Tuple[str, ...]] = {}
+        self._no_decay: set = set()
+
+    def register(self, effect_name: str, trigger: str, handler: Optional[EffectHandler] = None):
+        """注册处理函数；不传 handler 时作为装饰器使用"""
+        if trigger not in self._handlers:
+            raise ValueError(f"未知的触发时机: {trigger}")
+
+        def decorator(func: EffectHandler) -> EffectHandler:
+            self._handlers[trigger][effect_name] = func
+            triggers = self._triggers_by_name.get(effect_name, ())
+            if trigger not in triggers:
+                self._triggers_by_name[effect_name] = triggers + (trigger,)
+            return func
+
+        if handler is not None:
+            return decorator(handler)
+        return decorator
+
+    def get_handler(self, trigger: str, effect_name: str) -> Optional[EffectHandler]:
+        return self._handlers[trigger].get(effect_name)
+
+    def effect_names(self, *triggers: str) -> FrozenSet[str]:
+        """在指定触发时机有处理函数的效果名称"""
+        names = set()
+        for trigger in triggers:
+            names.update(self._handlers[trigger])
+        return frozenset(names)
+
+    def bucket(self, effects: Iterable, triggers: Optional[Iterable[str]] = None) -> Dict[str, List]:
+        """
+        按触发时机分桶（一次遍历，桶内保持原顺序）
+
+        Args:
+            effects: 状态效果列表（需要有 effect_name 属性）
+            triggers: 只需要的触发时机，默认全部
+        """
+        buckets: Dict[str, List] = {trigger: [] for trigger in (triggers or TRIGGERS)}
+        for effect in effects:
+            for trigger in self._triggers_by_name.get(effect.effect_name, ()):
+                bucket = buckets.get(trigger)
+                if bucket is not None:
+                    bucket.append(effect)
+        return buckets
+
+    def dispatch(self, trigger: str, ctx: EffectContext, effects: Iterable) -> EffectContext:
+        """依次调用桶内各效果的处理函数"""
+        handlers = self._handlers[trigger]
+        for effect in effects:
+            handler = handlers.get(effect.effect_name)
+            if handler is not None:
+                handler(ctx, effect)
+        return ctx
+
+    # ---------- 回合结束衰减 ----------
+
+    def mark_no_decay(self, *effect_names: str):
+        """登记回合结束时不自动减少层数的效果"""
+        self._no_decay.update(effect_names)
+
+    def decays(self, effect_name: str) -> bool:
+        """回合结束时是否自动减少层数"""
+        return effect_name not in self._no_decay
+
+
+# 全局处理器注册表
+effect_registry = EffectHandlerRegistry()
@@ -6,6 +6,9 @@ import logging
 import random
 from typing import Dict, List, Tuple, Optional
 from database.queries import get_character, get_db_connection
+from database.battle_state import current_battle_state, flush_battle_state
+from database.battles import current_battle_id
+from database.log_sink import log_sink
 from character.status_effects import add_status_effect
 
 logger = logging.getLogger(__name__)
@@ -100,22 +103,26 @@ class EmotionSystem:
         cursor = conn.cursor()
         
         try:
-            cursor.execute('''
-                UPDATE characters 
-                SET positive_emotion_coins = ?, 
-                    negative_emotion_coins = ?,
-                    pending_emotion_upgrade = ?
-                WHERE id = ?
-            ''', (new_positive, new_negative, 1 if upgrade_ready else 0, character_id))
-            
-            # 记录硬币获得历史
-            cursor.execute('''
-                INSERT INTO emotion_coin_log (character_id, positive_coins, negative_coins, source, total_after)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (character_id, positive_coins, negative_coins, source, total_coins))
+            state = current_battle_state()
+            if state is not None:
+                state.update_character(character_id,
+                                       positive_emotion_coins=new_positive,
+                                       negative_emotion_coins=new_negative,
+                                       pending_emotion_upgrade=1 if upgrade_ready else 0)
+            else:
+                cursor.execute('''
+                    UPDATE characters 
+                    SET positive_emotion_coins = ?, 
+                        negative_emotion_coins = ?,
+                        pending_emotion_upgrade = ?
+                    WHERE id = ?
+                ''', (new_positive, new_negative, 1 if upgrade_ready else 0, character_id))
             
             conn.commit()
             
+            # 记录硬币获得历史（批量异步写入）
+            log_sink.log('emotion_coin_log', (character_id, positive_coins, negative_coins, source, total_coins))
+            
             result = {
                 'success': True,
                 'coins_added': True,
@@ -149,38 +156,49 @@ class EmotionSystem:
             list: 升级消息列表
         """
         messages = []
+        flush_battle_state()
         conn = get_db_connection()
         cursor = conn.cursor()
         
         try:
-            # 查找所有待升级的角色
-            cursor.execute('''
-                SELECT id, name, emotion_level, positive_emotion_coins, 
-                       negative_emotion_coins, pending_emotion_upgrade
-                FROM characters 
-                WHERE pending_emotion_upgrade = 1
-            ''')
+            # 查找所有待升级的角色（在战斗范围内时只处理本场战斗的角色）
+            battle_id = current_battle_id()
+            if battle_id is None:
+                cursor.execute('''
+                    SELECT id, name, emotion_level, positive_emotion_coins, 
+                           negative_emotion_coins, pending_emotion_upgrade
+                    FROM characters 
+                    WHERE pending_emotion_upgrade = 1
+                ''')
+            else:
+                cursor.execute('''
+                    SELECT id, name, emotion_level, positive_emotion_coins, 
+                           negative_emotion_coins, pending_emotion_upgrade
+                    FROM characters 
+                    WHERE pending_emotion_upgrade = 1 AND battle_id = ?
+                ''', (battle_id,))
             
             pending_characters = cursor.fetchall()
             
-            for char_data in pending_characters:
-                char_id, name, current_level, pos_coins, neg_coins, _ = char_data
-                
-                # 执行升级
-                upgrade_result = cls._execute_emotion_upgrade(
-                    char_id, name, current_level, pos_coins, neg_coins
-                )
-                
-                if upgrade_result['success']:
-                    messages.append(upgrade_result['message'])
-            
-            return messages
-            
         except Exception as e:
             logger.error(f"处理情感升级失败: {e}")
             return [f"处理情感升级时出错: {e}"]
         finally:
+            # 先归还查询连接再逐个升级，升级的提交不会被这次借用的归还回滚
             conn.close()
+        
+        for char_data in pending_characters:
+            char_id, name, current_level, pos_coins, neg_coins, _ = char_data
+            
+            # 执行升级
+            upgrade_result = cls._execute_emotion_upgrade(
+                char_id, name, current_level, pos_coins, neg_coins
+            )
+            
+            if upgrade_result['success']:
+                messages.append(upgrade_result['message'])
+        
+        return messages
 
     @classmethod
     def _execute_emotion_upgrade(cls, character_id: int, name: str, current_level: int, 
@@ -207,14 +225,22 @@ class EmotionSystem:
         
         try:
             # 更新角色等级和清空硬币
-            cursor.execute('''
-                UPDATE characters 
-                SET emotion_level = ?,
-                    positive_emotion_coins = 0,
-                    negative_emotion_coins = 0,
-                    pending_emotion_upgrade = 0
-                WHERE id = ?
-            ''', (new_level, character_id))
+            state = current_battle_state()
+            if state is not None:
+                state.update_character(character_id,
+                                       emotion_level=new_level,
+                                       positive_emotion_coins=0,
+                                       negative_emotion_coins=0,
+                                       pending_emotion_upgrade=0)
+            else:
+                cursor.execute('''
+                    UPDATE characters 
+                    SET emotion_level = ?,
+                        positive_emotion_coins = 0,
+                        negative_emotion_coins = 0,
+                        pending_emotion_upgrade = 0
+                    WHERE id = ?
+                ''', (new_level, character_id))
             
             # 降低所有技能冷却1回合
             cls._reduce_all_skill_cooldowns(character_id)
@@ -303,20 +329,61 @@ class EmotionSystem:
             conn.close()
 
     @classmethod
-    def apply_turn_start_emotion_effects(cls, character_id: int) -> List[str]:
-        """应用回合开始时的情感效果"""
-        messages = []
+    def get_emotion_effects_bulk(cls, character_ids: List[int]) -> Dict[int, List[Tuple[str, str, int]]]:
+        """
+        一次查询获取多个角色的情感效果
+        
+        Returns:
+            dict: 角色ID -> [(effect_type, effect_name, intensity)]
+        """
+        result = {character_id: [] for character_id in character_ids}
+        if not character_ids:
+            return result
+        
         conn = get_db_connection()
         cursor = conn.cursor()
         
         try:
-            cursor.execute('''
-                SELECT effect_type, effect_name, intensity
+            placeholders = ", ".join("?" for _ in character_ids)
+            cursor.execute(f'''
+                SELECT character_id, effect_type, effect_name, intensity
                 FROM character_emotion_effects
-                WHERE character_id = ?
-            ''', (character_id,))
+                WHERE character_id IN ({placeholders})
+                ORDER BY character_id, id
+            ''', tuple(character_ids))
             
-            effects = cursor.fetchall()
+            for character_id, effect_type, effect_name, intensity in cursor.fetchall():
+                result[character_id].append((effect_type, effect_name, intensity))
+            
+            return result
+        except Exception as e:
+            logger.error(f"批量获取情感效果失败: {e}")
+            return result
+        finally:
+            conn.close()
+
+    @classmethod
+    def apply_turn_start_emotion_effects(cls, character_id: int, effects: Optional[List[Tuple[str, str, int]]] = None) -> List[str]:
+        """
+        应用回合开始时的情感效果
+        
+        Args:
+            character_id: 角色ID
+            effects: 预先批量加载的情感效果，为None时从数据库读取
+        """
+        messages = []
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        try:
+            if effects is None:
+                cursor.execute('''
+                    SELECT effect_type, effect_name, intensity
+                    FROM character_emotion_effects
+                    WHERE character_id = ?
+                ''', (character_id,))
+                
+                effects = cursor.fetchall()
             
             for effect_type, effect_name, intensity in effects:
                 if effect_type == 'buff':
@@ -393,9 +460,9 @@ def process_emotion_upgrades() -> List[str]:
     """处理情感升级的便捷函数"""
     return emotion_system.process_turn_start_emotion_upgrades()
 
-def apply_emotion_effects(character_id: int) -> List[str]:
+def apply_emotion_effects(character_id: int, effects: Optional[List[Tuple[str, str, int]]] = None) -> List[str]:
     """应用情感效果的便捷函数"""
-    return emotion_system.apply_turn_start_emotion_effects(character_id)
+    return emotion_system.apply_turn_start_emotion_effects(character_id, effects)
 
 def check_skill_emotion_requirement(character_id: int, skill_info: Dict) -> Tuple[bool, str]:
     """检查技能情感要求的便捷函数"""
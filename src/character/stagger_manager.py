@@ -6,6 +6,7 @@ import logging
 from typing import Dict, List, Tuple, Optional
 from database.db_connection import get_db_connection
 from database.queries import get_character
+from database.battle_state import current_battle_state
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +16,18 @@ class StaggerManager:
     @staticmethod
     def get_character_stagger_info(character_id: int) -> Optional[Dict]:
         """获取角色的混乱值信息"""
+        state = current_battle_state()
+        if state is not None:
+            character = state.peek_character(character_id)
+            if not character:
+                return None
+            return {
+                'stagger_value': character['stagger_value'],
+                'max_stagger_value': character['max_stagger_value'],
+                'stagger_status': character['stagger_status'],
+                'stagger_turns_remaining': character['stagger_turns_remaining']
+            }
+        
         try:
             conn = get_db_connection()
             cursor = conn.cursor()
@@ -39,6 +52,26 @@ class StaggerManager:
         finally:
             conn.close()
     
+    @staticmethod
+    def _update_stagger_columns(character_id: int, **columns) -> bool:
+        """写入角色的混乱值相关字段（有战斗快照时写入快照）"""
+        state = current_battle_state()
+        if state is not None:
+            return state.update_character(character_id, **columns)
+        
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            assignments = ", ".join(f"{column} = ?" for column in columns)
+            cursor.execute(
+                f"UPDATE characters SET {assignments} WHERE id = ?",
+                (*columns.values(), character_id)
+            )
+            conn.commit()
+            return True
+        finally:
+            conn.close()
+    
     @staticmethod
     def reduce_stagger(character_id: int, damage: int) -> Tuple[bool, str, bool]:
         """
@@ -52,9 +85,6 @@ class StaggerManager:
             tuple: (是否成功, 状态信息, 是否进入混乱状态)
         """
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
             # 获取当前状态
             stagger_info = StaggerManager.get_character_stagger_info(character_id)
             if not stagger_info:
@@ -71,21 +101,14 @@ class StaggerManager:
             enters_stagger = (new_stagger == 0 and stagger_info['stagger_value'] > 0)
             
             if enters_stagger:
-                # 进入混乱状态，设置持续时间为2回合
-                cursor.execute("""
-                    UPDATE characters 
-                    SET stagger_value = 0, stagger_status = 'staggered', stagger_turns_remaining = 2
-                    WHERE id = ?
-                """, (character_id,))
-                
-                # 清空当前行动次数
-                cursor.execute("""
-                    UPDATE characters 
-                    SET current_actions = 0
-                    WHERE id = ?
-                """, (character_id,))
-                
-                conn.commit()
+                # 进入混乱状态，设置持续时间为2回合，并清空当前行动次数
+                StaggerManager._update_stagger_columns(
+                    character_id,
+                    stagger_value=0,
+                    stagger_status='staggered',
+                    stagger_turns_remaining=2,
+                    current_actions=0
+                )
                 
                 character = get_character(character_id)
                 char_name = character.get('name', '未知角色') if character else '未知角色'
@@ -93,13 +116,7 @@ class StaggerManager:
                 return True, f"💫 {char_name} 进入混乱状态！", True
             else:
                 # 正常扣除混乱值
-                cursor.execute("""
-                    UPDATE characters 
-                    SET stagger_value = ?
-                    WHERE id = ?
-                """, (new_stagger, character_id))
-                
-                conn.commit()
+                StaggerManager._update_stagger_columns(character_id, stagger_value=new_stagger)
                 
                 character = get_character(character_id)
                 char_name = character.get('name', '未知角色') if character else '未知角色'
@@ -109,8 +126,6 @@ class StaggerManager:
         except Exception as e:
             logger.error(f"扣除混乱值失败: {e}")
             return False, f"扣除混乱值时出错: {str(e)}", False
-        finally:
-            conn.close()
     
     @staticmethod
     def process_stagger_turn(character_id: int) -> Tuple[bool, str]:
@@ -121,9 +136,6 @@ class StaggerManager:
             tuple: (是否成功, 状态信息)
         """
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
             stagger_info = StaggerManager.get_character_stagger_info(character_id)
             if not stagger_info or stagger_info['stagger_status'] != 'staggered':
                 return True, ""  # 不在混乱状态，无需处理
@@ -136,30 +148,25 @@ class StaggerManager:
             
             if remaining_turns <= 0:
                 # 恢复正常状态，回满混乱值
-                cursor.execute("""
-                    UPDATE characters 
-                    SET stagger_value = max_stagger_value, stagger_status = 'normal', stagger_turns_remaining = 0
-                    WHERE id = ?
-                """, (character_id,))
-                
-                conn.commit()
+                StaggerManager._update_stagger_columns(
+                    character_id,
+                    stagger_value=stagger_info['max_stagger_value'],
+                    stagger_status='normal',
+                    stagger_turns_remaining=0
+                )
                 return True, f"✨ {char_name} 从混乱状态中恢复，混乱值已回满！"
             else:
                 # 继续混乱状态，清空行动次数
-                cursor.execute("""
-                    UPDATE characters 
-                    SET stagger_turns_remaining = ?, current_actions = 0
-                    WHERE id = ?
-                """, (remaining_turns, character_id))
-                
-                conn.commit()
+                StaggerManager._update_stagger_columns(
+                    character_id,
+                    stagger_turns_remaining=remaining_turns,
+                    current_actions=0
+                )
                 return True, f"😵‍💫 {char_name} 仍处于混乱状态，行动次数已清零（剩余 {remaining_turns} 回合）"
             
         except Exception as e:
             logger.error(f"处理混乱状态回合失败: {e}")
             return False, f"处理混乱状态时出错: {str(e)}"
-        finally:
-            conn.close()
     
     @staticmethod
     def is_staggered(character_id: int) -> bool:
@@ -178,22 +185,19 @@ class StaggerManager:
     def reset_character_stagger(character_id: int) -> bool:
         """重置角色的混乱状态"""
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                UPDATE characters 
-                SET stagger_value = max_stagger_value, stagger_status = 'normal', stagger_turns_remaining = 0
-                WHERE id = ?
-            """, (character_id,))
+            stagger_info = StaggerManager.get_character_stagger_info(character_id)
+            if not stagger_info:
+                return True
             
-            conn.commit()
-            return True
+            return StaggerManager._update_stagger_columns(
+                character_id,
+                stagger_value=stagger_info['max_stagger_value'],
+                stagger_status='normal',
+                stagger_turns_remaining=0
+            )
         except Exception as e:
             logger.error(f"重置角色混乱状态失败: {e}")
             return False
-        finally:
-            conn.close()
     
     @staticmethod
     def update_persona_stagger(character_id: int, persona_name: str, character_name: str) -> bool:
@@ -214,6 +218,11 @@ class StaggerManager:
                 stagger_value, max_stagger_value = result
                 
                 # 更新角色的混乱值
+                state = current_battle_state()
+                if state is not None:
+                    return state.update_character(character_id, stagger_value=stagger_value,
+                                                  max_stagger_value=max_stagger_value)
+                
                 cursor.execute("""
                     UPDATE characters 
                     SET stagger_value = ?, max_stagger_value = ?
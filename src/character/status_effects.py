@@ -6,20 +6,43 @@
 
 import logging
 import json
+from dataclasses import dataclass
 from typing import Dict, List, Optional, Tuple
 from database.db_connection import get_db_connection
 from database.queries import get_character, update_character_health
+from database.battle_state import current_battle_state
+from game.spans import timed
+from character.effect_handlers import (
+    effect_registry, EffectContext, TRIGGERS,
+    ON_TURN_END, ON_HIT, ON_ACTION, ON_CRIT_RATE, ON_DAMAGE_CALC
+)
 
 logger = logging.getLogger(__name__)
 
+# 添加状态效果的UPSERT（依赖 (character_id, effect_name) 唯一索引），叠加规则：
+# 新增时增加层数为0则层数置为1；已有时强度取最大值，层数叠加（增加0层即只更新强度）
+_UPSERT_STATUS_EFFECT_SQL = """
+    INSERT INTO character_status_effects 
+    (character_id, effect_type, effect_name, intensity, duration)
+    VALUES (:character_id, :effect_type, :effect_name, :intensity,
+            CASE WHEN :duration = 0 THEN 1 ELSE :duration END)
+    ON CONFLICT (character_id, effect_name) DO UPDATE SET
+        intensity = MAX(intensity, excluded.intensity),
+        duration = duration + :duration
+"""
+
+@dataclass(slots=True, eq=False)
 class StatusEffect:
     """状态效果类"""
+    effect_type: str  # buff 或 debuff
+    effect_name: str  # 具体状态名称
+    intensity: int    # 强度
+    duration: int     # 层数/持续回合
     
-    def __init__(self, effect_type: str, effect_name: str, intensity: int, duration: int):
-        self.effect_type = effect_type  # buff 或 debuff
-        self.effect_name = effect_name  # 具体状态名称
-        self.intensity = intensity      # 强度
-        self.duration = duration        # 层数/持续回合
+    @classmethod
+    def from_row(cls, row) -> 'StatusEffect':
+        """从 (effect_type, effect_name, intensity, duration) 行创建"""
+        return cls(row[0], row[1], row[2], row[3])
     
     def to_dict(self) -> Dict:
         return {
@@ -40,6 +63,13 @@ class StatusEffect:
 
 def get_character_status_effects(character_id: int) -> List[StatusEffect]:
     """获取角色的所有状态效果"""
+    state = current_battle_state()
+    if state is not None:
+        return [
+            StatusEffect(effect.effect_type, effect.effect_name, effect.intensity, effect.duration)
+            for effect in state.get_effects(character_id)
+        ]
+    
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -48,24 +78,55 @@ def get_character_status_effects(character_id: int) -> List[StatusEffect]:
             SELECT effect_type, effect_name, intensity, duration
             FROM character_status_effects 
             WHERE character_id = ?
+            ORDER BY id
         """, (character_id,))
         
-        effects = []
-        for row in cursor.fetchall():
-            effects.append(StatusEffect(
-                effect_type=row[0],
-                effect_name=row[1],
-                intensity=row[2],
-                duration=row[3]
-            ))
-        
-        return effects
+        return [StatusEffect.from_row(row) for row in cursor.fetchall()]
     except Exception as e:
         logger.error(f"获取角色状态效果时出错: {e}")
         return []
     finally:
         conn.close()
 
+def get_character_effect_buckets(character_id: int, *triggers: str) -> Dict[str, List[StatusEffect]]:
+    """获取角色的状态效果并按触发时机分桶
+    
+    Args:
+        character_id: 角色ID
+        triggers: 需要的触发时机，默认全部
+    
+    Returns:
+        Dict[str, List[StatusEffect]]: 触发时机 -> 有对应处理函数的效果（保持添加顺序）
+    """
+    triggers = triggers or TRIGGERS
+    state = current_battle_state()
+    if state is not None:
+        return effect_registry.bucket(get_character_status_effects(character_id), triggers)
+    
+    # 只读取在这些触发时机有处理函数的效果
+    names = sorted(effect_registry.effect_names(*triggers))
+    if not names:
+        return {trigger: [] for trigger in triggers}
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute(f"""
+            SELECT effect_type, effect_name, intensity, duration
+            FROM character_status_effects 
+            WHERE character_id = ? AND effect_name IN ({', '.join('?' * len(names))})
+            ORDER BY id
+        """, (character_id, *names))
+        
+        effects = [StatusEffect.from_row(row) for row in cursor.fetchall()]
+        return effect_registry.bucket(effects, triggers)
+    except Exception as e:
+        logger.error(f"获取角色状态效果时出错: {e}")
+        return {trigger: [] for trigger in triggers}
+    finally:
+        conn.close()
+
 def get_hardblood_amount(character_id: int) -> int:
     """获取角色的硬血数量"""
     try:
@@ -95,23 +156,10 @@ def reduce_paralysis_stacks(character_id: int, dice_count: int) -> bool:
                     return True
                 else:
                     # 更新麻痹层数 - 使用effect_name作为条件
-                    conn = get_db_connection()
-                    cursor = conn.cursor()
-                    try:
-                        cursor.execute("""
-                            UPDATE character_status_effects
-                            SET intensity = ?
-                            WHERE character_id = ? AND effect_name = ?
-                        """, (new_intensity, character_id, 'paralysis'))
-                        conn.commit()
+                    if set_status_effect_intensity(character_id, 'paralysis', new_intensity):
                         logger.info(f"角色{character_id}麻痹层数更新为{new_intensity}")
                         return True
-                    except Exception as e:
-                        logger.error(f"更新麻痹层数失败: {e}")
-                        conn.rollback()
-                        return False
-                    finally:
-                        conn.close()
+                    return False
         return False
     except Exception as e:
         logger.error(f"减少麻痹层数失败: {e}")
@@ -157,51 +205,31 @@ def add_status_effect(character_id: int, effect_type: str, effect_name: str,
     叠加规则: 相同状态效果可叠加层数，强度取最大值
     特别地，如果增加效果层数为0，则如果原本没有此效果，将层数置为1，否则只更新强度
     """
+    state = current_battle_state()
+    if state is not None:
+        return _add_status_effect_to_state(state, character_id, effect_type, effect_name, intensity, duration)
+    
     conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
-        # 检查是否已有同名状态效果
-        cursor.execute("""
-            SELECT intensity, duration FROM character_status_effects
-            WHERE character_id = ? AND effect_name = ?
-        """, (character_id, effect_name))
-        
-        existing = cursor.fetchone()
-        
-        # 特殊处理加速效果
+        # 特殊处理加速效果（需要知道是否为新获得，以便立即增加行动次数）
         if effect_name == 'haste':
+            cursor.execute("""
+                SELECT intensity, duration FROM character_status_effects
+                WHERE character_id = ? AND effect_name = ?
+            """, (character_id, effect_name))
+            existing = cursor.fetchone()
             return _handle_haste_effect(character_id, effect_type, intensity, duration, 
                                       immediate_effect, existing, cursor, conn)
         
-        if existing:
-            # 已有同名效果，根据新规则处理
-            old_intensity, old_duration = existing
-            new_intensity = max(old_intensity, intensity)  # 强度取最大值
-            
-            if duration == 0:
-                # 如果增加效果层数为0，只更新强度，不改变层数
-                new_duration = old_duration
-            else:
-                # 层数叠加
-                new_duration = old_duration + duration
-            
-            cursor.execute("""
-                UPDATE character_status_effects
-                SET intensity = ?, duration = ?
-                WHERE character_id = ? AND effect_name = ?
-            """, (new_intensity, new_duration, character_id, effect_name))
-        else:
-            # 新增状态效果
-            if duration == 0:
-                # 如果增加效果层数为0且原本没有此效果，将层数置为1
-                duration = 1
-                
-            cursor.execute("""
-                INSERT INTO character_status_effects 
-                (character_id, effect_type, effect_name, intensity, duration)
-                VALUES (?, ?, ?, ?, ?)
-            """, (character_id, effect_type, effect_name, intensity, duration))
+        cursor.execute(_UPSERT_STATUS_EFFECT_SQL, {
+            'character_id': character_id,
+            'effect_type': effect_type,
+            'effect_name': effect_name,
+            'intensity': intensity,
+            'duration': duration
+        })
         
         conn.commit()
         return True
@@ -212,6 +240,95 @@ def add_status_effect(character_id: int, effect_type: str, effect_name: str,
     finally:
         conn.close()
 
+def add_status_effects_bulk(effects: List[Tuple[int, str, str, int, int]]) -> List[bool]:
+    """批量添加状态效果（AOE技能对多个目标施加状态时使用）
+    
+    Args:
+        effects: [(角色ID, 效果类型, 效果名称, 强度, 持续时间), ...]
+    
+    Returns:
+        List[bool]: 与effects一一对应的添加结果
+    
+    叠加规则与add_status_effect相同；其余效果用同一条UPSERT语句批量执行、统一提交，
+    加速效果仍逐条走add_status_effect以立即增加行动次数（之前累积的行先写入，保持添加顺序）。
+    """
+    state = current_battle_state()
+    if state is not None:
+        return [
+            _add_status_effect_to_state(state, character_id, effect_type, effect_name, intensity, duration)
+            for character_id, effect_type, effect_name, intensity, duration in effects
+        ]
+    
+    results = [False] * len(effects)
+    rows = []
+    row_indexes = []
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        for index, (character_id, effect_type, effect_name, intensity, duration) in enumerate(effects):
+            if effect_name == 'haste':
+                if rows:
+                    cursor.executemany(_UPSERT_STATUS_EFFECT_SQL, rows)
+                    conn.commit()
+                    for row_index in row_indexes:
+                        results[row_index] = True
+                    rows, row_indexes = [], []
+                results[index] = add_status_effect(character_id, effect_type, effect_name, intensity, duration)
+                continue
+            rows.append({
+                'character_id': character_id,
+                'effect_type': effect_type,
+                'effect_name': effect_name,
+                'intensity': intensity,
+                'duration': duration
+            })
+            row_indexes.append(index)
+        
+        if rows:
+            cursor.executemany(_UPSERT_STATUS_EFFECT_SQL, rows)
+        conn.commit()
+        for index in row_indexes:
+            results[index] = True
+    except Exception as e:
+        logger.error(f"批量添加状态效果时出错: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+    
+    return results
+
+def _add_status_effect_to_state(state, character_id: int, effect_type: str, effect_name: str,
+                                intensity: int, duration: int) -> bool:
+    """在战斗快照中添加状态效果（叠加规则与add_status_effect相同）"""
+    existing = None
+    for effect in state.get_effects(character_id):
+        if effect.effect_name == effect_name:
+            existing = effect
+            break
+    
+    is_name = lambda effect: effect.effect_name == effect_name
+    
+    if existing:
+        new_duration = existing.duration if duration == 0 else existing.duration + duration
+        if effect_name == 'haste':
+            # 加速强度始终为1，不叠加
+            state.update_effects(character_id, is_name, duration=new_duration)
+        else:
+            new_intensity = max(existing.intensity, intensity)
+            state.update_effects(character_id, is_name, intensity=new_intensity, duration=new_duration)
+    else:
+        if duration == 0:
+            duration = 1
+        if effect_name == 'haste':
+            state.add_effect(character_id, effect_type, 'haste', 1, duration)
+            # 立即增加行动次数和行动上限
+            _update_haste_actions_immediately(character_id, 1)
+        else:
+            state.add_effect(character_id, effect_type, effect_name, intensity, duration)
+    
+    return True
+
 def _handle_haste_effect(character_id: int, effect_type: str, intensity: int, duration: int,
                         immediate_effect: bool, existing, cursor, conn) -> bool:
     """处理加速效果的特殊逻辑
@@ -270,6 +387,18 @@ def _update_haste_actions_immediately(character_id: int, bonus_actions: int):
     """
     from database.queries import get_character
     
+    state = current_battle_state()
+    if state is not None:
+        character = state.peek_character(character_id)
+        if character:
+            current_actions = character.get('current_actions', 0)
+            actions_per_turn = character.get('actions_per_turn', 1)
+            state.update_character(character_id,
+                                   current_actions=current_actions + bonus_actions,
+                                   actions_per_turn=actions_per_turn + bonus_actions)
+            logger.info(f"角色 {character_id} 获得加速：当前行动 {current_actions} → {current_actions + bonus_actions}, 每回合行动 {actions_per_turn} → {actions_per_turn + bonus_actions}")
+        return
+    
     # 使用独立连接避免数据库锁定
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -308,6 +437,20 @@ def _remove_haste_actions(character_id: int, bonus_actions: int):
     """
     from database.queries import get_character
     
+    state = current_battle_state()
+    if state is not None:
+        character = state.peek_character(character_id)
+        if character:
+            current_actions = character.get('current_actions', 0)
+            new_current_actions = max(0, current_actions - bonus_actions)
+            actions_per_turn = character.get('actions_per_turn', 1)
+            new_actions_per_turn = max(1, actions_per_turn - bonus_actions)
+            state.update_character(character_id,
+                                   current_actions=new_current_actions,
+                                   actions_per_turn=new_actions_per_turn)
+            logger.info(f"角色 {character_id} 失去加速：当前行动 {current_actions} → {new_current_actions}, 每回合行动 {actions_per_turn} → {new_actions_per_turn}")
+        return
+    
     # 使用独立连接避免数据库锁定
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -367,6 +510,11 @@ def add_haste_next_turn(character_id: int, duration: int = 1) -> bool:
 
 def remove_status_effect(character_id: int, effect_name: str) -> bool:
     """移除角色的指定状态效果"""
+    state = current_battle_state()
+    if state is not None:
+        state.remove_effects(character_id, lambda effect: effect.effect_name == effect_name)
+        return True
+    
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -387,6 +535,16 @@ def remove_status_effect(character_id: int, effect_name: str) -> bool:
 
 def update_status_effect_duration(character_id: int, effect_name: str, new_duration: int) -> bool:
     """更新状态效果的持续时间"""
+    state = current_battle_state()
+    if state is not None:
+        is_name = lambda effect: effect.effect_name == effect_name
+        if new_duration <= 0:
+            # 持续时间为0或负数，移除效果
+            state.remove_effects(character_id, is_name)
+        else:
+            state.update_effects(character_id, is_name, duration=new_duration)
+        return True
+    
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -415,6 +573,12 @@ def update_status_effect_duration(character_id: int, effect_name: str, new_durat
 
 def update_status_effect_intensity(character_id: int, effect_type: str, new_intensity: int) -> bool:
     """更新状态效果的强度"""
+    state = current_battle_state()
+    if state is not None:
+        state.update_effects(character_id, lambda effect: effect.effect_type == effect_type,
+                             intensity=new_intensity)
+        return True
+    
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -434,8 +598,40 @@ def update_status_effect_intensity(character_id: int, effect_type: str, new_inte
     finally:
         conn.close()
 
+def set_status_effect_intensity(character_id: int, effect_name: str, new_intensity: int) -> bool:
+    """按效果名称更新状态效果的强度"""
+    state = current_battle_state()
+    if state is not None:
+        state.update_effects(character_id, lambda effect: effect.effect_name == effect_name,
+                             intensity=new_intensity)
+        return True
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute("""
+            UPDATE character_status_effects
+            SET intensity = ?
+            WHERE character_id = ? AND effect_name = ?
+        """, (new_intensity, character_id, effect_name))
+        
+        conn.commit()
+        return True
+    except Exception as e:
+        logger.error(f"更新状态效果强度时出错: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
 def clear_all_status_effects(character_id: int) -> bool:
     """清除角色的所有状态效果"""
+    state = current_battle_state()
+    if state is not None:
+        state.remove_effects(character_id, lambda effect: True)
+        return True
+    
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -471,7 +667,8 @@ def process_end_turn_effects(character_id: int) -> List[str]:
     initial_health = character['health']
     character_knocked_down = False
     
-    for effect in effects:
+    # 只处理有回合结束处理函数的效果
+    for effect in effect_registry.bucket(effects, (ON_TURN_END,))[ON_TURN_END]:
         # 如果角色已经倒下，跳过剩余效果处理
         if character_knocked_down:
             break
@@ -497,7 +694,7 @@ def process_end_turn_effects(character_id: int) -> List[str]:
     if not character_knocked_down:
         for effect in effects:
             # 减少持续时间（除了特殊效果和不会自动衰减的效果）
-            if effect.effect_name not in ['rupture', 'bleeding', 'shield', 'cooldown_reduction', 'paralysis', 'hardblood', 'weaken_aura']:
+            if effect_registry.decays(effect.effect_name):
                 new_duration = effect.duration - 1
                 if new_duration <= 0:
                     # 状态效果即将结束，添加通知
@@ -549,45 +746,52 @@ def process_start_turn_effects(character_id: int) -> List[str]:
 
 def process_single_effect_end_turn(character: Dict, effect: StatusEffect) -> Optional[str]:
     """处理单个状态效果的回合结束效果"""
-    character_id = character['id']
-    character_name = character['name']
-    
-    if effect.effect_name == 'burn':
-        # 烧伤：按强度*1点扣血
-        damage = effect.intensity * 1
-        new_health = max(0, character['health'] - damage)
-        update_character_health(character_id, new_health)
-        return f"🔥 {character_name} 受到烧伤伤害 {damage} 点"
-    
-    elif effect.effect_name == 'poison':
-        # 中毒：按强度*1%当前生命值扣血
-        damage = int(character['health'] * effect.intensity / 100)
-        damage = max(1, damage)  # 至少造成1点伤害
-        new_health = max(0, character['health'] - damage)
-        update_character_health(character_id, new_health)
-        return f"☠️ {character_name} 受到中毒伤害 {damage} 点"
-    
-    elif effect.effect_name == 'haste':
-        # 加速效果在回合开始时处理，这里什么都不做
-        return None
-    
-    elif effect.effect_name == 'dark_domain':
-        # 黑夜领域：回合结束时触发复杂效果
-        return process_dark_domain_end_turn(character_id, character_name, effect.intensity, effect.duration)
-    
-    elif effect.effect_name == 'weaken_aura':
-        # 削弱光环：回合结束时为敌方全体增加虚弱和易伤
-        return process_weaken_aura_end_turn(character_id, character_name, effect.intensity, effect.duration)
-    
-    elif effect.effect_name == 'paralysis':
-        # 麻痹：不会自动衰减，只在受到技能影响时减少层数
+    handler = effect_registry.get_handler(ON_TURN_END, effect.effect_name)
+    if handler is None:
+        # 加速、麻痹、硬血等效果在回合结束时没有额外效果
         return None
     
-    elif effect.effect_name == 'hardblood':
-        # 硬血：不会自动衰减，只能被技能消耗
-        return None
-    
-    return None
+    ctx = EffectContext(character)
+    handler(ctx, effect)
+    return "\n".join(ctx.messages) if ctx.messages else None
+
+# ---------- 回合结束效果 ----------
+
+# 不会在回合结束时自动衰减的效果：
+# 破裂、流血只在受击/行动时减层；护盾被伤害消耗；麻痹只在受到技能影响时减层；硬血只能被技能消耗
+effect_registry.mark_no_decay('rupture', 'bleeding', 'shield', 'cooldown_reduction',
+                              'paralysis', 'hardblood', 'weaken_aura')
+
+@effect_registry.register('burn', ON_TURN_END)
+def _burn_on_turn_end(ctx: EffectContext, effect: StatusEffect):
+    """烧伤：按强度*1点扣血"""
+    damage = effect.intensity * 1
+    new_health = max(0, ctx.character['health'] - damage)
+    update_character_health(ctx.character_id, new_health)
+    ctx.messages.append(f"🔥 {ctx.character_name} 受到烧伤伤害 {damage} 点")
+
+@effect_registry.register('poison', ON_TURN_END)
+def _poison_on_turn_end(ctx: EffectContext, effect: StatusEffect):
+    """中毒：按强度*1%当前生命值扣血"""
+    damage = int(ctx.character['health'] * effect.intensity / 100)
+    damage = max(1, damage)  # 至少造成1点伤害
+    new_health = max(0, ctx.character['health'] - damage)
+    update_character_health(ctx.character_id, new_health)
+    ctx.messages.append(f"☠️ {ctx.character_name} 受到中毒伤害 {damage} 点")
+
+@effect_registry.register('dark_domain', ON_TURN_END)
+def _dark_domain_on_turn_end(ctx: EffectContext, effect: StatusEffect):
+    """黑夜领域：回合结束时触发复杂效果"""
+    message = process_dark_domain_end_turn(ctx.character_id, ctx.character_name, effect.intensity, effect.duration)
+    if message:
+        ctx.messages.append(message)
+
+@effect_registry.register('weaken_aura', ON_TURN_END)
+def _weaken_aura_on_turn_end(ctx: EffectContext, effect: StatusEffect):
+    """削弱光环：回合结束时为敌方全体增加虚弱和易伤"""
+    message = process_weaken_aura_end_turn(ctx.character_id, ctx.character_name, effect.intensity, effect.duration)
+    if message:
+        ctx.messages.append(message)
 
 def process_dark_domain_end_turn(character_id: int, character_name: str, intensity: int, duration: int) -> Optional[str]:
     """处理黑夜领域的回合结束效果"""
@@ -693,6 +897,7 @@ def check_dark_domain_death_immunity(character_id: int, incoming_damage: int) ->
     
     return False, incoming_damage, messages
 
+@timed('process_hit_effects')
 def process_hit_effects(character_id: int, incoming_damage: int) -> Tuple[int, List[str]]:
     """处理受击时的状态效果
     
@@ -708,105 +913,130 @@ def process_hit_effects(character_id: int, incoming_damage: int) -> Tuple[int, L
     if immune:
         return immune_damage, immune_messages
     
-    effects = get_character_status_effects(character_id)
-    messages = []
-    final_damage = incoming_damage
+    effects = get_character_effect_buckets(character_id, ON_HIT)[ON_HIT]
     character = get_character(character_id)
     
     if not character:
-        return final_damage, messages
+        return incoming_damage, []
     
-    character_name = character['name']
-    
-    for effect in effects:
-        if effect.effect_name == 'guard':
-            # 守护：受到最终伤害-(强度*10%)
-            damage_reduction = effect.intensity * 0.1
-            reduced_damage = int(final_damage * damage_reduction)
-            final_damage = max(0, final_damage - reduced_damage)
-            if reduced_damage > 0:
-                percent = int(effect.intensity * 10)
-                messages.append(f"守护减伤: -{percent}%")
-        
-        elif effect.effect_name == 'vulnerable':
-            # 易伤：受到最终伤害+(强度*10%)
-            damage_increase = effect.intensity * 0.1
-            increased_damage = int(final_damage * damage_increase)
-            final_damage += increased_damage
-            if increased_damage > 0:
-                percent = int(effect.intensity * 10)
-                messages.append(f"易伤增伤: +{percent}%")
-        
-        elif effect.effect_name == 'shield':
-            # 护盾：受到最终伤害-护盾强度，伤害结算后护盾强度会减少
-            shield_block = min(final_damage, effect.intensity)
-            final_damage = max(0, final_damage - shield_block)
-            new_shield = effect.intensity - shield_block
-            
-            if shield_block > 0:
-                messages.append(f"🛡️ {character_name} 的护盾抵消了 {shield_block} 点伤害")
-            
-            if new_shield <= 0:
-                remove_status_effect(character_id, 'shield')
-                messages.append(f"💥 {character_name} 的护盾被击破")
-            else:
-                # 更新护盾强度
-                conn = get_db_connection()
-                cursor = conn.cursor()
-                try:
-                    cursor.execute("""
-                        UPDATE character_status_effects
-                        SET intensity = ?
-                        WHERE character_id = ? AND effect_name = 'shield'
-                    """, (new_shield, character_id))
-                    conn.commit()
-                except Exception as e:
-                    logger.error(f"更新护盾强度时出错: {e}")
-                finally:
-                    conn.close()
-        
-        elif effect.effect_name == 'rupture':
-            # 破裂：在受击时按强度*1点扣血，并减少1层数
-            rupture_damage = effect.intensity * 1
-            new_health = max(0, character['health'] - rupture_damage)
-            update_character_health(character_id, new_health)
-            messages.append(f"💥 {character_name} 受到破裂伤害 {rupture_damage} 点")
-            
-            # 减少层数
-            new_duration = effect.duration - 1
-            if new_duration <= 0:
-                messages.append(f"⏰ {character_name} 的破裂状态结束")
-            update_status_effect_duration(character_id, 'rupture', new_duration)
-    
-    return final_damage, messages
+    ctx = effect_registry.dispatch(ON_HIT, EffectContext(character, incoming_damage), effects)
+    return ctx.damage, ctx.messages
+
+@effect_registry.register('guard', ON_HIT)
+def _guard_on_hit(ctx: EffectContext, effect: StatusEffect):
+    """守护：受到最终伤害-(强度*10%)"""
+    damage_reduction = effect.intensity * 0.1
+    reduced_damage = int(ctx.damage * damage_reduction)
+    ctx.damage = max(0, ctx.damage - reduced_damage)
+    if reduced_damage > 0:
+        percent = int(effect.intensity * 10)
+        ctx.messages.append(f"守护减伤: -{percent}%")
+
+@effect_registry.register('vulnerable', ON_HIT)
+def _vulnerable_on_hit(ctx: EffectContext, effect: StatusEffect):
+    """易伤：受到最终伤害+(强度*10%)"""
+    damage_increase = effect.intensity * 0.1
+    increased_damage = int(ctx.damage * damage_increase)
+    ctx.damage += increased_damage
+    if increased_damage > 0:
+        percent = int(effect.intensity * 10)
+        ctx.messages.append(f"易伤增伤: +{percent}%")
+
+@effect_registry.register('shield', ON_HIT)
+def _shield_on_hit(ctx: EffectContext, effect: StatusEffect):
+    """护盾：受到最终伤害-护盾强度，伤害结算后护盾强度会减少"""
+    shield_block = min(ctx.damage, effect.intensity)
+    ctx.damage = max(0, ctx.damage - shield_block)
+    new_shield = effect.intensity - shield_block
+    
+    if shield_block > 0:
+        ctx.messages.append(f"🛡️ {ctx.character_name} 的护盾抵消了 {shield_block} 点伤害")
+    
+    if new_shield <= 0:
+        remove_status_effect(ctx.character_id, 'shield')
+        ctx.messages.append(f"💥 {ctx.character_name} 的护盾被击破")
+    else:
+        # 更新护盾强度
+        set_status_effect_intensity(ctx.character_id, 'shield', new_shield)
+
+@effect_registry.register('rupture', ON_HIT)
+def _rupture_on_hit(ctx: EffectContext, effect: StatusEffect):
+    """破裂：在受击时按强度*1点扣血，并减少1层数"""
+    rupture_damage = effect.intensity * 1
+    new_health = max(0, ctx.character['health'] - rupture_damage)
+    update_character_health(ctx.character_id, new_health)
+    ctx.messages.append(f"💥 {ctx.character_name} 受到破裂伤害 {rupture_damage} 点")
+    
+    # 减少层数
+    new_duration = effect.duration - 1
+    if new_duration <= 0:
+        ctx.messages.append(f"⏰ {ctx.character_name} 的破裂状态结束")
+    update_status_effect_duration(ctx.character_id, 'rupture', new_duration)
 
 def process_action_effects(character_id: int) -> List[str]:
     """处理行动后的状态效果"""
-    effects = get_character_status_effects(character_id)
-    messages = []
+    effects = get_character_effect_buckets(character_id, ON_ACTION)[ON_ACTION]
     character = get_character(character_id)
     
     if not character:
-        return messages
+        return []
     
-    character_name = character['name']
+    return effect_registry.dispatch(ON_ACTION, EffectContext(character), effects).messages
+
+@effect_registry.register('bleeding', ON_ACTION)
+def _bleeding_on_action(ctx: EffectContext, effect: StatusEffect):
+    """流血：在行动后按强度*1点扣血，并减少1层数"""
+    bleeding_damage = effect.intensity * 1
+    new_health = max(0, ctx.character['health'] - bleeding_damage)
+    update_character_health(ctx.character_id, new_health)
+    ctx.messages.append(f"🩸 {ctx.character_name} 受到流血伤害 {bleeding_damage} 点")
+    
+    # 减少层数
+    new_duration = effect.duration - 1
+    if new_duration <= 0:
+        ctx.messages.append(f"⏰ {ctx.character_name} 的流血状态结束")
+    update_status_effect_duration(ctx.character_id, 'bleeding', new_duration)
+
+class DamageModifiers:
+    """攻击者的伤害修正：状态效果只读取一次，AOE 对每个目标调用 apply（修正效果不修改状态）"""
     
-    for effect in effects:
-        if effect.effect_name == 'bleeding':
-            # 流血：在行动后按强度*1点扣血，并减少1层数
-            bleeding_damage = effect.intensity * 1
-            new_health = max(0, character['health'] - bleeding_damage)
-            update_character_health(character_id, new_health)
-            messages.append(f"🩸 {character_name} 受到流血伤害 {bleeding_damage} 点")
-            
-            # 减少层数
-            new_duration = effect.duration - 1
-            if new_duration <= 0:
-                messages.append(f"⏰ {character_name} 的流血状态结束")
-            update_status_effect_duration(character_id, 'bleeding', new_duration)
+    __slots__ = ('character', 'buckets')
     
-    return messages
+    def __init__(self, character: Dict, buckets: Dict[str, List[StatusEffect]]):
+        self.character = character
+        self.buckets = buckets
+    
+    def apply(self, base_damage: int, is_crit: bool = False) -> Tuple[int, bool, List[str]]:
+        """计算一次攻击的修正，返回 (修改后的伤害, 是否暴击, 效果描述信息)"""
+        final_crit = is_crit
+        ctx = EffectContext(self.character, base_damage)
+        
+        # 计算暴击率影响
+        effect_registry.dispatch(ON_CRIT_RATE, ctx, self.buckets[ON_CRIT_RATE])
+        
+        # 如果不是暴击，检查是否因为状态效果而暴击
+        if not final_crit and ctx.crit_rate > 0:
+            import random
+            if random.randint(1, 100) <= ctx.crit_rate:
+                final_crit = True
+                crit_damage_increase = int(ctx.damage * 0.2)  # 计算暴击增伤
+                ctx.damage = int(ctx.damage * 1.2)  # 暴击伤害120%
+                ctx.messages.append(f"✨ {ctx.character_name} 的呼吸法触发暴击！增加了 {crit_damage_increase} 点伤害")
+        
+        # 计算伤害修正
+        effect_registry.dispatch(ON_DAMAGE_CALC, ctx, self.buckets[ON_DAMAGE_CALC])
+        
+        return ctx.damage, final_crit, ctx.messages
 
+def get_damage_modifiers(character_id: int) -> Optional[DamageModifiers]:
+    """读取角色的伤害修正效果，角色不存在时返回None"""
+    buckets = get_character_effect_buckets(character_id, ON_CRIT_RATE, ON_DAMAGE_CALC)
+    character = get_character(character_id)
+    if not character:
+        return None
+    return DamageModifiers(character, buckets)
+
+@timed('calculate_damage_modifiers')
 def calculate_damage_modifiers(character_id: int, base_damage: int, is_crit: bool = False) -> Tuple[int, bool, List[str]]:
     """计算状态效果对伤害的修正
     
@@ -818,51 +1048,33 @@ def calculate_damage_modifiers(character_id: int, base_damage: int, is_crit: boo
     Returns:
         Tuple[int, bool, List[str]]: (修改后的伤害, 是否暴击, 效果描述信息)
     """
-    effects = get_character_status_effects(character_id)
-    messages = []
-    final_damage = base_damage
-    final_crit = is_crit
-    character = get_character(character_id)
-    
-    if not character:
-        return final_damage, final_crit, messages
-    
-    character_name = character['name']
-    
-    # 计算暴击率影响
-    crit_rate_bonus = 0
-    for effect in effects:
-        if effect.effect_name == 'breathing':
-            crit_rate_bonus += effect.intensity
-    
-    # 如果不是暴击，检查是否因为状态效果而暴击
-    if not final_crit and crit_rate_bonus > 0:
-        import random
-        if random.randint(1, 100) <= crit_rate_bonus:
-            final_crit = True
-            crit_damage_increase = int(final_damage * 0.2)  # 计算暴击增伤
-            final_damage = int(final_damage * 1.2)  # 暴击伤害120%
-            messages.append(f"✨ {character_name} 的呼吸法触发暴击！增加了 {crit_damage_increase} 点伤害")
-    
-    # 计算伤害修正
-    for effect in effects:
-        if effect.effect_name == 'strong':
-            # 强壮：攻击技能最终伤害+(强度*10%)
-            damage_bonus = int(final_damage * effect.intensity * 0.1)
-            final_damage += damage_bonus
-            if damage_bonus > 0:
-                percent = int(effect.intensity * 10)
-                messages.append(f"强壮增伤: +{percent}%")
-        
-        elif effect.effect_name == 'weak':
-            # 虚弱：攻击技能最终伤害-(强度*10%)
-            damage_reduction = int(final_damage * effect.intensity * 0.1)
-            final_damage = max(0, final_damage - damage_reduction)
-            if damage_reduction > 0:
-                percent = int(effect.intensity * 10)
-                messages.append(f"虚弱减伤: -{percent}%")
-    
-    return final_damage, final_crit, messages
+    modifiers = get_damage_modifiers(character_id)
+    if modifiers is None:
+        return base_damage, is_crit, []
+    return modifiers.apply(base_damage, is_crit)
+
+@effect_registry.register('breathing', ON_CRIT_RATE)
+def _breathing_crit_rate(ctx: EffectContext, effect: StatusEffect):
+    """呼吸法：暴击率+强度%"""
+    ctx.crit_rate += effect.intensity
+
+@effect_registry.register('strong', ON_DAMAGE_CALC)
+def _strong_damage_calc(ctx: EffectContext, effect: StatusEffect):
+    """强壮：攻击技能最终伤害+(强度*10%)"""
+    damage_bonus = int(ctx.damage * effect.intensity * 0.1)
+    ctx.damage += damage_bonus
+    if damage_bonus > 0:
+        percent = int(effect.intensity * 10)
+        ctx.messages.append(f"强壮增伤: +{percent}%")
+
+@effect_registry.register('weak', ON_DAMAGE_CALC)
+def _weak_damage_calc(ctx: EffectContext, effect: StatusEffect):
+    """虚弱：攻击技能最终伤害-(强度*10%)"""
+    damage_reduction = int(ctx.damage * effect.intensity * 0.1)
+    ctx.damage = max(0, ctx.damage - damage_reduction)
+    if damage_reduction > 0:
+        percent = int(effect.intensity * 10)
+        ctx.messages.append(f"虚弱减伤: -{percent}%")
 
 def get_status_effects_display(character_id: int) -> str:
     """获取角色状态效果的显示文本"""
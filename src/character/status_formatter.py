@@ -4,7 +4,7 @@
 """
 
 import json
-from database.queries import get_skill
+from skill.skill_cache import skill_cache
 from character.status_effects import get_status_effects_display
 
 def format_character_status(character):
@@ -168,8 +168,8 @@ def format_cooldowns(status):
         for skill_id_str, remaining_turns in cooldowns.items():
             if remaining_turns > 0:
                 # 获取技能名称
-                skill = get_skill(int(skill_id_str))
-                skill_name = skill['name'] if skill else f"技能{skill_id_str}"
+                skill = skill_cache.get(int(skill_id_str))
+                skill_name = skill.name if skill else f"技能{skill_id_str}"
                 
                 cooldown_lines.append(f"  🔒 {skill_name}: 冷却中，还需 {remaining_turns} 次行动")
         
@@ -0,0 +1,321 @@
+"""
+战斗状态快照模块
+在一个工作单元内，用一次查询加载所有参战角色及其状态效果，
+之后的读取都走内存；修改先记录为脏数据，提交前统一批量写回数据库。
+"""
+
+import json
+import logging
+from typing import Dict, List, Optional, Callable
+
+from database.unit_of_work import current_unit_of_work
+from database.records import EffectRecord, CharacterRecordBase, character_record_type
+from database.battles import battle_filter, current_battle_id
+
+logger = logging.getLogger(__name__)
+
+# 批量加载参战角色及其状态效果（一次查询）
+_LOAD_SQL = """
+    SELECT c.*,
+           e.id AS _effect_id, e.effect_type AS _effect_type, e.effect_name AS _effect_name,
+           e.intensity AS _effect_intensity, e.duration AS _effect_duration
+    FROM characters c
+    LEFT JOIN character_status_effects e ON e.character_id = c.id
+    WHERE {where}
+    ORDER BY c.id, e.id
+"""
+
+
+def _parse_status(raw) -> Dict:
+    """解析角色status字段"""
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except (json.JSONDecodeError, TypeError):
+        return {}
+
+
+def _copy_status(status: Dict) -> Dict:
+    """复制status字典（冷却等嵌套结构也复制一层），避免调用方改动快照"""
+    result = {}
+    for key, value in status.items():
+        if isinstance(value, dict):
+            value = dict(value)
+        elif isinstance(value, list):
+            value = list(value)
+        result[key] = value
+    return result
+
+
+class BattleState:
+    """
+    一次动作（或一次回合结算）期间的战斗状态快照
+
+    characters: 角色ID -> 角色记录（带 __slots__，字段与 get_character 返回的字典相同，status已解析）
+    effects: 角色ID -> EffectRecord 列表（按数据库行ID排序，与表扫描顺序一致）
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.characters: Dict[int, CharacterRecordBase] = {}
+        self.effects: Dict[int, List[EffectRecord]] = {}
+        self._dirty_columns: Dict[int, set] = {}
+        self._deleted_effect_ids: List[int] = []
+        self._missing = set()
+
+    # ---------- 加载 ----------
+
+    def load(self):
+        """加载所有参战角色及其状态效果（在战斗范围内时只加载本场战斗）"""
+        self._load_where(*battle_filter('c'))
+
+    def _load_where(self, where: str, params: tuple):
+        cursor = self.conn.cursor()
+        cursor.execute(_LOAD_SQL.format(where=where), params)
+        column_names = [col[0] for col in cursor.description]
+        split = column_names.index('_effect_id')
+        record_type = character_record_type(column_names[:split])
+
+        for row in cursor.fetchall():
+            character_id = row['id']
+            if character_id not in self.characters:
+                character = record_type.from_row(row[:split])
+                character.status = _parse_status(character.status)
+                self.characters[character_id] = character
+                self.effects[character_id] = []
+            if row['_effect_id'] is not None:
+                self.effects[character_id].append(EffectRecord.from_row(row[split:]))
+
+    def _ensure_loaded(self, character_id: int) -> bool:
+        """确保角色已在快照中（不在战斗中的角色按需加载）"""
+        if character_id in self.characters:
+            return True
+        if character_id in self._missing:
+            return False
+        self._load_where("c.id = ?", (character_id,))
+        if character_id not in self.characters:
+            self._missing.add(character_id)
+            return False
+        return True
+
+    # ---------- 角色 ----------
+
+    def get_character(self, character_id: int) -> Optional[Dict]:
+        """获取角色字典的副本"""
+        if not self._ensure_loaded(character_id):
+            return None
+        character = self.characters[character_id].to_dict()
+        character['status'] = _copy_status(character['status'])
+        return character
+
+    def peek_character(self, character_id: int) -> Optional[CharacterRecordBase]:
+        """获取快照中的角色记录本身（支持 record['列名'] 读取；只读，调用方不得修改）"""
+        if not self._ensure_loaded(character_id):
+            return None
+        return self.characters[character_id]
+
+    def battle_characters(self, character_type: Optional[str] = None) -> List[Dict]:
+        """获取参战角色副本列表（按ID排序，与数据库查询顺序一致）"""
+        battle_id = current_battle_id()
+        result = []
+        for character_id in sorted(self.characters):
+            character = self.characters[character_id]
+            if not character.get('in_battle'):
+                continue
+            if battle_id is not None and character.get('battle_id') != battle_id:
+                continue
+            if character_type is not None and character.get('character_type') != character_type:
+                continue
+            result.append(self.get_character(character_id))
+        return result
+
+    def update_character(self, character_id: int, **columns) -> bool:
+        """修改角色字段并标记为脏数据"""
+        if not self._ensure_loaded(character_id):
+            return False
+        character = self.characters[character_id]
+        dirty = self._dirty_columns.setdefault(character_id, set())
+        for column, value in columns.items():
+            setattr(character, column, value)
+            dirty.add(column)
+        return True
+
+    def sync_character_column(self, column: str, source_column: str, battle_id: Optional[int] = None):
+        """已由整表（或整场战斗）SQL写入 column = source_column 时，同步快照中的值（不标记为脏数据）"""
+        for character in self.characters.values():
+            if battle_id is not None and character.get('battle_id') != battle_id:
+                continue
+            setattr(character, column, getattr(character, source_column))
+
+    # ---------- 状态效果 ----------
+
+    def get_effects(self, character_id: int) -> List[EffectRecord]:
+        """获取角色的状态效果列表（快照内部对象）"""
+        if not self._ensure_loaded(character_id):
+            return []
+        return self.effects[character_id]
+
+    def add_effect(self, character_id: int, effect_type: str, effect_name: str,
+                   intensity: int, duration: int) -> bool:
+        """新增一条状态效果"""
+        if not self._ensure_loaded(character_id):
+            return False
+        self.effects[character_id].append(
+            EffectRecord(None, effect_type, effect_name, intensity, duration, dirty=True)
+        )
+        return True
+
+    def update_effects(self, character_id: int, match: Callable[[EffectRecord], bool], **changes) -> int:
+        """修改满足条件的状态效果，返回修改条数"""
+        count = 0
+        for effect in self.get_effects(character_id):
+            if match(effect):
+                for field_name, value in changes.items():
+                    setattr(effect, field_name, value)
+                effect.dirty = True
+                count += 1
+        return count
+
+    def remove_effects(self, character_id: int, match: Callable[[EffectRecord], bool]) -> int:
+        """删除满足条件的状态效果，返回删除条数"""
+        effects = self.get_effects(character_id)
+        kept = []
+        removed = 0
+        for effect in effects:
+            if match(effect):
+                removed += 1
+                if effect.id is not None:
+                    self._deleted_effect_ids.append(effect.id)
+            else:
+                kept.append(effect)
+        if removed:
+            effects[:] = kept
+        return removed
+
+    # ---------- 写回 ----------
+
+    def flush(self):
+        """把脏数据批量写回数据库（在工作单元提交前调用，也可在原始SQL读取前调用）"""
+        cursor = self.conn.cursor()
+
+        if self._deleted_effect_ids:
+            cursor.executemany(
+                "DELETE FROM character_status_effects WHERE id = ?",
+                [(effect_id,) for effect_id in self._deleted_effect_ids]
+            )
+            self._deleted_effect_ids = []
+
+        updates = []
+        inserts = []
+        for character_id, effects in self.effects.items():
+            for effect in effects:
+                if not effect.dirty:
+                    continue
+                if effect.id is None:
+                    inserts.append((effect, (character_id, effect.effect_type, effect.effect_name,
+                                             effect.intensity, effect.duration)))
+                else:
+                    updates.append((effect.effect_type, effect.intensity, effect.duration, effect.id))
+                effect.dirty = False
+
+        if updates:
+            cursor.executemany(
+                "UPDATE character_status_effects SET effect_type = ?, intensity = ?, duration = ? WHERE id = ?",
+                updates
+            )
+
+        if inserts:
+            # 同一角色的新效果按创建顺序插入，行ID顺序与快照中的顺序一致
+            cursor.executemany(
+                """INSERT INTO character_status_effects
+                   (character_id, effect_type, effect_name, intensity, duration)
+                   VALUES (?, ?, ?, ?, ?)""",
+                [params for _, params in inserts]
+            )
+            last_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+            first_id = last_id - len(inserts) + 1
+            for offset, (effect, _) in enumerate(inserts):
+                effect.id = first_id + offset
+
+        if self._dirty_columns:
+            grouped: Dict[tuple, List[tuple]] = {}
+            for character_id, columns in self._dirty_columns.items():
+                character = self.characters[character_id]
+                key = tuple(sorted(columns))
+                values = []
+                for column in key:
+                    value = character[column]
+                    if column == 'status':
+                        value = json.dumps(value)
+                    values.append(value)
+                values.append(character_id)
+                grouped.setdefault(key, []).append(tuple(values))
+            for columns, rows in grouped.items():
+                assignments = ", ".join(f"{column} = ?" for column in columns)
+                cursor.executemany(f"UPDATE characters SET {assignments} WHERE id = ?", rows)
+            self._dirty_columns = {}
+
+    # ---------- 检查点 ----------
+
+    def checkpoint(self) -> tuple:
+        """保存快照当前内容（含未写回的脏数据），供 restore 恢复"""
+        return self._copy_contents(
+            self.characters, self.effects, self._dirty_columns, self._deleted_effect_ids, self._missing
+        )
+
+    def restore(self, checkpoint: tuple):
+        """恢复到检查点时的内容（检查点可重复使用）"""
+        (self.characters, self.effects, self._dirty_columns,
+         self._deleted_effect_ids, self._missing) = self._copy_contents(*checkpoint)
+
+    @staticmethod
+    def _copy_contents(characters, effects, dirty_columns, deleted_effect_ids, missing) -> tuple:
+        copied_characters = {}
+        for character_id, character in characters.items():
+            copied = character.copy()
+            copied.status = _copy_status(character.status)
+            copied_characters[character_id] = copied
+        return (
+            copied_characters,
+            {character_id: [effect.copy() for effect in character_effects]
+             for character_id, character_effects in effects.items()},
+            {character_id: set(columns) for character_id, columns in dirty_columns.items()},
+            list(deleted_effect_ids),
+            set(missing)
+        )
+
+    def invalidate(self, character_id: Optional[int] = None):
+        """写回后丢弃快照（原始SQL修改了角色时调用），重新加载"""
+        self.flush()
+        if character_id is None:
+            self.characters.clear()
+            self.effects.clear()
+            self._missing.clear()
+            self.load()
+        else:
+            self.characters.pop(character_id, None)
+            self.effects.pop(character_id, None)
+            self._missing.discard(character_id)
+
+
+def current_battle_state() -> Optional[BattleState]:
+    """获取当前工作单元的战斗状态快照，没有则返回None"""
+    uow = current_unit_of_work()
+    if uow is None:
+        return None
+    return uow.battle_state
+
+
+def flush_battle_state():
+    """在执行原始SQL读取前写回快照中的脏数据"""
+    state = current_battle_state()
+    if state is not None:
+        state.flush()
+
+
+def invalidate_battle_state(character_id: Optional[int] = None):
+    """原始SQL批量修改角色后，丢弃快照中的对应数据"""
+    state = current_battle_state()
+    if state is not None:
+        state.invalidate(character_id)
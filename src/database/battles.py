@@ -0,0 +1,325 @@
+"""
+战斗会话模块
+每个 Telegram 聊天同时最多有一场进行中的战斗（battles 表），参战角色通过 characters.battle_id 归属到战斗。
+角色的状态效果和技能冷却都挂在角色上，一个角色同一时间只能在一场战斗中，因此按参战角色即可限定范围。
+
+战斗执行者在执行命令前进入该聊天的战斗范围：
+
+    with battle_scope(battle_id):
+        get_battle_characters()      # 只返回本场战斗的角色
+
+范围内的查询使用 battle_filter() 生成的条件（battle_id = ?），只扫描本场战斗的角色；
+不在任何范围内时（命令行工具、模拟器等）保持原来的行为，条件为 in_battle = 1。
+
+回合数也保存在战斗行中。结算回合前先单独提交「回合结算中」标记（turn_in_progress），
+结算本身在一个事务中完成并清除标记；重启时标记仍在说明结算没有提交，
+战斗数据停留在结算前，可以放心地重新结算或放弃（见 get_interrupted_turns）。
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from database.db_connection import get_db_connection
+from database.unit_of_work import current_unit_of_work
+
+logger = logging.getLogger(__name__)
+
+# 不存在的战斗ID：聊天还没有战斗时，只读查询在此范围内执行，查不到任何角色
+NO_BATTLE = 0
+
+# 升级前已在战斗中的角色归入的遗留战斗所属的聊天ID（见 db_migration.add_battle_sessions），
+# 之后第一个开始战斗的聊天会接管这场战斗
+LEGACY_CHAT_ID = 0
+
+_current_battle: ContextVar[Optional[int]] = ContextVar('current_battle', default=None)
+
+# 聊天ID -> 进行中的战斗ID
+_active_battles: Dict[Hashable, int] = {}
+_active_lock = threading.Lock()
+
+
+def current_battle_id() -> Optional[int]:
+    """当前所在的战斗ID，不在任何战斗范围内时返回None"""
+    return _current_battle.get()
+
+
+@contextmanager
+def battle_scope(battle_id: Optional[int]):
+    """在指定战斗的范围内执行（None 表示不限定战斗）"""
+    token = _current_battle.set(battle_id)
+    try:
+        yield battle_id
+    finally:
+        _current_battle.reset(token)
+
+
+def battle_filter(alias: str = '') -> Tuple[str, tuple]:
+    """
+    参战角色的筛选条件
+
+    Args:
+        alias: characters 表的别名（如 'c'）
+
+    Returns:
+        (SQL条件, 参数)
+    """
+    prefix = f"{alias}." if alias else ''
+    battle_id = _current_battle.get()
+    if battle_id is None:
+        # in_battle 写成字面量，才能命中 in_battle = 1 的部分索引
+        return f"{prefix}in_battle = 1", ()
+    return f"{prefix}battle_id = ?", (battle_id,)
+
+
+def in_current_battle(character) -> bool:
+    """角色是否在当前战斗中（不限定战斗时只看 in_battle）"""
+    if not character or not character.get('in_battle'):
+        return False
+    battle_id = _current_battle.get()
+    return battle_id is None or character.get('battle_id') == battle_id
+
+
+def _remember(chat_id: Hashable, battle_id: Optional[int]):
+    with _active_lock:
+        if battle_id is None:
+            _active_battles.pop(chat_id, None)
+        else:
+            _active_battles[chat_id] = battle_id
+
+
+def _after_commit(callback):
+    """在工作单元内时提交成功后再执行（回滚的战斗不进入缓存）"""
+    uow = current_unit_of_work()
+    if uow is not None:
+        uow.after_commit(callback)
+    else:
+        callback()
+
+
+def get_active_battle_id(chat_id: Hashable) -> Optional[int]:
+    """获取聊天中进行中的战斗ID，没有则返回None"""
+    battle_id = _active_battles.get(chat_id)
+    if battle_id is not None:
+        return battle_id
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("SELECT id FROM battles WHERE chat_id = ? AND status = 'active'", (chat_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        _remember(chat_id, row[0])
+        return row[0]
+    except Exception as e:
+        logger.error(f"获取进行中的战斗时出错: {e}")
+        return None
+    finally:
+        conn.close()
+
+
+def get_or_create_battle(chat_id: Hashable) -> Optional[int]:
+    """获取聊天中进行中的战斗ID，没有则接管遗留战斗或创建一场"""
+    battle_id = get_active_battle_id(chat_id)
+    if battle_id is not None:
+        return battle_id
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        legacy = None
+        if chat_id != LEGACY_CHAT_ID:
+            cursor.execute("SELECT id FROM battles WHERE chat_id = ? AND status = 'active'", (LEGACY_CHAT_ID,))
+            legacy = cursor.fetchone()
+        if legacy is not None:
+            battle_id = legacy[0]
+            cursor.execute("UPDATE battles SET chat_id = ? WHERE id = ?", (chat_id, battle_id))
+            logger.info(f"聊天 {chat_id} 接管了遗留战斗 {battle_id}")
+        else:
+            cursor.execute("INSERT INTO battles (chat_id) VALUES (?)", (chat_id,))
+            battle_id = cursor.lastrowid
+            logger.info(f"聊天 {chat_id} 开始了新的战斗 {battle_id}")
+        conn.commit()
+
+        def remember():
+            if legacy is not None:
+                _remember(LEGACY_CHAT_ID, None)
+            _remember(chat_id, battle_id)
+
+        _after_commit(remember)
+        return battle_id
+    except Exception as e:
+        logger.error(f"创建战斗时出错: {e}")
+        conn.rollback()
+        return None
+    finally:
+        conn.close()
+
+
+def end_battle(battle_id: int) -> bool:
+    """结束战斗（参战角色需先移出战斗），之后该聊天的命令会开始一场新的战斗"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("SELECT chat_id FROM battles WHERE id = ? AND status = 'active'", (battle_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return False
+        cursor.execute(
+            "UPDATE battles SET status = 'ended', ended_at = CURRENT_TIMESTAMP, turn_in_progress = 0 WHERE id = ?",
+            (battle_id,)
+        )
+        conn.commit()
+        chat_id = row[0]
+        _after_commit(lambda: _remember(chat_id, None))
+        return True
+    except Exception as e:
+        logger.error(f"结束战斗时出错: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+
+def forget_active_battles():
+    """清空进行中战斗的缓存（直接用SQL结束战斗后调用）"""
+    with _active_lock:
+        _active_battles.clear()
+
+
+# ---------- 回合状态 ----------
+
+def get_current_turn(battle_id: int) -> int:
+    """获取战斗已结束的回合数"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("SELECT current_turn FROM battles WHERE id = ?", (battle_id,))
+        row = cursor.fetchone()
+        return row[0] if row else 0
+    except Exception as e:
+        logger.error(f"获取战斗回合数时出错: {e}")
+        return 0
+    finally:
+        conn.close()
+
+
+def set_current_turn(battle_id: int, turn: int) -> bool:
+    """设置战斗的回合数（同时清除回合结算中标记）"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute(
+            "UPDATE battles SET current_turn = ?, turn_in_progress = 0 WHERE id = ?",
+            (turn, battle_id)
+        )
+        conn.commit()
+        return cursor.rowcount > 0
+    except Exception as e:
+        logger.error(f"设置战斗回合数时出错: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+
+def mark_turn_in_progress(battle_id: int) -> int:
+    """
+    预写「回合结算中」标记（在回合结算的事务之前单独提交），返回正在结算的回合
+
+    重复调用结果相同：标记的总是 current_turn + 1。
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute(
+            """UPDATE battles
+               SET turn_in_progress = current_turn + 1, turn_started_at = CURRENT_TIMESTAMP
+               WHERE id = ?""",
+            (battle_id,)
+        )
+        cursor.execute("SELECT turn_in_progress FROM battles WHERE id = ?", (battle_id,))
+        row = cursor.fetchone()
+        conn.commit()
+        return row[0] if row else 0
+    except Exception as e:
+        logger.error(f"标记回合结算时出错: {e}")
+        conn.rollback()
+        return 0
+    finally:
+        conn.close()
+
+
+def advance_turn(battle_id: int) -> int:
+    """回合数加一并清除回合结算中标记，返回新的回合数（与回合结算在同一事务中调用）"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute(
+            "UPDATE battles SET current_turn = current_turn + 1, turn_in_progress = 0 WHERE id = ?",
+            (battle_id,)
+        )
+        cursor.execute("SELECT current_turn FROM battles WHERE id = ?", (battle_id,))
+        row = cursor.fetchone()
+        conn.commit()
+        return row[0] if row else 0
+    except Exception as e:
+        logger.error(f"推进战斗回合时出错: {e}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def clear_turn_in_progress(battle_id: int, turn: int) -> bool:
+    """放弃中断的回合结算：清除标记（只清除仍是 turn 的标记，可重复调用）"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute(
+            "UPDATE battles SET turn_in_progress = 0 WHERE id = ? AND turn_in_progress = ?",
+            (battle_id, turn)
+        )
+        conn.commit()
+        return cursor.rowcount > 0
+    except Exception as e:
+        logger.error(f"清除回合结算标记时出错: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+
+def get_interrupted_turns() -> List[Tuple[int, int, int]]:
+    """
+    获取中断的回合结算（一次按部分索引的查询，不扫描战斗表）
+
+    Returns:
+        [(战斗ID, 聊天ID, 中断的回合)]
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("""
+            SELECT id, chat_id, turn_in_progress FROM battles
+            WHERE turn_in_progress > 0 AND status = 'active'
+            ORDER BY id
+        """)
+        return [(row[0], row[1], row[2]) for row in cursor.fetchall()]
+    except Exception as e:
+        logger.error(f"获取中断的回合结算时出错: {e}")
+        return []
+    finally:
+        conn.close()
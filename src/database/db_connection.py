@@ -1,7 +1,11 @@
 import sqlite3
 import os
 import logging
-from pathlib import Path
+import threading
+import atexit
+from contextlib import contextmanager
+
+from database.query_stats import TimedCursor, active_counters, trace_statement
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -9,6 +13,16 @@ logger = logging.getLogger(__name__)
 # 数据库文件路径 (使用src/data目录)
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'dewbot.db')
 
+# 连接级PRAGMA配置（每个物理连接只执行一次）
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",      # 约16MB页缓存
+    "PRAGMA mmap_size=67108864",     # 64MB内存映射
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
 # 确保数据目录存在
 def ensure_data_dir():
     data_dir = os.path.dirname(DB_PATH)
@@ -16,12 +30,256 @@ def ensure_data_dir():
         os.makedirs(data_dir)
         logger.info(f"已创建数据目录: {data_dir}")
 
+
+class PooledConnection(sqlite3.Connection):
+    """
+    连接池中的长连接
+    
+    调用方沿用 conn.close() 的写法归还连接；只有最外层借用者归还时，
+    才会回滚未提交的事务，物理连接本身保持打开以供下次复用。
+    
+    处于工作单元（见 database.unit_of_work）中时，每次借用对应一个SAVEPOINT，
+    真正的 COMMIT 由工作单元在结束时统一执行：
+    
+    - 借用者的 commit() 与工作单元外共用连接时一样，确认本连接上尚未确认的全部修改
+      （包括外层借用者的），做法是把最内层工作单元之内的借用保存点释放后按原顺序重建；
+      外层借用者之后不提交就归还（先查询、再调用写入函数的常见写法）也不会丢掉这些修改
+    - rollback() 和未提交的归还只回滚到当前保存点，即撤销上次确认之后的修改
+    - 嵌套的工作单元的保存点是边界：其中的提交不会确认外层的修改，它整体成功或整体回滚
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.db_path = None
+        self.borrow_depth = 0
+        self.unit_of_work = None
+        self._savepoints = []  # [[保存点名称, 创建或上次确认时的total_changes, 是否为嵌套工作单元的保存点]]
+        self._savepoint_seq = 0
+        self.traced = False
+    
+    def set_traced(self, traced: bool):
+        """装上/卸下统计语句条数的 trace 回调（见 database.query_stats）"""
+        self.set_trace_callback(trace_statement if traced else None)
+        self.traced = traced
+    
+    def open_savepoint(self):
+        """为一次借用创建保存点"""
+        self._savepoint_seq += 1
+        name = f"sp_{self._savepoint_seq}"
+        self.execute(f"SAVEPOINT {name}")
+        self._savepoints.append([name, self.total_changes, False])
+    
+    def mark_unit_savepoint(self):
+        """把当前保存点标记为嵌套工作单元的边界（见 database.unit_of_work）"""
+        self._savepoints[-1][2] = True
+    
+    def close_savepoint(self):
+        """借用结束：丢弃未确认的修改并释放保存点"""
+        name, changes, _ = self._savepoints.pop()
+        if self.total_changes != changes:
+            self.execute(f"ROLLBACK TO {name}")
+        self.execute(f"RELEASE {name}")
+    
+    def commit(self):
+        """提交；工作单元中确认最内层工作单元之内的全部借用保存点中的修改"""
+        if self.unit_of_work is None:
+            return super().commit()
+        if not self._savepoints:
+            return
+        start = len(self._savepoints) - 1
+        while start > 0 and not self._savepoints[start - 1][2]:
+            start -= 1
+        confirmed = self._savepoints[start:]
+        if self.total_changes != confirmed[0][1]:
+            # 释放这一段中最外层的保存点（内层随之释放），再按原顺序重建
+            self.execute(f"RELEASE {confirmed[0][0]}")
+            for savepoint in confirmed:
+                self.execute(f"SAVEPOINT {savepoint[0]}")
+                savepoint[1] = self.total_changes
+    
+    def rollback(self):
+        """回滚；工作单元中只回滚当前保存点内上次确认之后的修改"""
+        if self.unit_of_work is None:
+            return super().rollback()
+        if self._savepoints:
+            savepoint = self._savepoints[-1]
+            if self.total_changes != savepoint[1]:
+                self.execute(f"ROLLBACK TO {savepoint[0]}")
+                savepoint[1] = self.total_changes
+        else:
+            self.unit_of_work.rollback_only = True
+    
+    def cursor(self, factory=None):
+        """游标；在查询统计范围内时使用记录耗时和行数的 TimedCursor"""
+        if factory is None:
+            factory = TimedCursor if active_counters() else sqlite3.Cursor
+        return super().cursor(factory)
+    
+    def execute(self, sql, parameters=()):
+        if active_counters():
+            return self.cursor().execute(sql, parameters)
+        return super().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        if active_counters():
+            return self.cursor().executemany(sql, seq_of_parameters)
+        return super().executemany(sql, seq_of_parameters)
+    
+    def close(self):
+        """归还连接（不真正关闭）"""
+        connection_manager.release(self)
+    
+    def close_physical(self):
+        """真正关闭底层连接"""
+        super().close()
+
+
+class ConnectionManager:
+    """
+    SQLite连接管理器
+    
+    每个线程持有一个长连接（sqlite3连接不能跨线程共享），
+    首次创建时设置WAL与PRAGMA，之后的 get_db_connection() 只是借用。
+    """
+    
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._data_dir_ready = None
+    
+    def _open(self, db_path: str) -> PooledConnection:
+        """打开一个新的物理连接并应用PRAGMA"""
+        if self._data_dir_ready != db_path:
+            data_dir = os.path.dirname(db_path)
+            if data_dir and not os.path.exists(data_dir):
+                os.makedirs(data_dir)
+                logger.info(f"已创建数据目录: {data_dir}")
+            self._data_dir_ready = db_path
+        
+        conn = sqlite3.connect(db_path, factory=PooledConnection, check_same_thread=False)
+        conn.row_factory = sqlite3.Row  # 设置行工厂，让行对象表现得像字典
+        for pragma in CONNECTION_PRAGMAS:
+            # 打开连接的开销不计入触发它的查询
+            sqlite3.Connection.execute(conn, pragma)
+        conn.db_path = db_path
+        
+        with self._lock:
+            self._connections.append(conn)
+        logger.debug(f"已创建数据库连接: {db_path} (线程 {threading.get_ident()})")
+        return conn
+    
+    def acquire(self) -> PooledConnection:
+        """借用当前线程的连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or conn.db_path != DB_PATH:
+            if conn is not None:
+                self._discard(conn)
+            conn = self._open(DB_PATH)
+            self._local.conn = conn
+        conn.borrow_depth += 1
+        if conn.traced != bool(active_counters()):
+            conn.set_traced(not conn.traced)
+        if conn.unit_of_work is not None:
+            conn.open_savepoint()
+        return conn
+    
+    def release(self, conn: PooledConnection):
+        """归还连接；最外层归还时丢弃未提交的事务，与原先关闭连接的语义一致"""
+        if conn.unit_of_work is not None and conn._savepoints:
+            try:
+                conn.close_savepoint()
+            except sqlite3.Error as e:
+                logger.error(f"释放保存点时出错: {e}")
+        if conn.borrow_depth > 0:
+            conn.borrow_depth -= 1
+        if conn.borrow_depth == 0 and conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error as e:
+                logger.error(f"回滚未提交事务时出错: {e}")
+    
+    def _discard(self, conn: PooledConnection):
+        """关闭并移除一个物理连接"""
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        try:
+            conn.close_physical()
+        except sqlite3.Error as e:
+            logger.error(f"关闭数据库连接时出错: {e}")
+    
+    def close_current(self):
+        """关闭当前线程的物理连接（线程即将退出时调用）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and conn.borrow_depth == 0:
+            self._local.conn = None
+            self._discard(conn)
+    
+    def close_all(self):
+        """关闭所有线程的物理连接（进程退出或切换数据库时调用）"""
+        with self._lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for conn in connections:
+            try:
+                conn.close_physical()
+            except sqlite3.Error as e:
+                logger.error(f"关闭数据库连接时出错: {e}")
+        self._local = threading.local()
+        self._data_dir_ready = None
+
+
+# 全局连接管理器实例
+connection_manager = ConnectionManager()
+atexit.register(connection_manager.close_all)
+
+
+def configure(db_path: str):
+    """切换数据库文件（模拟器、压测等离线工具使用）"""
+    global DB_PATH
+    connection_manager.close_all()
+    DB_PATH = db_path
+
+
+def close_all():
+    """关闭连接池中的所有连接"""
+    connection_manager.close_all()
+
+
+def backup_database(source_path: str, target_path: str) -> str:
+    """用SQLite备份接口复制数据库（源库处于WAL模式时也能得到一致的副本）"""
+    source = sqlite3.connect(f"file:{source_path}?mode=ro", uri=True)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    return target_path
+
+
 # 获取数据库连接
 def get_db_connection():
-    ensure_data_dir()
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row  # 设置行工厂，让行对象表现得像字典
-    return conn
+    return connection_manager.acquire()
+
+
+@contextmanager
+def connection():
+    """
+    以上下文管理器的方式借用连接
+    
+    正常退出时提交，异常时回滚，最后归还连接。
+    """
+    conn = connection_manager.acquire()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
 
 # 初始化数据库表
 def init_db():
@@ -1,62 +1,169 @@
+import argparse
 import logging
+import os
 import sqlite3
+import sys
+import time
+import zlib
+from urllib.parse import quote
+from . import db_connection
 from .db_connection import get_db_connection, init_db
 
 logger = logging.getLogger(__name__)
 
+# 热点查询使用的索引 (索引名, 建索引语句)
+HOT_QUERY_INDEXES = [
+    # 参战角色：部分索引只包含 in_battle = 1 的行（按ID有序，供战斗快照加载；按阵营筛选时直接命中）
+    ("idx_characters_in_battle",
+     "CREATE INDEX IF NOT EXISTS idx_characters_in_battle ON characters (id) WHERE in_battle = 1"),
+    ("idx_characters_in_battle_type",
+     "CREATE INDEX IF NOT EXISTS idx_characters_in_battle_type ON characters (character_type, id) WHERE in_battle = 1"),
+    ("idx_characters_type_name",
+     "CREATE INDEX IF NOT EXISTS idx_characters_type_name ON characters (character_type, name)"),
+    ("idx_characters_name",
+     "CREATE INDEX IF NOT EXISTS idx_characters_name ON characters (name)"),
+    # 同一角色的同名状态效果只保留一条，add_status_effect 据此使用 UPSERT
+    ("idx_status_effects_character_effect",
+     "CREATE UNIQUE INDEX IF NOT EXISTS idx_status_effects_character_effect "
+     "ON character_status_effects (character_id, effect_name)"),
+    # character_skills 的主键 (character_id, skill_id) 已覆盖按角色查询，这里补充按技能查询
+    ("idx_character_skills_skill",
+     "CREATE INDEX IF NOT EXISTS idx_character_skills_skill ON character_skills (skill_id, character_id)"),
+    ("idx_battle_logs_attacker",
+     "CREATE INDEX IF NOT EXISTS idx_battle_logs_attacker ON battle_logs (attacker_id, timestamp)"),
+    ("idx_battle_logs_defender",
+     "CREATE INDEX IF NOT EXISTS idx_battle_logs_defender ON battle_logs (defender_id, timestamp)"),
+    ("idx_battle_logs_timestamp",
+     "CREATE INDEX IF NOT EXISTS idx_battle_logs_timestamp ON battle_logs (timestamp)"),
+    ("idx_emotion_coin_log_character",
+     "CREATE INDEX IF NOT EXISTS idx_emotion_coin_log_character ON emotion_coin_log (character_id, created_at)"),
+    ("idx_emotion_level_history_character",
+     "CREATE INDEX IF NOT EXISTS idx_emotion_level_history_character ON emotion_level_history (character_id, created_at)"),
+    ("idx_character_emotion_effects_character",
+     "CREATE INDEX IF NOT EXISTS idx_character_emotion_effects_character ON character_emotion_effects (character_id)"),
+]
+
+# 按战斗会话查询使用的索引（依赖 add_battle_sessions 添加的 battle_id 列）
+BATTLE_SESSION_INDEXES = [
+    # 每个聊天同时只有一场进行中的战斗
+    ("idx_battles_active_chat",
+     "CREATE UNIQUE INDEX IF NOT EXISTS idx_battles_active_chat ON battles (chat_id) WHERE status = 'active'"),
+    # 参战角色按战斗分组：部分索引只包含参战中的行，结算时只扫描本场战斗的角色
+    ("idx_characters_battle",
+     "CREATE INDEX IF NOT EXISTS idx_characters_battle ON characters (battle_id, id) WHERE battle_id IS NOT NULL"),
+    ("idx_characters_battle_type",
+     "CREATE INDEX IF NOT EXISTS idx_characters_battle_type "
+     "ON characters (battle_id, character_type, id) WHERE battle_id IS NOT NULL"),
+    ("idx_battle_logs_battle",
+     "CREATE INDEX IF NOT EXISTS idx_battle_logs_battle ON battle_logs (battle_id, timestamp)"),
+]
+
+# 回合状态使用的索引（依赖 add_battle_turn_state 添加的列）
+BATTLE_TURN_INDEXES = [
+    # 部分索引只包含回合结算中的战斗，启动恢复时一次查询即可找到，不扫描战斗表
+    ("idx_battles_turn_in_progress",
+     "CREATE INDEX IF NOT EXISTS idx_battles_turn_in_progress ON battles (id) WHERE turn_in_progress > 0"),
+]
+
 def run_migrations():
-    """运行所有数据库迁移"""
+    """
+    运行所有数据库迁移
+
+    数据库的 PRAGMA user_version 与 SCHEMA_FINGERPRINT 相同时说明迁移都已应用，直接返回
+    （只读一次 user_version，不建表、不逐条查询迁移记录）；否则按 MIGRATIONS 的顺序
+    应用未记录的迁移，每个迁移与它的迁移记录在同一个事务中提交，全部完成后写入指纹。
+    """
     try:
+        conn = get_db_connection()
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_FINGERPRINT:
+                logger.info("数据库结构已是最新，跳过迁移")
+                return
+        finally:
+            conn.close()
+
         # 初始化数据库表结构
         init_db()
-        
+
         # 获取数据库连接
         conn = get_db_connection()
         cursor = conn.cursor()
-        
-        # 创建迁移记录表（如果不存在）
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS migrations (
-            id INTEGER PRIMARY KEY,
-            migration_name TEXT NOT NULL UNIQUE,
-            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
-        
-        # 运行迁移
-        migrations = [
-            ("initial_setup", initial_setup),
-            ("add_character_type_and_battle_status", add_character_type_and_battle_status),
-            ("remove_user_id_column", remove_user_id_column),
-            ("update_skill_system", update_skill_system),
-            ("add_damage_system", add_damage_system),
-            ("add_status_effects_system", add_status_effects_system),
-            ("update_buff_debuff_skills", update_buff_debuff_skills),
-            ("update_status_effect_targeting", update_status_effect_targeting),
-            ("add_action_system", add_action_system),
-            ("add_aoe_skill_system", add_aoe_skill_system),
-            ("remove_damage_multiplier", remove_damage_multiplier),
-            ("add_emotion_system", add_emotion_system),
-            # 将来可以在这里添加更多迁移
-        ]
-        
-        for name, migration_func in migrations:
-            # 检查迁移是否已经应用
-            cursor.execute("SELECT COUNT(*) FROM migrations WHERE migration_name = ?", (name,))
-            if cursor.fetchone()[0] == 0:
-                logger.info(f"应用迁移: {name}")
-                migration_func(conn)
-                cursor.execute("INSERT INTO migrations (migration_name) VALUES (?)", (name,))
-                conn.commit()
-            else:
+
+        try:
+            # 创建迁移记录表（如果不存在）
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS migrations (
+                id INTEGER PRIMARY KEY,
+                migration_name TEXT NOT NULL UNIQUE,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''')
+            conn.commit()
+
+            cursor.execute("SELECT migration_name FROM migrations")
+            applied = {row[0] for row in cursor.fetchall()}
+        finally:
+            conn.close()
+
+        for name, migration_func in MIGRATIONS:
+            if name in applied:
                 logger.info(f"迁移已经应用: {name}")
-        
-        conn.close()
+                continue
+            logger.info(f"应用迁移: {name}")
+            _apply_migration(name, migration_func)
+
+        conn = get_db_connection()
+        try:
+            conn.execute(f"PRAGMA user_version = {SCHEMA_FINGERPRINT}")
+            conn.commit()
+        finally:
+            conn.close()
         logger.info("所有迁移已完成")
     except Exception as e:
         logger.error(f"迁移过程中出错: {e}")
         raise
 
+def _apply_migration(name, migration_func):
+    """在一个事务中应用迁移并写入迁移记录（迁移内部的 commit/rollback 只作用于保存点）"""
+    from .unit_of_work import unit_of_work
+
+    with unit_of_work():
+        conn = get_db_connection()
+        try:
+            migration_func(conn)
+            conn.execute("INSERT INTO migrations (migration_name) VALUES (?)", (name,))
+            conn.commit()
+        finally:
+            conn.close()
+
+def _connect_readonly(db_path):
+    """以只读方式打开数据库（数据库不存在时抛出 FileNotFoundError，不会创建空文件）"""
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"数据库不存在: {db_path}")
+    return sqlite3.connect(f"file:{quote(db_path)}?mode=ro", uri=True)
+
+def get_pending_migrations(db_path=None):
+    """
+    只读地列出尚未应用的迁移名称（不修改数据库）
+
+    Returns:
+        (user_version, 未应用的迁移名称列表)
+    """
+    conn = _connect_readonly(db_path or db_connection.DB_PATH)
+    try:
+        user_version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if user_version == SCHEMA_FINGERPRINT:
+            return user_version, []
+        has_table = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'migrations'"
+        ).fetchone()
+        applied = set()
+        if has_table:
+            applied = {row[0] for row in conn.execute("SELECT migration_name FROM migrations")}
+        return user_version, [name for name, _ in MIGRATIONS if name not in applied]
+    finally:
+        conn.close()
+
 def initial_setup(conn):
     """初始迁移"""
     cursor = conn.cursor()
@@ -467,3 +574,221 @@ def add_emotion_system(conn):
         logger.error(f"添加情感系统时出错: {e}")
         conn.rollback()
         raise
+
+def add_hot_query_indexes(conn):
+    """为热点查询添加索引，并为状态效果添加 (character_id, effect_name) 唯一约束"""
+    cursor = conn.cursor()
+    
+    try:
+        logger.info("开始添加热点查询索引...")
+        
+        # 合并重复的状态效果（强度取最大值、层数叠加，与add_status_effect的叠加规则一致），
+        # 否则无法创建唯一索引
+        cursor.execute('''
+        UPDATE character_status_effects
+        SET intensity = (
+                SELECT MAX(d.intensity) FROM character_status_effects d
+                WHERE d.character_id = character_status_effects.character_id
+                  AND d.effect_name = character_status_effects.effect_name
+            ),
+            duration = (
+                SELECT SUM(d.duration) FROM character_status_effects d
+                WHERE d.character_id = character_status_effects.character_id
+                  AND d.effect_name = character_status_effects.effect_name
+            )
+        WHERE id IN (
+            SELECT MIN(id) FROM character_status_effects
+            GROUP BY character_id, effect_name
+            HAVING COUNT(*) > 1
+        )
+        ''')
+        cursor.execute('''
+        DELETE FROM character_status_effects
+        WHERE id NOT IN (
+            SELECT MIN(id) FROM character_status_effects
+            GROUP BY character_id, effect_name
+        )
+        ''')
+        if cursor.rowcount > 0:
+            logger.info(f"✓ 合并了 {cursor.rowcount} 条重复的状态效果")
+        
+        for name, sql in HOT_QUERY_INDEXES:
+            cursor.execute(sql)
+            logger.info(f"✓ 创建索引 {name}")
+        
+        conn.commit()
+        logger.info("✓ 热点查询索引添加完成")
+    except Exception as e:
+        logger.error(f"添加热点查询索引时出错: {e}")
+        conn.rollback()
+        raise
+
+def add_battle_sessions(conn):
+    """添加战斗会话：battles 表，以及参战角色和战斗日志的 battle_id 列"""
+    cursor = conn.cursor()
+    
+    try:
+        logger.info("开始添加战斗会话...")
+        
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS battles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'active', -- active: 进行中, ended: 已结束
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            ended_at TIMESTAMP
+        )
+        ''')
+        
+        for table in ("characters", "battle_logs"):
+            cursor.execute(f"PRAGMA table_info({table})")
+            column_names = [column[1] for column in cursor.fetchall()]
+            if "battle_id" not in column_names:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN battle_id INTEGER")
+                logger.info(f"✓ {table} 添加了battle_id列")
+        
+        # 已在战斗中的角色归入一场遗留战斗（聊天ID为0，第一个开始战斗的聊天会接管它，见 database.battles）
+        cursor.execute("SELECT COUNT(*) FROM characters WHERE in_battle = 1 AND battle_id IS NULL")
+        if cursor.fetchone()[0] > 0:
+            cursor.execute("SELECT id FROM battles WHERE chat_id = 0 AND status = 'active'")
+            row = cursor.fetchone()
+            if row:
+                legacy_battle_id = row[0]
+            else:
+                cursor.execute("INSERT INTO battles (chat_id) VALUES (0)")
+                legacy_battle_id = cursor.lastrowid
+            cursor.execute(
+                "UPDATE characters SET battle_id = ? WHERE in_battle = 1 AND battle_id IS NULL",
+                (legacy_battle_id,)
+            )
+            logger.info(f"✓ {cursor.rowcount} 个参战角色归入遗留战斗 {legacy_battle_id}")
+        
+        for name, sql in BATTLE_SESSION_INDEXES:
+            cursor.execute(sql)
+            logger.info(f"✓ 创建索引 {name}")
+        
+        conn.commit()
+        logger.info("✓ 战斗会话添加完成")
+    except Exception as e:
+        logger.error(f"添加战斗会话时出错: {e}")
+        conn.rollback()
+        raise
+
+def add_battle_turn_state(conn):
+    """在战斗行中保存回合数和「回合结算中」标记"""
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute("PRAGMA table_info(battles)")
+        column_names = [column[1] for column in cursor.fetchall()]
+        
+        if "current_turn" not in column_names:
+            cursor.execute("ALTER TABLE battles ADD COLUMN current_turn INTEGER NOT NULL DEFAULT 0")
+            logger.info("✓ battles 添加了current_turn列")
+        
+        # 正在结算的回合（0表示没有），结算前单独提交，结算提交时清除
+        if "turn_in_progress" not in column_names:
+            cursor.execute("ALTER TABLE battles ADD COLUMN turn_in_progress INTEGER NOT NULL DEFAULT 0")
+            logger.info("✓ battles 添加了turn_in_progress列")
+        
+        if "turn_started_at" not in column_names:
+            cursor.execute("ALTER TABLE battles ADD COLUMN turn_started_at TIMESTAMP")
+            logger.info("✓ battles 添加了turn_started_at列")
+        
+        for name, sql in BATTLE_TURN_INDEXES:
+            cursor.execute(sql)
+            logger.info(f"✓ 创建索引 {name}")
+        
+        conn.commit()
+        logger.info("✓ 回合状态添加完成")
+    except Exception as e:
+        logger.error(f"添加回合状态时出错: {e}")
+        conn.rollback()
+        raise
+
+# 迁移注册表：按顺序应用，已应用的迁移记录在 migrations 表中。
+# 新迁移只追加到末尾，不要修改已有条目的名称或顺序。
+# database/migrations/ 下的脚本是早期手动执行的一次性脚本：加列的部分已由下列迁移覆盖
+# （add_action_system、add_emotion_system），移除外键的脚本会重建表，仍需手动执行。
+MIGRATIONS = [
+    ("initial_setup", initial_setup),
+    ("add_character_type_and_battle_status", add_character_type_and_battle_status),
+    ("remove_user_id_column", remove_user_id_column),
+    ("update_skill_system", update_skill_system),
+    ("add_damage_system", add_damage_system),
+    ("add_status_effects_system", add_status_effects_system),
+    ("update_buff_debuff_skills", update_buff_debuff_skills),
+    ("update_status_effect_targeting", update_status_effect_targeting),
+    ("add_action_system", add_action_system),
+    ("add_aoe_skill_system", add_aoe_skill_system),
+    ("remove_damage_multiplier", remove_damage_multiplier),
+    ("add_emotion_system", add_emotion_system),
+    ("add_hot_query_indexes", add_hot_query_indexes),
+    ("add_battle_sessions", add_battle_sessions),
+    ("add_battle_turn_state", add_battle_turn_state),
+    # 将来可以在这里添加更多迁移
+]
+
+# 迁移注册表的指纹（写入 PRAGMA user_version，注册表有任何增减或改名都会改变）
+SCHEMA_FINGERPRINT = (zlib.crc32("\n".join(name for name, _ in MIGRATIONS).encode('utf-8')) & 0x7FFFFFFF) or 1
+
+def check_schema(db_path=None):
+    """
+    检查数据库结构是否最新，并测量启动时快速路径的耗时（只读）
+
+    Returns:
+        {'user_version', 'fingerprint', 'current', 'pending', 'connect_ms', 'fast_path_ms'}
+    """
+    db_path = db_path or db_connection.DB_PATH
+    started = time.perf_counter()
+    conn = _connect_readonly(db_path)
+    connected = time.perf_counter()
+    try:
+        user_version = conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+    finished = time.perf_counter()
+
+    _, pending = get_pending_migrations(db_path)
+    return {
+        'user_version': user_version,
+        'fingerprint': SCHEMA_FINGERPRINT,
+        'current': user_version == SCHEMA_FINGERPRINT,
+        'pending': pending,
+        'connect_ms': round((connected - started) * 1000, 3),
+        'fast_path_ms': round((finished - started) * 1000, 3),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="数据库迁移")
+    parser.add_argument('--db', help="数据库路径（默认使用机器人数据库）")
+    parser.add_argument('--check', action='store_true',
+                        help="只检查结构是否最新并测量启动快速路径耗时，不修改数据库")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        db_connection.configure(args.db)
+
+    if not args.check:
+        logging.basicConfig(level=logging.INFO, format='%(message)s')
+        run_migrations()
+        return 0
+
+    try:
+        result = check_schema()
+    except FileNotFoundError as e:
+        print(e)
+        return 2
+    print(f"user_version: {result['user_version']}  注册表指纹: {result['fingerprint']}")
+    print(f"快速路径耗时: {result['fast_path_ms']}ms（其中打开连接 {result['connect_ms']}ms）")
+    if result['current']:
+        print("数据库结构已是最新，启动时将跳过迁移")
+        return 0
+    if result['pending']:
+        print(f"有 {len(result['pending'])} 个未应用的迁移: {', '.join(result['pending'])}")
+    else:
+        print("迁移均已应用，但尚未写入指纹（下次启动时写入）")
+    return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
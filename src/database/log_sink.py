@@ -0,0 +1,234 @@
+"""
+日志写入模块
+战斗日志（battle_logs）、情感硬币日志（emotion_coin_log）等审计类记录不需要同步落盘：
+调用方只把记录放进有界队列，由后台线程攒批后用 executemany 一次写入。
+
+- 队列攒满 batch_size 条或距第一条未写记录超过 flush_interval 秒时写入
+- 在工作单元内记录时，等工作单元提交成功后才入队（回滚的动作不留日志）
+- 进程退出时自动写完剩余记录；flush() 可同步写完当前所有记录（测试、读取日志前使用），
+  后台线程运行时由它处理 flush() 放入队列的屏障，已被后台线程取出、尚未写入的记录也会写完
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from database.db_connection import get_db_connection
+from database.unit_of_work import current_unit_of_work
+
+logger = logging.getLogger(__name__)
+
+# 各日志表的插入语句（时间戳在记录时生成，不依赖写入时的 CURRENT_TIMESTAMP）
+LOG_STATEMENTS = {
+    'battle_logs': """
+        INSERT INTO battle_logs (attacker_id, defender_id, damage, skill_used, battle_id, timestamp)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """,
+    'emotion_coin_log': """
+        INSERT INTO emotion_coin_log (character_id, positive_coins, negative_coins, source, total_after, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """,
+}
+
+_STOP = object()
+
+
+class _FlushRequest:
+    """flush() 放入队列的屏障：后台线程取到它时之前入队的记录都已取出，写完后通知调用方"""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+def _timestamp() -> str:
+    """与SQLite CURRENT_TIMESTAMP相同格式的UTC时间"""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+
+
+class LogSink:
+    """批量日志写入器"""
+
+    def __init__(self, max_queue: int = 10000, batch_size: int = 200, flush_interval: float = 0.5):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[str, tuple]] = []
+        self._pending_since: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.written = 0
+        self.dropped = 0
+
+    # ---------- 记录 ----------
+
+    def log(self, table: str, row: tuple):
+        """
+        记录一行日志（row 不含时间戳列，由本函数补上）
+
+        在工作单元内调用时，提交成功后才入队。
+        """
+        if table not in LOG_STATEMENTS:
+            raise ValueError(f"未知的日志表: {table}")
+        item = (table, tuple(row) + (_timestamp(),))
+
+        uow = current_unit_of_work()
+        if uow is not None:
+            uow.after_commit(lambda: self._put(item))
+        else:
+            self._put(item)
+
+    def _put(self, item: Tuple[str, tuple]):
+        if self._closed:
+            # 已关闭（进程退出阶段），直接同步写入
+            with self._lock:
+                self._pending.append(item)
+                self._write_pending()
+            return
+
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # 写入跟不上时由调用方同步写一批，而不是丢弃审计记录
+            logger.warning("日志队列已满，同步写入")
+            self.flush()
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self.dropped += 1
+                logger.error(f"日志队列已满，丢弃一条{item[0]}记录")
+
+    # ---------- 后台线程 ----------
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='log-sink', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self.flush()
+                return
+
+            if isinstance(item, _FlushRequest):
+                with self._lock:
+                    self._write_pending()
+                item.done.set()
+                continue
+
+            with self._lock:
+                if item is not None:
+                    if not self._pending:
+                        self._pending_since = time.monotonic()
+                    self._pending.append(item)
+                if len(self._pending) >= self.batch_size or (
+                        self._pending and time.monotonic() - self._pending_since >= self.flush_interval):
+                    self._write_pending()
+
+    def _write_pending(self):
+        """写入已取出的记录（调用方须持有 _lock）"""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        self._pending_since = None
+
+        grouped: Dict[str, List[tuple]] = {}
+        for table, row in batch:
+            grouped.setdefault(table, []).append(row)
+
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        try:
+            for table, rows in grouped.items():
+                cursor.executemany(LOG_STATEMENTS[table], rows)
+            conn.commit()
+            self.written += len(batch)
+        except Exception as e:
+            logger.error(f"批量写入日志时出错: {e}")
+            conn.rollback()
+            self.dropped += len(batch)
+        finally:
+            conn.close()
+
+    # ---------- 同步接口 ----------
+
+    def flush(self):
+        """同步写完当前所有已入队的记录（不要在工作单元内调用）"""
+        thread = self._thread
+        if thread is None or not thread.is_alive() or thread is threading.current_thread():
+            self._drain()
+            return
+
+        request = _FlushRequest()
+        self._queue.put(request)
+        while not request.done.wait(self.flush_interval):
+            if not thread.is_alive():
+                # 后台线程已退出，由调用方写完剩余记录
+                self._drain()
+                return
+
+    def _drain(self):
+        """在当前线程取出队列中的记录并写入（后台线程未运行或在后台线程中调用时使用）"""
+        finished: List[_FlushRequest] = []
+        with self._lock:
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    continue
+                if isinstance(item, _FlushRequest):
+                    finished.append(item)
+                    continue
+                self._pending.append(item)
+            self._write_pending()
+            for request in finished:
+                request.done.set()
+
+    def close(self, timeout: float = 5.0):
+        """停止后台线程并写完剩余记录（进程退出时自动调用）"""
+        if self._closed:
+            return
+        self._closed = True
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+                thread.join(timeout)
+            except queue.Full:
+                pass
+        self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        """队列深度及累计写入/丢弃条数"""
+        return {
+            'queued': self._queue.qsize(),
+            'pending': len(self._pending),
+            'written': self.written,
+            'dropped': self.dropped,
+        }
+
+
+# 全局日志写入器实例
+log_sink = LogSink()
+atexit.register(log_sink.close)
+
+
+def flush_logs():
+    """同步写完所有待写日志"""
+    log_sink.flush()
@@ -1,6 +1,9 @@
 import logging
 import json
 from .db_connection import get_db_connection
+from .battle_state import current_battle_state, flush_battle_state, invalidate_battle_state
+from .log_sink import log_sink
+from .battles import battle_filter, current_battle_id, forget_active_battles
 
 logger = logging.getLogger(__name__)
 
@@ -40,6 +43,11 @@ def create_character(name="", character_type="friendly", health=100, attack=10,
 
 def get_character(character_id):
     """获取角色信息"""
+    # 工作单元中已加载战斗快照时直接读取内存
+    state = current_battle_state()
+    if state is not None:
+        return state.get_character(character_id)
+    
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -81,12 +89,17 @@ def get_friendly_characters():
     return get_characters_by_type("friendly")
 
 def get_battle_characters():
-    """获取所有正在战斗中的角色"""
+    """获取所有正在战斗中的角色（在战斗范围内时只返回本场战斗的角色）"""
+    state = current_battle_state()
+    if state is not None:
+        return state.battle_characters()
+    
     conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
-        cursor.execute("SELECT * FROM characters WHERE in_battle = 1")
+        where, params = battle_filter()
+        cursor.execute(f"SELECT * FROM characters WHERE {where}", params)
         characters = cursor.fetchall()
         
         if not characters:
@@ -120,19 +133,31 @@ def get_characters_by_type(character_type, in_battle=None):
     
     Args:
         character_type: 角色类型，'friendly'或'enemy'
-        in_battle: 是否在战斗中，None表示不限制，True表示在战斗中，False表示不在战斗中
+        in_battle: 是否在战斗中，None表示不限制，True表示在战斗中（在战斗范围内时只含本场战斗），
+                   False表示不在战斗中
     """
+    state = current_battle_state()
+    if state is not None:
+        if in_battle:
+            return state.battle_characters(character_type)
+        state.flush()
+    
     conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
         if in_battle is None:
             cursor.execute("SELECT * FROM characters WHERE character_type = ?", (character_type,))
+        elif in_battle:
+            where, params = battle_filter()
+            cursor.execute(
+                f"SELECT * FROM characters WHERE character_type = ? AND {where}", 
+                (character_type,) + params
+            )
         else:
-            in_battle_value = 1 if in_battle else 0
             cursor.execute(
-                "SELECT * FROM characters WHERE character_type = ? AND in_battle = ?", 
-                (character_type, in_battle_value)
+                "SELECT * FROM characters WHERE character_type = ? AND in_battle = 0", 
+                (character_type,)
             )
         
         characters = cursor.fetchall()
@@ -169,16 +194,44 @@ def set_character_battle_status(character_id, in_battle):
     Args:
         character_id: 角色ID
         in_battle: 是否在战斗中，True表示在战斗中，False表示不在战斗中
+    
+    在战斗范围内时，角色加入/撤出的是当前战斗：已在另一场战斗中的角色不能加入，
+    也不能撤出不在本场战斗中的角色。
     """
+    battle_id = current_battle_id()
+    state = current_battle_state()
+    if state is not None:
+        character = state.peek_character(character_id)
+        if not character:
+            return False
+        if battle_id is not None and character['in_battle'] and character['battle_id'] != battle_id:
+            return False
+        if in_battle:
+            state.update_character(character_id, in_battle=1, battle_id=battle_id)
+        else:
+            state.update_character(character_id, in_battle=0, battle_id=None)
+        return True
+    
     conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
         in_battle_value = 1 if in_battle else 0
-        cursor.execute(
-            "UPDATE characters SET in_battle = ? WHERE id = ?",
-            (in_battle_value, character_id)
-        )
+        if battle_id is None:
+            cursor.execute(
+                "UPDATE characters SET in_battle = ?, battle_id = NULL WHERE id = ?",
+                (in_battle_value, character_id)
+            )
+        else:
+            # 只能加入/撤出本场战斗（不在任何战斗中的角色可以加入）
+            cursor.execute(
+                """UPDATE characters SET in_battle = ?, battle_id = ?
+                   WHERE id = ? AND (in_battle = 0 OR battle_id = ?)""",
+                (in_battle_value, battle_id if in_battle else None, character_id, battle_id)
+            )
+            if cursor.rowcount == 0:
+                conn.rollback()
+                return False
         conn.commit()
         return True
     except Exception as e:
@@ -190,6 +243,19 @@ def set_character_battle_status(character_id, in_battle):
 
 def update_character_health(character_id, health):
     """更新角色健康值"""
+    state = current_battle_state()
+    if state is not None:
+        character = state.peek_character(character_id)
+        if not character:
+            return False
+        health = max(0, min(health, character['max_health']))
+        if health <= 0:
+            state.update_character(character_id, health=health, in_battle=0, battle_id=None)
+            logger.info(f"角色 {character_id} 生命值归0，已自动移出战斗")
+        else:
+            state.update_character(character_id, health=health)
+        return True
+    
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -217,7 +283,7 @@ def update_character_health(character_id, health):
         
         # 如果生命值归0，自动移出战斗
         if health <= 0:
-            cursor.execute("UPDATE characters SET in_battle = 0 WHERE id = ?", (character_id,))
+            cursor.execute("UPDATE characters SET in_battle = 0, battle_id = NULL WHERE id = ?", (character_id,))
             logger.info(f"角色 {character_id} 生命值归0，已自动移出战斗")
         
         conn.commit()
@@ -236,6 +302,7 @@ def get_character_by_name(name, character_type=None):
         name: 角色名称
         character_type: 角色类型，可选参数，用于进一步筛选
     """
+    flush_battle_state()
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -306,6 +373,7 @@ def update_character_status(character_id, status_key, status_value):
 
 def reset_character(character_id):
     """重置角色状态"""
+    flush_battle_state()
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -347,6 +415,7 @@ def reset_character(character_id):
         """, (character_id,))
         
         conn.commit()
+        invalidate_battle_state(character_id)
         return True
     except Exception as e:
         logger.error(f"重置角色状态时出错: {e}")
@@ -401,6 +470,17 @@ def get_character_action_info(character_id):
     Returns:
         dict: 包含current_actions和actions_per_turn的字典，或None
     """
+    state = current_battle_state()
+    if state is not None:
+        character = state.peek_character(character_id)
+        if character:
+            return {
+                'current_actions': character['current_actions'],
+                'actions_per_turn': character['actions_per_turn'],
+                'name': character['name']
+            }
+        return None
+    
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -463,6 +543,82 @@ def get_character_skills(character_id):
     finally:
         conn.close()
 
+def get_skill_availability(character_id):
+    """
+    一次查询获取角色的所有技能及其可用性（技能选择菜单用）
+    
+    技能信息、冷却剩余次数和情感等级要求在同一个连接查询中取得，
+    不再逐个技能调用 get_skill / get_skill_cooldown_remaining / check_skill_emotion_requirement。
+    
+    Returns:
+        list: 技能信息字典（字段与 get_skill 相同），另外包含：
+            cooldown_remaining: 剩余冷却次数，0表示可以使用
+            emotion_ok: 是否满足情感等级要求
+            emotion_error: 不满足时的说明
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute("""
+            SELECT s.*, c.status AS character_status, c.emotion_level AS character_emotion_level
+            FROM character_skills cs
+            JOIN skills s ON s.id = cs.skill_id
+            JOIN characters c ON c.id = cs.character_id
+            WHERE cs.character_id = ?
+            ORDER BY cs.skill_id
+        """, (character_id,))
+        rows = cursor.fetchall()
+    except Exception as e:
+        logger.error(f"获取技能可用性时出错: {e}")
+        return []
+    finally:
+        conn.close()
+    
+    if not rows:
+        return []
+    
+    # 工作单元中已加载战斗快照时以内存中的角色为准
+    state = current_battle_state()
+    character = state.get_character(character_id) if state is not None else None
+    if character is not None:
+        status = character.get('status') or {}
+        emotion_level = character.get('emotion_level', 0)
+    else:
+        try:
+            status = json.loads(rows[0]['character_status'] or '{}')
+        except (json.JSONDecodeError, TypeError):
+            status = {}
+        emotion_level = rows[0]['character_emotion_level']
+    
+    cooldowns = status.get('cooldowns', {}) if isinstance(status, dict) else {}
+    emotion_level = emotion_level or 0
+    
+    result = []
+    for row in rows:
+        skill_dict = dict(row)
+        del skill_dict['character_status'], skill_dict['character_emotion_level']
+        
+        # 确保新字段有默认值（与 get_skill 一致）
+        skill_dict.setdefault('damage_formula', '1d6')
+        skill_dict.setdefault('cooldown', 0)
+        skill_dict.setdefault('effects', '{}')
+        
+        skill_dict['cooldown_remaining'] = cooldowns.get(str(skill_dict['id']), 0)
+        
+        # 情感等级要求（与 check_skill_emotion_requirement 相同的判断和提示）
+        required_level = skill_dict.get('required_emotion_level') or 0
+        if required_level > 0 and emotion_level < required_level:
+            skill_dict['emotion_ok'] = False
+            skill_dict['emotion_error'] = f"此技能需要情感等级{required_level}级，当前等级{emotion_level}级"
+        else:
+            skill_dict['emotion_ok'] = True
+            skill_dict['emotion_error'] = ""
+        
+        result.append(skill_dict)
+    
+    return result
+
 def add_skill_to_character(character_id, skill_id):
     """为角色添加技能"""
     conn = get_db_connection()
@@ -575,26 +731,19 @@ def get_skill_by_id(skill_id):
 # 战斗相关查询
 
 def record_battle(attacker_id, defender_id, damage, skill_used=None):
-    """记录战斗结果"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
+    """记录战斗结果（交给日志写入器批量写入，见 database.log_sink）"""
     try:
-        cursor.execute(
-            "INSERT INTO battle_logs (attacker_id, defender_id, damage, skill_used) VALUES (?, ?, ?, ?)",
-            (attacker_id, defender_id, damage, skill_used)
-        )
-        conn.commit()
-        return cursor.lastrowid
+        log_sink.log('battle_logs', (attacker_id, defender_id, damage, skill_used, current_battle_id()))
+        return True
     except Exception as e:
         logger.error(f"记录战斗结果时出错: {e}")
-        conn.rollback()
-        return None
-    finally:
-        conn.close()
+        return False
 
 def get_battle_logs(character_id, limit=10):
     """获取角色的战斗记录"""
+    # 先写完尚未落盘的日志
+    log_sink.flush()
+    
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -640,7 +789,20 @@ def get_battle_logs(character_id, limit=10):
         conn.close()
 
 def update_character_status(character_id, status_json):
-    """更新角色状态JSON"""
+    """更新角色状态JSON
+    
+    Args:
+        character_id: 角色ID
+        status_json: JSON字符串，或已解析的状态字典
+    """
+    state = current_battle_state()
+    if state is not None:
+        status = json.loads(status_json) if isinstance(status_json, str) else status_json
+        return state.update_character(character_id, status=status)
+    
+    if isinstance(status_json, dict):
+        status_json = json.dumps(status_json)
+    
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -685,6 +847,7 @@ def get_skill(skill_id):
 
 def reset_all_characters():
     """重置所有角色状态：恢复满血、清除冷却、移出战斗、清除所有buff/debuff、重置情感系统"""
+    flush_battle_state()
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -706,8 +869,12 @@ def reset_all_characters():
         # 清除所有角色的状态（包括冷却时间）
         cursor.execute("UPDATE characters SET status = '{}'")
         
-        # 将所有角色移出战斗
-        cursor.execute("UPDATE characters SET in_battle = 0")
+        # 将所有角色移出战斗，并结束所有进行中的战斗
+        cursor.execute("UPDATE characters SET in_battle = 0, battle_id = NULL")
+        cursor.execute("""
+            UPDATE battles SET status = 'ended', ended_at = CURRENT_TIMESTAMP, turn_in_progress = 0
+            WHERE status = 'active'
+        """)
         
         # 清除状态效果表中的所有buff/debuff
         cursor.execute("DELETE FROM character_status_effects")
@@ -716,6 +883,8 @@ def reset_all_characters():
         cursor.execute("DELETE FROM character_emotion_effects")
         
         conn.commit()
+        forget_active_battles()
+        invalidate_battle_state()
         
         # 获取影响的角色数量
         cursor.execute("SELECT COUNT(*) FROM characters")
@@ -731,19 +900,19 @@ def reset_all_characters():
         conn.close()
 
 def remove_all_from_battle():
-    """将所有角色移出战斗"""
+    """将所有角色移出战斗（在战斗范围内时只移出本场战斗的角色），返回移出的角色数量"""
+    flush_battle_state()
     conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
-        cursor.execute("UPDATE characters SET in_battle = 0")
+        where, params = battle_filter()
+        cursor.execute(f"UPDATE characters SET in_battle = 0, battle_id = NULL WHERE {where}", params)
+        count = cursor.rowcount
         conn.commit()
+        invalidate_battle_state()
         
-        # 获取影响的角色数量
-        cursor.execute("SELECT COUNT(*) FROM characters WHERE in_battle = 0")
-        count = cursor.fetchone()[0]
-        
-        logger.info(f"已将所有角色移出战斗")
+        logger.info(f"已将 {count} 个角色移出战斗")
         return count
     except Exception as e:
         logger.error(f"移出战斗时出错: {e}")
@@ -754,6 +923,13 @@ def remove_all_from_battle():
 
 def use_character_action(character_id):
     """消耗角色的一次行动"""
+    state = current_battle_state()
+    if state is not None:
+        character = state.peek_character(character_id)
+        if not character or character['current_actions'] <= 0:
+            return False
+        return state.update_character(character_id, current_actions=character['current_actions'] - 1)
+    
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -777,16 +953,31 @@ def use_character_action(character_id):
         conn.close()
 
 def restore_character_actions():
-    """恢复所有角色的行动次数"""
+    """恢复所有角色的行动次数（在战斗范围内时只恢复本场战斗的角色）"""
+    state = current_battle_state()
+    if state is not None:
+        # 先写回快照中的行动上限变化（如加速），再整表恢复
+        state.flush()
+    
     conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
-        cursor.execute("""
-            UPDATE characters 
-            SET current_actions = actions_per_turn
-        """)
+        battle_id = current_battle_id()
+        if battle_id is None:
+            cursor.execute("""
+                UPDATE characters 
+                SET current_actions = actions_per_turn
+            """)
+        else:
+            cursor.execute("""
+                UPDATE characters 
+                SET current_actions = actions_per_turn
+                WHERE battle_id = ?
+            """, (battle_id,))
         conn.commit()
+        if state is not None:
+            state.sync_character_column('current_actions', 'actions_per_turn', battle_id)
         
         # 获取影响的角色数量
         affected_count = cursor.rowcount
@@ -805,22 +996,24 @@ def get_characters_with_actions(character_type=None):
     Args:
         character_type: 角色类型过滤 ('friendly', 'enemy', 或 None 表示所有)
     """
+    flush_battle_state()
     conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
+        where, params = battle_filter()
         if character_type:
-            cursor.execute("""
+            cursor.execute(f"""
                 SELECT * FROM characters 
-                WHERE in_battle = 1 AND current_actions > 0 AND character_type = ?
+                WHERE {where} AND current_actions > 0 AND character_type = ?
                 ORDER BY name
-            """, (character_type,))
+            """, params + (character_type,))
         else:
-            cursor.execute("""
+            cursor.execute(f"""
                 SELECT * FROM characters 
-                WHERE in_battle = 1 AND current_actions > 0
+                WHERE {where} AND current_actions > 0
                 ORDER BY name
-            """)
+            """, params)
         
         characters = []
         for row in cursor.fetchall():
@@ -836,6 +1029,11 @@ def get_characters_with_actions(character_type=None):
 
 def set_character_actions_per_turn(character_id, actions_per_turn):
     """设置角色每回合行动次数"""
+    state = current_battle_state()
+    if state is not None:
+        return state.update_character(character_id, actions_per_turn=actions_per_turn,
+                                      current_actions=actions_per_turn)
+    
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -860,6 +1058,10 @@ def set_character_actions_per_turn(character_id, actions_per_turn):
 
 def update_character_actions(character_id, current_actions):
     """更新角色当前行动次数"""
+    state = current_battle_state()
+    if state is not None:
+        return state.update_character(character_id, current_actions=current_actions)
+    
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -958,4 +1160,4 @@ def update_character_cooldowns(character_id, cooldowns_dict):
             status['cooldowns'][str(skill_id)] = cooldown
     
     # 更新角色状态
-    return update_character_status(character_id, json.dumps(status))
+    return update_character_status(character_id, status)
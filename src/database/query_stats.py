@@ -0,0 +1,319 @@
+"""
+SQL 查询统计模块
+统计每个 Telegram 更新（或任意一段代码）执行了多少条 SQL、涉及多少行、花了多少时间：
+
+- 在统计范围内借用连接时，连接装上 sqlite3 的 trace 回调数语句条数，
+  游标换成 TimedCursor 记录执行和读取耗时以及返回/修改的行数（见 db_connection）；
+  范围外借用时卸下回调、使用普通游标，不增加开销
+- 统计目标放在 contextvar 中：处理函数、战斗执行者和读线程池都会复制调用方的上下文，
+  在线程中执行的查询也记到发起它的更新上
+- 语句按归一化后的文本（字面量换成 ?，IN 列表合并）分组
+
+    with track_queries('/attack'):          # 一个更新：结束时写 DEBUG 日志并汇总到 query_stats（/perf）
+        ...
+
+    with query_budget(8):                   # 断言一段代码最多执行 8 条查询（不含事务控制语句）
+        perform_attack(attacker_id, target_id, skill_id)
+"""
+
+import logging
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# /perf 中列出的查询数
+TOP_QUERIES = 10
+
+# 归一化后的语句最多保留的长度
+MAX_SQL_LENGTH = 160
+
+# 事务控制语句（连接池的保存点、工作单元的提交等），不计入查询预算
+_CONTROL_PREFIXES = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'PRAGMA', 'END')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_NEGATIVE = re.compile(r"([(,=<>]\s*)-\s*\?")
+_NULL = re.compile(r"\bNULL\b", re.IGNORECASE)
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SAVEPOINT_NAME = re.compile(r"\bsp_\d+\b")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def normalize_sql(sql: str) -> str:
+    """
+    归一化语句：字面量换成 ?，IN/VALUES 列表合并为 (?+)，合并空白
+
+    参数展开后的语句（trace 回调收到的）与带占位符的原语句归一化结果相同。
+    """
+    text = _STRING.sub('?', sql)
+    text = _SAVEPOINT_NAME.sub('sp', text)
+    text = _NUMBER.sub('?', text)
+    text = _NEGATIVE.sub(r'\1?', text)
+    text = _NULL.sub('?', text)
+    text = _PLACEHOLDER_LIST.sub('(?+)', text)
+    text = _WHITESPACE.sub(' ', text).strip().rstrip(';').strip()
+    if len(text) > MAX_SQL_LENGTH:
+        text = text[:MAX_SQL_LENGTH - 3] + '...'
+    return text
+
+
+def is_control_statement(normalized: str) -> bool:
+    """是否为事务控制语句"""
+    return normalized[:9].upper().startswith(_CONTROL_PREFIXES)
+
+
+class QueryStat:
+    """一种（归一化后的）语句的统计"""
+
+    __slots__ = ('count', 'rows', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.rows = 0
+        self.seconds = 0.0
+
+
+class QueryCounter:
+    """一次更新（或一段代码）执行的 SQL 统计"""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.statements = 0
+        self.control_statements = 0
+        self.rows = 0
+        self.seconds = 0.0
+        self.queries: Dict[str, QueryStat] = {}
+        self._lock = threading.Lock()
+
+    def _stat(self, normalized: str) -> QueryStat:
+        stat = self.queries.get(normalized)
+        if stat is None:
+            stat = self.queries[normalized] = QueryStat()
+        return stat
+
+    def add_statement(self, normalized: str):
+        """trace 回调：执行了一条语句"""
+        with self._lock:
+            if is_control_statement(normalized):
+                self.control_statements += 1
+            else:
+                self.statements += 1
+            self._stat(normalized).count += 1
+
+    def add_timing(self, normalized: str, seconds: float, rows: int):
+        """游标：一次执行或读取的耗时和行数"""
+        with self._lock:
+            self.seconds += seconds
+            self.rows += rows
+            stat = self._stat(normalized)
+            stat.seconds += seconds
+            stat.rows += rows
+
+    def format(self) -> str:
+        lines = [f"{self.label}: {self.statements} 条查询（另有 {self.control_statements} 条事务控制），"
+                 f"{self.rows} 行，{self.seconds * 1000:.2f}ms"]
+        for sql, stat in sorted(self.queries.items(), key=lambda item: -item[1].count):
+            lines.append(f"  {stat.count:>4} 次 {stat.rows:>6} 行 {stat.seconds * 1000:>8.2f}ms  {sql}")
+        return "\n".join(lines)
+
+
+# 当前生效的统计（嵌套时外层和内层都计数）
+_counters: ContextVar[Tuple[QueryCounter, ...]] = ContextVar('query_counters', default=())
+
+
+# 当前生效的统计，非空即在统计范围内（热路径上直接调用 ContextVar.get）
+active_counters = _counters.get
+
+
+def trace_statement(sql: str):
+    """sqlite3 trace 回调（每条语句开始执行时调用）"""
+    counters = _counters.get()
+    if not counters:
+        return
+    normalized = normalize_sql(sql)
+    for counter in counters:
+        counter.add_statement(normalized)
+
+
+@contextmanager
+def count_queries(label: str = ''):
+    """在范围内统计 SQL（不汇总、不写日志），返回 QueryCounter"""
+    counter = QueryCounter(label)
+    token = _counters.set(_counters.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _counters.reset(token)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """一段代码执行的查询条数超出预算"""
+
+
+@contextmanager
+def query_budget(max_statements: int, label: str = ''):
+    """
+    断言范围内最多执行 max_statements 条查询（事务控制语句不计），超出时抛出 QueryBudgetExceeded
+
+    测试中使用：
+
+        with query_budget(8, 'execute_attack'):
+            perform_attack(attacker_id, target_id, skill_id)
+    """
+    with count_queries(label or f"预算 {max_statements}") as counter:
+        yield counter
+    if counter.statements > max_statements:
+        raise QueryBudgetExceeded(f"超出查询预算 {max_statements}:\n{counter.format()}")
+
+
+# ---------- 汇总 ----------
+
+class _HandlerTotals:
+    __slots__ = ('updates', 'statements', 'max_statements', 'rows', 'seconds')
+
+    def __init__(self):
+        self.updates = 0
+        self.statements = 0
+        self.max_statements = 0
+        self.rows = 0
+        self.seconds = 0.0
+
+
+class QueryStatsRegistry:
+    """按处理入口和按语句汇总各更新的 SQL 统计（/perf 查看）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._handlers: Dict[str, _HandlerTotals] = {}
+        self._queries: Dict[str, QueryStat] = {}
+
+    def record(self, counter: QueryCounter):
+        with self._lock:
+            totals = self._handlers.get(counter.label)
+            if totals is None:
+                totals = self._handlers[counter.label] = _HandlerTotals()
+            totals.updates += 1
+            totals.statements += counter.statements
+            totals.max_statements = max(totals.max_statements, counter.statements)
+            totals.rows += counter.rows
+            totals.seconds += counter.seconds
+            for sql, stat in counter.queries.items():
+                total = self._queries.get(sql)
+                if total is None:
+                    total = self._queries[sql] = QueryStat()
+                total.count += stat.count
+                total.rows += stat.rows
+                total.seconds += stat.seconds
+
+    def reset(self):
+        with self._lock:
+            self._handlers.clear()
+            self._queries.clear()
+
+    def format_stats(self, top: int = TOP_QUERIES) -> str:
+        """生成可读的统计文本"""
+        with self._lock:
+            handlers = sorted(self._handlers.items(), key=lambda item: -item[1].seconds)
+            queries = sorted(self._queries.items(), key=lambda item: -item[1].seconds)[:top]
+            handler_lines = [
+                f"{label}: {t.updates} 次 | 平均 {t.statements / t.updates:.1f} 条查询 (最多 {t.max_statements}) | "
+                f"平均 {t.rows / t.updates:.1f} 行 | 平均 {t.seconds / t.updates * 1000:.2f}ms"
+                for label, t in handlers
+            ]
+            query_lines = [
+                f"{stat.count} 次 | {stat.rows} 行 | {stat.seconds * 1000:.1f}ms | {sql}"
+                for sql, stat in queries
+            ]
+        if not handler_lines:
+            return "暂无统计"
+        return "按处理入口:\n" + "\n".join(handler_lines) + f"\n\n耗时最多的 {len(query_lines)} 种语句:\n" + "\n".join(query_lines)
+
+
+# 全局统计实例
+query_stats = QueryStatsRegistry()
+
+
+@contextmanager
+def track_queries(label: str):
+    """统计一个更新的 SQL：结束时写 DEBUG 日志并汇总到 query_stats"""
+    started = time.perf_counter()
+    with count_queries(label) as counter:
+        try:
+            yield counter
+        finally:
+            query_stats.record(counter)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"{counter.format()}\n  （更新总耗时 {(time.perf_counter() - started) * 1000:.2f}ms）")
+
+
+# ---------- 游标 ----------
+
+def _record_timing(counters: Tuple[QueryCounter, ...], normalized: str, seconds: float, rows: int):
+    for counter in counters:
+        counter.add_timing(normalized, seconds, rows)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """记录执行/读取耗时和行数的游标（只在统计范围内计时，行数为返回的行加修改的行）"""
+
+    _query: Optional[str] = None
+    _active: Tuple[QueryCounter, ...] = ()
+
+    def execute(self, sql, parameters=()):
+        counters = _counters.get()
+        if not counters:
+            self._active = ()
+            return super().execute(sql, parameters)
+        normalized = normalize_sql(sql)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._query, self._active = normalized, counters
+            _record_timing(counters, normalized, time.perf_counter() - started, max(self.rowcount, 0))
+
+    def executemany(self, sql, seq_of_parameters):
+        counters = _counters.get()
+        if not counters:
+            self._active = ()
+            return super().executemany(sql, seq_of_parameters)
+        normalized = normalize_sql(sql)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._active = ()
+            _record_timing(counters, normalized, time.perf_counter() - started, max(self.rowcount, 0))
+
+    def fetchone(self):
+        counters = self._active
+        if not counters:
+            return super().fetchone()
+        started = time.perf_counter()
+        row = super().fetchone()
+        _record_timing(counters, self._query, time.perf_counter() - started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        counters = self._active
+        rows = super().fetchmany() if size is None else super().fetchmany(size)
+        if counters:
+            _record_timing(counters, self._query, 0.0, len(rows))
+        return rows
+
+    def fetchall(self):
+        counters = self._active
+        if not counters:
+            return super().fetchall()
+        started = time.perf_counter()
+        rows = super().fetchall()
+        _record_timing(counters, self._query, time.perf_counter() - started, len(rows))
+        return rows
@@ -0,0 +1,206 @@
+"""
+紧凑记录模块
+战斗状态快照、伤害模拟器等需要在内存中保存并反复复制大量角色和状态效果。
+原先每个角色是一个 20 多列的 dict，每条状态效果也是一个 dict，这里提供更紧凑的表示：
+
+- EffectRecord: 带 __slots__ 的状态效果记录（快照内部使用）
+- character_record_type(columns): 按查询的列名生成带 __slots__ 的角色记录类，
+  支持 record['列名'] / record.get('列名') 读取，快照内部的角色都以此保存
+
+与数据库、与对外接口之间的转换都是显式的：from_row 读入，to_dict 交给调用方。
+在 src 目录下运行 python -m database.records 可测量每 1 万个实体的内存占用。
+"""
+
+import keyword
+from dataclasses import dataclass, make_dataclass
+from operator import attrgetter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+@dataclass(slots=True, eq=False)
+class EffectRecord:
+    """状态效果记录（对应 character_status_effects 表的一行）"""
+    id: Optional[int]
+    effect_type: str
+    effect_name: str
+    intensity: int
+    duration: int
+    dirty: bool = False
+
+    @classmethod
+    def from_row(cls, row: Sequence) -> 'EffectRecord':
+        """从 (id, effect_type, effect_name, intensity, duration) 行创建"""
+        return cls(row[0], row[1], row[2], row[3], row[4])
+
+    def copy(self) -> 'EffectRecord':
+        return EffectRecord(self.id, self.effect_type, self.effect_name,
+                            self.intensity, self.duration, self.dirty)
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'effect_type': self.effect_type,
+            'effect_name': self.effect_name,
+            'intensity': self.intensity,
+            'duration': self.duration,
+        }
+
+
+class CharacterRecordBase:
+    """角色记录基类（具体的类由 character_record_type 按列名生成）"""
+
+    __slots__ = ()
+
+    _columns: Tuple[str, ...] = ()
+    _values: Callable[[Any], Tuple] = staticmethod(lambda record: ())
+
+    @classmethod
+    def from_row(cls, row: Sequence) -> 'CharacterRecordBase':
+        """按列顺序从数据库行创建"""
+        return cls(*row)
+
+    def __getitem__(self, column: str):
+        try:
+            return getattr(self, column)
+        except AttributeError:
+            raise KeyError(column) from None
+
+    def __contains__(self, column: str) -> bool:
+        return column in self._columns
+
+    def get(self, column: str, default=None):
+        return getattr(self, column, default)
+
+    def keys(self) -> Tuple[str, ...]:
+        return self._columns
+
+    def copy(self) -> 'CharacterRecordBase':
+        return type(self)(*self._values(self))
+
+    def to_dict(self) -> Dict:
+        """转换为与 get_character 返回格式相同的字典"""
+        return dict(zip(self._columns, self._values(self)))
+
+
+_record_types: Dict[Tuple[str, ...], type] = {}
+
+
+def character_record_type(columns: Sequence[str]) -> type:
+    """获取（按列名缓存的）角色记录类"""
+    columns = tuple(columns)
+    record_type = _record_types.get(columns)
+    if record_type is not None:
+        return record_type
+
+    for column in columns:
+        if not column.isidentifier() or keyword.iskeyword(column) or column.startswith('_'):
+            raise ValueError(f"列名不能作为记录字段: {column}")
+
+    record_type = make_dataclass('CharacterRecord', columns, bases=(CharacterRecordBase,),
+                                 slots=True, eq=False)
+    record_type._columns = columns
+    if len(columns) == 1:
+        getter = attrgetter(columns[0])
+        record_type._values = staticmethod(lambda record: (getter(record),))
+    else:
+        record_type._values = staticmethod(attrgetter(*columns))
+    _record_types[columns] = record_type
+    return record_type
+
+
+# ---------- 内存测量 ----------
+
+def _measure(build: Callable[[], Any]) -> int:
+    """构建对象期间新增的内存（字节），对象在测量结束前保持存活"""
+    import tracemalloc
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        keep = build()
+        after = tracemalloc.take_snapshot()
+        size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+        del keep
+        return size
+    finally:
+        tracemalloc.stop()
+
+
+def _sample_rows(count: int) -> Tuple[Tuple[str, ...], List[tuple], List[tuple]]:
+    """从数据库取一个角色作为模板，生成 count 个角色行和 count 条状态效果行"""
+    from database.db_connection import get_db_connection
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute("SELECT * FROM characters ORDER BY id LIMIT 1")
+        columns = tuple(col[0] for col in cursor.description)
+        template = cursor.fetchone()
+    finally:
+        conn.close()
+    if template is None:
+        raise RuntimeError("数据库中没有角色，无法生成测量样本")
+
+    template = list(template)
+    id_pos, health_pos = columns.index('id'), columns.index('health')
+    characters = []
+    for i in range(count):
+        row = list(template)
+        row[id_pos] = 100000 + i
+        row[health_pos] = 1000 + i
+        characters.append(tuple(row))
+    effects = [(i, 'debuff', 'burn', 1000 + i, 2000 + i) for i in range(count)]
+    return columns, characters, effects
+
+
+def measure_memory(count: int = 10000) -> Dict[str, int]:
+    """测量 count 个角色 / 状态效果在各种表示下占用的内存（字节）"""
+    from character.status_effects import StatusEffect
+
+    columns, characters, effects = _sample_rows(count)
+    record_type = character_record_type(columns)
+    effect_keys = ('id', 'effect_type', 'effect_name', 'intensity', 'duration', 'dirty')
+
+    return {
+        'character_dict': _measure(lambda: [dict(zip(columns, row)) for row in characters]),
+        'character_record': _measure(lambda: [record_type.from_row(row) for row in characters]),
+        'effect_dict': _measure(lambda: [dict(zip(effect_keys, row + (False,))) for row in effects]),
+        'effect_record': _measure(lambda: [EffectRecord.from_row(row) for row in effects]),
+        'status_effect': _measure(lambda: [StatusEffect(*row[1:]) for row in effects]),
+    }
+
+
+def format_memory_report(sizes: Dict[str, int], count: int) -> str:
+    """生成内存测量报告"""
+    labels = (
+        ('character_dict', '角色 dict'),
+        ('character_record', '角色 __slots__ 记录'),
+        ('effect_dict', '状态效果 dict'),
+        ('effect_record', '状态效果 EffectRecord'),
+        ('status_effect', '状态效果 StatusEffect'),
+    )
+    lines = [f"每 {count} 个实体的内存占用:"]
+    for key, label in labels:
+        size = sizes[key]
+        lines.append(f"  {label:<24} {size / 1024:>10.1f} KiB  ({size / count:.1f} 字节/个)")
+    lines.append(f"  角色记录相对 dict 节省 {1 - sizes['character_record'] / sizes['character_dict']:.0%}")
+    lines.append(f"  状态效果记录相对 dict 节省 {1 - sizes['effect_record'] / sizes['effect_dict']:.0%}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="测量角色/状态效果各种内存表示的占用")
+    parser.add_argument('--count', type=int, default=10000, help="实体数量")
+    parser.add_argument('--db', help="数据库路径（默认使用机器人数据库）")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        from database import db_connection
+        db_connection.configure(args.db)
+
+    print(format_memory_report(measure_memory(args.count), args.count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+工作单元模块
+把一次完整的技能结算（伤害、状态、混乱值、冷却、情感硬币等）放进同一个事务：
+各查询函数照常 get_db_connection()/commit()/close()，
+在工作单元内它们只操作保存点，结束时统一提交一次；出现异常则整体回滚。
+"""
+
+import logging
+import sqlite3
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+from database.db_connection import connection_manager
+
+logger = logging.getLogger(__name__)
+
+
+class UnitOfWork:
+    """一次动作结算对应的事务"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.rollback_only = False
+        self.discarded = False
+        self.battle_state = None
+        self._after_commit: List[Callable[[], None]] = []
+
+    def enable_battle_state(self):
+        """为本工作单元加载战斗状态快照（已加载则直接返回）"""
+        if self.battle_state is None:
+            from database.battle_state import BattleState
+            self.battle_state = BattleState(self.conn)
+            self.battle_state.load()
+        return self.battle_state
+
+    def discard(self):
+        """放弃本工作单元的全部修改（模拟器等只读场景使用，结束时静默回滚）"""
+        self.rollback_only = True
+        self.discarded = True
+
+    def after_commit(self, callback: Callable[[], None]):
+        """注册提交成功后执行的回调（回滚时丢弃）"""
+        self._after_commit.append(callback)
+
+    def _run_after_commit(self):
+        callbacks, self._after_commit = self._after_commit, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"执行提交后回调时出错: {e}")
+
+
+def current_unit_of_work() -> Optional[UnitOfWork]:
+    """获取当前线程正在进行的工作单元，没有则返回None"""
+    conn = getattr(connection_manager._local, 'conn', None)
+    if conn is None:
+        return None
+    return conn.unit_of_work
+
+
+@contextmanager
+def unit_of_work(immediate: bool = True, battle_state: bool = False):
+    """
+    开启（或加入）一个工作单元
+
+    嵌套调用时加入外层工作单元，只有最外层负责 COMMIT/ROLLBACK。
+
+    Args:
+        immediate: 是否使用 BEGIN IMMEDIATE 立即获取写锁
+        battle_state: 是否加载战斗状态快照（见 database.battle_state），
+                      快照中的修改在提交前批量写回
+    """
+    conn = connection_manager.acquire()
+
+    # 已有外层工作单元：acquire 已为本层创建保存点，本层内的提交不越过它
+    if conn.unit_of_work is not None:
+        conn.mark_unit_savepoint()
+        try:
+            if battle_state:
+                conn.unit_of_work.enable_battle_state()
+            yield conn.unit_of_work
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return
+
+    uow = UnitOfWork(conn)
+    try:
+        if conn.in_transaction:
+            # 借用者还有未提交的修改，先确认它们，保持原先的逐函数提交语义
+            sqlite3.Connection.commit(conn)
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+    except Exception:
+        conn.close()
+        raise
+
+    conn.unit_of_work = uow
+    try:
+        if battle_state:
+            uow.enable_battle_state()
+        yield uow
+        if uow.battle_state is not None and not uow.rollback_only:
+            uow.battle_state.flush()
+    except Exception:
+        conn.unit_of_work = None
+        conn._savepoints.clear()
+        sqlite3.Connection.rollback(conn)
+        raise
+    else:
+        conn.unit_of_work = None
+        conn._savepoints.clear()
+        if uow.rollback_only:
+            if not uow.discarded:
+                logger.warning("工作单元被标记为只回滚，本次修改已丢弃")
+            sqlite3.Connection.rollback(conn)
+        else:
+            sqlite3.Connection.commit(conn)
+            uow._run_after_commit()
+    finally:
+        conn.close()
@@ -0,0 +1,217 @@
+"""
+战斗动作模块
+攻击、技能结算、加入/撤出战斗等由战斗执行者调用的同步函数（不依赖 telegram，可在命令行工具和测试中直接使用）。
+处理函数（game.attack、character.character_management）只负责交互，把这些函数提交给战斗执行者：
+
+    message = await battle_actors.submit(battle_key, 'attack', perform_attack, attacker_id, target_id, skill_id)
+
+技能效果系统（skill.skill_effects）较大，在第一次结算技能时才导入。
+"""
+
+import logging
+from database.queries import (
+    get_character,
+    get_skill,
+    use_character_action,
+    set_character_battle_status,
+    remove_all_from_battle
+)
+from database.unit_of_work import unit_of_work
+from database.battles import current_battle_id, end_battle, in_current_battle
+from game.damage_calculator import is_skill_on_cooldown, get_skill_cooldown_remaining
+
+logger = logging.getLogger(__name__)
+
+def lookup_skill(attacker_id, skill_id):
+    """
+    查询技能的冷却和详细信息
+    
+    Returns:
+        (剩余冷却次数, 技能信息)；冷却中时不查询技能信息
+    """
+    if is_skill_on_cooldown(attacker_id, skill_id):
+        return get_skill_cooldown_remaining(attacker_id, skill_id), None
+    return 0, get_skill(skill_id)
+
+def perform_attack(attacker_id, target_id, skill_id):
+    """验证攻击者、目标和技能并执行攻击，返回要显示的消息（由战斗执行者调用）"""
+    attacker = get_character(attacker_id)
+    target = get_character(target_id)
+    
+    if not attacker or not target:
+        return "攻击失败：找不到攻击者或目标。"
+    
+    # 验证攻击者和目标都在本场战斗中
+    if not in_current_battle(attacker) or not in_current_battle(target):
+        return "攻击失败：攻击者和目标必须都在战斗中。"
+    
+    # 验证攻击者的生命值
+    if attacker.get('health', 0) <= 0:
+        return "攻击失败：攻击者已经无法战斗。"
+    
+    # 获取技能信息（如果有）
+    skill_info = None
+    if skill_id:
+        # 先检查技能是否在冷却中
+        cooldown_remaining, skill_info = lookup_skill(attacker_id, skill_id)
+        if cooldown_remaining > 0:
+            return f"攻击失败：技能还在冷却中，剩余 {cooldown_remaining} 次行动。"
+        
+        if not skill_info:
+            return "攻击失败：找不到指定的技能。"
+    
+    # 执行技能效果并消耗行动次数（同一事务）
+    return resolve_skill_action(attacker, target, skill_info)
+
+def perform_untargeted_skill(attacker_id, skill_info, self_target):
+    """
+    验证施法者状态并执行无需选择目标的技能（self技能或AOE技能），由战斗执行者调用
+    
+    Args:
+        attacker_id: 施法者ID
+        skill_info: 技能信息
+        self_target: True为对自己生效的self技能，False为AOE技能
+    """
+    attacker = get_character(attacker_id)
+    
+    # 验证攻击者状态
+    if not in_current_battle(attacker):
+        return "技能使用失败：施法者必须在战斗中。"
+    
+    if attacker.get('health', 0) <= 0:
+        return "技能使用失败：施法者已经无法战斗。"
+    
+    # 执行技能效果并消耗行动次数（同一事务）
+    return resolve_skill_action(attacker, attacker if self_target else None, skill_info)
+
+def perform_enemy_attack(attacker_id, target_id, skill_info):
+    """验证敌方攻击者和目标并执行攻击，返回要显示的消息（由战斗执行者调用）"""
+    attacker = get_character(attacker_id)
+    target = get_character(target_id)
+    
+    if not attacker or not target:
+        return "找不到指定的角色。"
+    
+    if attacker['health'] <= 0:
+        return "攻击者已经无法战斗。"
+    
+    if target['health'] <= 0:
+        return "目标已经无法战斗。"
+    
+    # 其他聊天战斗中的角色不能被选作攻击者或目标
+    if not in_current_battle(attacker) or not in_current_battle(target):
+        return "攻击者和目标必须都在本场战斗中。"
+    
+    # 执行技能效果并消耗行动次数（同一事务）
+    return resolve_skill_action(attacker, target, skill_info)
+
+def resolve_skill_action(attacker, target, skill_info):
+    """在同一个工作单元中执行技能并消耗行动次数，返回结果消息"""
+    with unit_of_work(battle_state=True):
+        result_message = execute_skill_effect(attacker, target, skill_info)
+        
+        # 消耗攻击者的行动次数
+        if not use_character_action(attacker['id']):
+            result_message += "\n⚠️ 警告：消耗行动次数失败"
+    
+    return result_message
+
+def execute_skill_effect(attacker, target, skill_info):
+    """执行技能效果并返回结果消息"""
+    skill_name = skill_info['name'] if skill_info else "普通攻击"
+    
+    # 判断技能类型 - 使用新的分类系统
+    skill_category = skill_info.get('skill_category', 'damage') if skill_info else 'damage'
+    
+    # 根据技能主类型决定标题和描述
+    if skill_category == 'aoe_damage':
+        result_message = f"💥 群体攻击结果 💥\n\n"
+        result_message += f"{attacker['name']} 使用 {skill_name} 发动了群体攻击！\n\n"
+    elif skill_category == 'aoe_healing':
+        result_message = f"💚 群体治疗结果 💚\n\n"
+        result_message += f"{attacker['name']} 使用 {skill_name} 发动了群体治疗！\n\n"
+    elif skill_category == 'aoe_buff':
+        result_message = f"✨ 群体强化结果 ✨\n\n"
+        result_message += f"{attacker['name']} 使用 {skill_name} 发动了群体强化！\n\n"
+    elif skill_category == 'aoe_debuff':
+        result_message = f"💀 群体削弱结果 💀\n\n"
+        result_message += f"{attacker['name']} 使用 {skill_name} 发动了群体削弱！\n\n"
+    elif skill_category == 'self':
+        result_message = f"🧘 自我强化结果 🧘\n\n"
+        result_message += f"{attacker['name']} 使用 {skill_name} 强化了自己！\n\n"
+    elif skill_category == 'healing':
+        result_message = f"💚 治疗结果 💚\n\n"
+        result_message += f"{attacker['name']} 使用 {skill_name} 治疗了 {target['name']}！\n\n"
+    elif skill_category == 'buff':
+        result_message = f"✨ 强化结果 ✨\n\n"
+        result_message += f"{attacker['name']} 使用 {skill_name} 强化了 {target['name']}！\n\n"
+    elif skill_category == 'debuff':
+        result_message = f"💀 削弱结果 💀\n\n"
+        result_message += f"{attacker['name']} 使用 {skill_name} 削弱了 {target['name']}！\n\n"
+    else:
+        result_message = f"⚔️ 战斗结果 ⚔️\n\n"
+        result_message += f"{attacker['name']} 使用 {skill_name} 攻击了 {target['name']}！\n\n"
+    
+    # 使用技能效果系统执行技能
+    from skill.skill_effects import get_skill_registry
+    skill_result = get_skill_registry().execute_skill(attacker, target, skill_info)
+    
+    # 添加主效果结果
+    result_message += skill_result['result_text'] + "\n\n"
+    
+    # 根据技能类型决定状态显示
+    if skill_category.startswith('aoe_'):
+        # AOE技能显示相关目标状态
+        from database.queries import get_battle_characters
+        battle_chars = get_battle_characters()
+        
+        if skill_category == 'aoe_damage':
+            # AOE伤害：显示敌方状态
+            enemies = [char for char in battle_chars 
+                      if char['character_type'] != attacker['character_type']]
+            if enemies:
+                result_message += f"💀 敌方状态："
+                for enemy in enemies:
+                    if enemy['health'] <= 0:
+                        result_message += f"\n  💀 {enemy['name']} 已被击倒"
+                    else:
+                        result_message += f"\n  ❤️ {enemy['name']}: {enemy['health']}/{enemy['max_health']}"
+        elif skill_category in ['aoe_healing', 'aoe_buff']:
+            # AOE治疗/buff：显示友方状态
+            allies = [char for char in battle_chars 
+                     if char['character_type'] == attacker['character_type']]
+            if allies:
+                result_message += f"💚 友方状态："
+                for ally in allies:
+                    result_message += f"\n  ❤️ {ally['name']}: {ally['health']}/{ally['max_health']}"
+        elif skill_category == 'aoe_debuff':
+            # AOE削弱：显示敌方状态（但不显示伤害信息）
+            enemies = [char for char in battle_chars 
+                      if char['character_type'] != attacker['character_type']]
+            if enemies:
+                result_message += f"💀 敌方状态："
+                for enemy in enemies:
+                    result_message += f"\n  ❤️ {enemy['name']}: {enemy['health']}/{enemy['max_health']}"
+    elif skill_category not in ['self', 'buff', 'debuff']:
+        # 单体攻击和治疗技能显示目标生命值状态
+        if target:
+            target = get_character(target['id'])
+            if target['health'] <= 0:
+                result_message += f"💀 {target['name']} 已被击倒！"
+            else:
+                result_message += f"❤️ {target['name']} 剩余生命值: {target['health']}/{target['max_health']}"
+    else:
+        # self, buff, debuff 技能只显示完成信息
+        result_message += f"✅ 技能效果已生效！"
+    
+    return result_message
+
+def set_battle_status_many(character_ids, in_battle):
+    """批量设置角色的参战状态，返回每个角色是否成功（由战斗执行者调用）"""
+    return [set_character_battle_status(character_id, in_battle) for character_id in character_ids]
+
+def end_current_battle():
+    """移出本场战斗的所有角色并结束战斗，返回移出的角色数量（由战斗执行者调用）"""
+    count = remove_all_from_battle()
+    end_battle(current_battle_id())
+    return count
@@ -14,17 +14,15 @@ from database.queries import (
     get_character,
     get_user_characters,
     get_characters_by_type,
-    get_character_skills,
     update_character_health,
     record_battle,
-    get_skill,
-    use_character_action,
+    get_skill_availability,
     get_characters_with_actions
 )
-from skill.skill_effects import skill_registry
-from game.damage_calculator import is_skill_on_cooldown, get_skill_cooldown_remaining
 from database.db_connection import get_db_connection
 from character.status_formatter import format_character_status
+from game.battle_actor import battle_actors, battle_key_for
+from game.actions import lookup_skill, perform_attack, perform_untargeted_skill, perform_enemy_attack
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -37,7 +35,7 @@ SELECTING_TARGET = 3
 async def start_attack(update: Update, context: CallbackContext) -> int:
     """开始攻击流程"""
     # 获取有行动次数的友方角色
-    friendly_characters = get_characters_with_actions("friendly")
+    friendly_characters = await battle_actors.read(battle_key_for(update), get_characters_with_actions, "friendly")
     
     if not friendly_characters:
         await update.message.reply_text(
@@ -66,13 +64,13 @@ async def select_attacker(update: Update, context: CallbackContext) -> int:
     attacker_id = int(query.data.split('_')[1])
     context.user_data['attacker_id'] = attacker_id
     
-    attacker = get_character(attacker_id)
+    attacker = await battle_actors.read(battle_key_for(update), get_character, attacker_id)
     if not attacker:
         await query.edit_message_text("找不到该角色。请重新开始。")
         return ConversationHandler.END
     
-    # 获取角色技能
-    skills = get_character_skills(attacker_id)
+    # 获取角色技能及冷却、情感等级可用性（一次查询）
+    skills = await battle_actors.read(battle_key_for(update), get_skill_availability, attacker_id)
     
     if not skills:
         # 如果没有技能，直接使用普通攻击
@@ -81,53 +79,7 @@ async def select_attacker(update: Update, context: CallbackContext) -> int:
         return await show_target_selection(update, context, None)
     
     # 创建技能选择键盘
-    keyboard = []
-    for skill in skills:
-        skill_info = get_skill(skill['id'])
-        if skill_info:
-            # 检查技能是否在冷却中
-            cooldown_remaining = get_skill_cooldown_remaining(attacker_id, skill['id'])
-            if cooldown_remaining > 0:
-                skill_text = f"🔒 {skill['name']} (冷却中: {cooldown_remaining}次行动)"
-                # 冷却中的技能不可选择
-                continue
-            
-            # 检查技能的情感等级要求
-            from character.emotion_system import check_skill_emotion_requirement
-            can_use, error_msg = check_skill_emotion_requirement(attacker_id, skill_info)
-            if not can_use:
-                skill_text = f"🚫 {skill['name']} (需要情感等级{skill_info.get('required_emotion_level', 0)}级)"
-                # 情感等级不足的技能不可选择
-                continue
-            
-            skill_text = f"{skill['name']}"
-            
-            # 只添加伤害公式，不添加效果描述
-            damage_formula = skill_info.get('damage_formula', '')
-            if damage_formula:
-                skill_text += f" ({damage_formula})"
-                
-                # 根据技能类型添加简单的图标标识
-                skill_category = skill_info.get('skill_category', 'damage')
-                
-                if skill_category == 'healing':
-                    skill_text += " 💚"
-                elif skill_category == 'buff':
-                    skill_text += " ✨"
-                elif skill_category == 'debuff':
-                    skill_text += " 💀"
-                elif skill_category == 'self':
-                    skill_text += " 🧘"
-                elif skill_category == 'aoe':
-                    skill_text += " 🌀"
-                else:
-                    skill_text += " ⚔️"
-        else:
-            skill_text = f"{skill['name']} ⚔️"
-        
-        keyboard.append([
-            InlineKeyboardButton(skill_text, callback_data=f"skill_{skill['id']}")
-        ])
+    keyboard = _build_skill_keyboard(skills)
     
     # 如果所有技能都在冷却中，只能使用普通攻击
     if not keyboard:
@@ -140,6 +92,52 @@ async def select_attacker(update: Update, context: CallbackContext) -> int:
     
     return SELECTING_SKILL
 
+def _build_skill_keyboard(skills):
+    """根据 get_skill_availability 的结果生成友方技能选择键盘（跳过冷却中和情感等级不足的技能）"""
+    keyboard = []
+    for skill in skills:
+        # 检查技能是否在冷却中
+        cooldown_remaining = skill['cooldown_remaining']
+        if cooldown_remaining > 0:
+            skill_text = f"🔒 {skill['name']} (冷却中: {cooldown_remaining}次行动)"
+            # 冷却中的技能不可选择
+            continue
+        
+        # 检查技能的情感等级要求
+        if not skill['emotion_ok']:
+            skill_text = f"🚫 {skill['name']} (需要情感等级{skill.get('required_emotion_level', 0)}级)"
+            # 情感等级不足的技能不可选择
+            continue
+        
+        skill_text = f"{skill['name']}"
+        
+        # 只添加伤害公式，不添加效果描述
+        damage_formula = skill.get('damage_formula', '')
+        if damage_formula:
+            skill_text += f" ({damage_formula})"
+            
+            # 根据技能类型添加简单的图标标识
+            skill_category = skill.get('skill_category', 'damage')
+            
+            if skill_category == 'healing':
+                skill_text += " 💚"
+            elif skill_category == 'buff':
+                skill_text += " ✨"
+            elif skill_category == 'debuff':
+                skill_text += " 💀"
+            elif skill_category == 'self':
+                skill_text += " 🧘"
+            elif skill_category == 'aoe':
+                skill_text += " 🌀"
+            else:
+                skill_text += " ⚔️"
+        
+        keyboard.append([
+            InlineKeyboardButton(skill_text, callback_data=f"skill_{skill['id']}")
+        ])
+    
+    return keyboard
+
 async def select_skill(update: Update, context: CallbackContext) -> int:
     """处理技能选择"""
     query = update.callback_query
@@ -149,12 +147,11 @@ async def select_skill(update: Update, context: CallbackContext) -> int:
     
     # 先检查技能是否在冷却中
     attacker_id = context.user_data['attacker_id']
-    if is_skill_on_cooldown(attacker_id, skill_id):
-        cooldown_remaining = get_skill_cooldown_remaining(attacker_id, skill_id)
+    cooldown_remaining, skill_info = await battle_actors.read(battle_key_for(update), lookup_skill, attacker_id, skill_id)
+    if cooldown_remaining > 0:
         await query.edit_message_text(f"技能还在冷却中，剩余 {cooldown_remaining} 次行动。")
         return ConversationHandler.END
     
-    skill_info = get_skill(skill_id)
     if not skill_info:
         await query.edit_message_text("找不到指定的技能。")
         return ConversationHandler.END
@@ -168,11 +165,11 @@ async def show_target_selection(update: Update, context: CallbackContext, skill_
     """显示目标选择界面"""
     query = update.callback_query
     attacker_id = context.user_data['attacker_id']
-    attacker = get_character(attacker_id)
+    attacker = await battle_actors.read(battle_key_for(update), get_character, attacker_id)
     
     # 检查技能的情感等级要求
     from character.emotion_system import check_skill_emotion_requirement
-    can_use, error_msg = check_skill_emotion_requirement(attacker_id, skill_info)
+    can_use, error_msg = await battle_actors.read(battle_key_for(update), check_skill_emotion_requirement, attacker_id, skill_info)
     if not can_use:
         await query.edit_message_text(f"技能使用失败：{error_msg}")
         return ConversationHandler.END
@@ -200,42 +197,18 @@ async def show_target_selection(update: Update, context: CallbackContext, skill_
     
     # 如果是self技能，直接对自己生效，跳过目标选择
     if is_self_skill:
-        # 验证攻击者状态
-        if not attacker.get('in_battle'):
-            await query.edit_message_text("技能使用失败：施法者必须在战斗中。")
-            return ConversationHandler.END
-        
-        if attacker.get('health', 0) <= 0:
-            await query.edit_message_text("技能使用失败：施法者已经无法战斗。")
-            return ConversationHandler.END
-        
-        # 直接对自己使用技能
-        result_message = execute_skill_effect(attacker, attacker, skill_info)
-        
-        # 消耗攻击者的行动次数
-        if not use_character_action(attacker['id']):
-            result_message += "\n⚠️ 警告：消耗行动次数失败"
+        # 直接对自己使用技能（由战斗执行者验证施法者状态并执行）
+        result_message = await battle_actors.submit(battle_key_for(update), 'skill', perform_untargeted_skill,
+                                                    attacker_id, skill_info, True)
         
         await query.edit_message_text(result_message)
         return ConversationHandler.END
     
     # 如果是AOE技能，跳过目标选择，直接执行
     if is_aoe_skill:
-        # 验证攻击者状态
-        if not attacker.get('in_battle'):
-            await query.edit_message_text("技能使用失败：施法者必须在战斗中。")
-            return ConversationHandler.END
-        
-        if attacker.get('health', 0) <= 0:
-            await query.edit_message_text("技能使用失败：施法者已经无法战斗。")
-            return ConversationHandler.END
-        
-        # AOE技能不需要选择目标，直接执行
-        result_message = execute_skill_effect(attacker, None, skill_info)
-        
-        # 消耗攻击者的行动次数
-        if not use_character_action(attacker['id']):
-            result_message += "\n⚠️ 警告：消耗行动次数失败"
+        # AOE技能不需要选择目标，直接执行（由战斗执行者验证施法者状态并执行）
+        result_message = await battle_actors.submit(battle_key_for(update), 'skill', perform_untargeted_skill,
+                                                    attacker_id, skill_info, False)
         
         await query.edit_message_text(result_message)
         return ConversationHandler.END
@@ -243,7 +216,7 @@ async def show_target_selection(update: Update, context: CallbackContext, skill_
     # 根据技能类型选择目标
     if is_heal_skill or is_buff_skill:
         # 治疗技能和纯buff技能：选择友方角色（包括自己）
-        target_characters = get_characters_by_type("friendly", in_battle=True)
+        target_characters = await battle_actors.read(battle_key_for(update), get_characters_by_type, "friendly", in_battle=True)
         if is_heal_skill:
             target_type_text = "治疗目标"
         else:
@@ -251,12 +224,12 @@ async def show_target_selection(update: Update, context: CallbackContext, skill_
         skill_name = skill_info['name'] if skill_info else ("治疗" if is_heal_skill else "增益技能")
     elif is_debuff_skill:
         # 纯debuff技能：选择敌方角色
-        target_characters = get_characters_by_type("enemy", in_battle=True)
+        target_characters = await battle_actors.read(battle_key_for(update), get_characters_by_type, "enemy", in_battle=True)
         target_type_text = "减益目标"
         skill_name = skill_info['name'] if skill_info else "减益技能"
     else:
         # 攻击技能：选择敌方角色
-        target_characters = get_characters_by_type("enemy", in_battle=True)
+        target_characters = await battle_actors.read(battle_key_for(update), get_characters_by_type, "enemy", in_battle=True)
         target_type_text = "攻击目标"
         skill_name = skill_info['name'] if skill_info else "普通攻击"
     
@@ -312,137 +285,14 @@ async def execute_attack(update: Update, context: CallbackContext) -> int:
     target_id = context.user_data['target_id']
     skill_id = context.user_data.get('skill_id')
     
-    attacker = get_character(attacker_id)
-    target = get_character(target_id)
-    
-    if not attacker or not target:
-        await query.edit_message_text("攻击失败：找不到攻击者或目标。")
-        return ConversationHandler.END
-    
-    # 验证攻击者和目标都在战斗中
-    if not attacker.get('in_battle') or not target.get('in_battle'):
-        await query.edit_message_text("攻击失败：攻击者和目标必须都在战斗中。")
-        return ConversationHandler.END
-    
-    # 验证攻击者的生命值
-    if attacker.get('health', 0) <= 0:
-        await query.edit_message_text("攻击失败：攻击者已经无法战斗。")
-        return ConversationHandler.END
-    
-    # 获取技能信息（如果有）
-    skill_info = None
-    if skill_id:
-        # 先检查技能是否在冷却中
-        if is_skill_on_cooldown(attacker_id, skill_id):
-            cooldown_remaining = get_skill_cooldown_remaining(attacker_id, skill_id)
-            await query.edit_message_text(f"攻击失败：技能还在冷却中，剩余 {cooldown_remaining} 次行动。")
-            return ConversationHandler.END
-        
-        skill_info = get_skill(skill_id)
-        if not skill_info:
-            await query.edit_message_text("攻击失败：找不到指定的技能。")
-            return ConversationHandler.END
-    
-    # 执行技能效果
-    result_message = execute_skill_effect(attacker, target, skill_info)
-    
-    # 消耗攻击者的行动次数
-    if not use_character_action(attacker['id']):
-        result_message += "\n⚠️ 警告：消耗行动次数失败"
+    # 验证与结算都由本场战斗的执行者完成，验证结果不会被其他结算插队改变
+    result_message = await battle_actors.submit(battle_key_for(update), 'attack', perform_attack,
+                                                attacker_id, target_id, skill_id)
     
     await query.edit_message_text(result_message)
     
     return ConversationHandler.END
 
-def execute_skill_effect(attacker, target, skill_info):
-    """执行技能效果并返回结果消息"""
-    skill_name = skill_info['name'] if skill_info else "普通攻击"
-    
-    # 判断技能类型 - 使用新的分类系统
-    skill_category = skill_info.get('skill_category', 'damage') if skill_info else 'damage'
-    
-    # 根据技能主类型决定标题和描述
-    if skill_category == 'aoe_damage':
-        result_message = f"💥 群体攻击结果 💥\n\n"
-        result_message += f"{attacker['name']} 使用 {skill_name} 发动了群体攻击！\n\n"
-    elif skill_category == 'aoe_healing':
-        result_message = f"💚 群体治疗结果 💚\n\n"
-        result_message += f"{attacker['name']} 使用 {skill_name} 发动了群体治疗！\n\n"
-    elif skill_category == 'aoe_buff':
-        result_message = f"✨ 群体强化结果 ✨\n\n"
-        result_message += f"{attacker['name']} 使用 {skill_name} 发动了群体强化！\n\n"
-    elif skill_category == 'aoe_debuff':
-        result_message = f"💀 群体削弱结果 💀\n\n"
-        result_message += f"{attacker['name']} 使用 {skill_name} 发动了群体削弱！\n\n"
-    elif skill_category == 'self':
-        result_message = f"🧘 自我强化结果 🧘\n\n"
-        result_message += f"{attacker['name']} 使用 {skill_name} 强化了自己！\n\n"
-    elif skill_category == 'healing':
-        result_message = f"💚 治疗结果 💚\n\n"
-        result_message += f"{attacker['name']} 使用 {skill_name} 治疗了 {target['name']}！\n\n"
-    elif skill_category == 'buff':
-        result_message = f"✨ 强化结果 ✨\n\n"
-        result_message += f"{attacker['name']} 使用 {skill_name} 强化了 {target['name']}！\n\n"
-    elif skill_category == 'debuff':
-        result_message = f"💀 削弱结果 💀\n\n"
-        result_message += f"{attacker['name']} 使用 {skill_name} 削弱了 {target['name']}！\n\n"
-    else:
-        result_message = f"⚔️ 战斗结果 ⚔️\n\n"
-        result_message += f"{attacker['name']} 使用 {skill_name} 攻击了 {target['name']}！\n\n"
-    
-    # 使用技能效果系统执行技能
-    skill_result = skill_registry.execute_skill(attacker, target, skill_info)
-    
-    # 添加主效果结果
-    result_message += skill_result['result_text'] + "\n\n"
-    
-    # 根据技能类型决定状态显示
-    if skill_category.startswith('aoe_'):
-        # AOE技能显示相关目标状态
-        from database.queries import get_battle_characters
-        battle_chars = get_battle_characters()
-        
-        if skill_category == 'aoe_damage':
-            # AOE伤害：显示敌方状态
-            enemies = [char for char in battle_chars 
-                      if char['character_type'] != attacker['character_type']]
-            if enemies:
-                result_message += f"💀 敌方状态："
-                for enemy in enemies:
-                    if enemy['health'] <= 0:
-                        result_message += f"\n  💀 {enemy['name']} 已被击倒"
-                    else:
-                        result_message += f"\n  ❤️ {enemy['name']}: {enemy['health']}/{enemy['max_health']}"
-        elif skill_category in ['aoe_healing', 'aoe_buff']:
-            # AOE治疗/buff：显示友方状态
-            allies = [char for char in battle_chars 
-                     if char['character_type'] == attacker['character_type']]
-            if allies:
-                result_message += f"💚 友方状态："
-                for ally in allies:
-                    result_message += f"\n  ❤️ {ally['name']}: {ally['health']}/{ally['max_health']}"
-        elif skill_category == 'aoe_debuff':
-            # AOE削弱：显示敌方状态（但不显示伤害信息）
-            enemies = [char for char in battle_chars 
-                      if char['character_type'] != attacker['character_type']]
-            if enemies:
-                result_message += f"💀 敌方状态："
-                for enemy in enemies:
-                    result_message += f"\n  ❤️ {enemy['name']}: {enemy['health']}/{enemy['max_health']}"
-    elif skill_category not in ['self', 'buff', 'debuff']:
-        # 单体攻击和治疗技能显示目标生命值状态
-        if target:
-            target = get_character(target['id'])
-            if target['health'] <= 0:
-                result_message += f"💀 {target['name']} 已被击倒！"
-            else:
-                result_message += f"❤️ {target['name']} 剩余生命值: {target['health']}/{target['max_health']}"
-    else:
-        # self, buff, debuff 技能只显示完成信息
-        result_message += f"✅ 技能效果已生效！"
-    
-    return result_message
-
 async def cancel_attack(update: Update, context: CallbackContext) -> int:
     """取消攻击"""
     if update.callback_query:
@@ -480,7 +330,7 @@ async def start_enemy_attack(update: Update, context: CallbackContext) -> int:
     context.user_data['original_chat_id'] = update.effective_chat.id
     
     # 获取有行动次数的敌方角色
-    enemy_characters = get_characters_with_actions("enemy")
+    enemy_characters = await battle_actors.read(battle_key_for(update), get_characters_with_actions, "enemy")
     
     if not enemy_characters:
         await update.message.reply_text(
@@ -523,7 +373,7 @@ async def enemy_select_attacker(update: Update, context: CallbackContext) -> int
         return ENEMY_SELECTING_ATTACKER
     
     attacker_id = int(query.data.split('_')[2])
-    attacker = get_character(attacker_id)
+    attacker = await battle_actors.read(battle_key_for(update), get_character, attacker_id)
     
     if not attacker:
         await query.edit_message_text("找不到指定的角色。")
@@ -544,67 +394,14 @@ async def enemy_select_attacker(update: Update, context: CallbackContext) -> int
     # )
     
     # 获取攻击者的技能
-    skills = get_character_skills(attacker_id)
+    skills = await battle_actors.read(battle_key_for(update), get_skill_availability, attacker_id)
     
     if not skills:
         await query.edit_message_text(f"角色 {attacker['name']} 没有可用的技能。")
         return ConversationHandler.END
     
     # 创建技能选择键盘 - 只显示编号
-    keyboard = []
-    available_skills = []  # 存储可用技能信息
-    skill_info_text = "📋 可用技能列表:\n\n"
-    skill_index = 1
-    
-    for skill in skills:
-        # 检查技能是否在冷却中
-        if is_skill_on_cooldown(attacker_id, skill['id']):
-            continue  # 跳过冷却中的技能
-        
-        # 获取技能详细信息
-        skill_info = get_skill(skill['id'])
-        if skill_info:
-            # 检查技能的情感等级要求
-            from character.emotion_system import check_skill_emotion_requirement
-            can_use, error_msg = check_skill_emotion_requirement(attacker_id, skill_info)
-            if not can_use:
-                continue  # 跳过情感等级不足的技能
-            
-            available_skills.append({
-                'index': skill_index,
-                'skill': skill,
-                'skill_info': skill_info
-            })
-            
-            # 按钮只显示编号
-            keyboard.append([
-                InlineKeyboardButton(f"{skill_index}", callback_data=f"enemy_skill_{skill['id']}")
-            ])
-            
-            # 构建技能信息文本
-            skill_category = skill_info.get('skill_category', 'damage')
-            damage_formula = skill_info.get('damage_formula', '')
-            
-            # 添加技能图标
-            skill_icon = "⚔️"
-            if skill_category == 'healing':
-                skill_icon = "💚"
-            elif skill_category == 'buff':
-                skill_icon = "✨"
-            elif skill_category == 'debuff':
-                skill_icon = "💀"
-            elif skill_category == 'self':
-                skill_icon = "🧘"
-            elif skill_category.startswith('aoe_'):
-                skill_icon = "🌀"
-            
-            # 添加到技能列表文本
-            skill_info_text += f"{skill_index}. {skill_icon} {skill_info['name']}"
-            if damage_formula:
-                skill_info_text += f" ({damage_formula})"
-            skill_info_text += "\n"
-            
-            skill_index += 1
+    keyboard, available_skills, skill_info_text = _build_enemy_skill_menu(skills)
     
     if not keyboard:
         await query.edit_message_text(f"角色 {attacker['name']} 没有可用的技能（全部在冷却中）。")
@@ -625,8 +422,65 @@ async def enemy_select_attacker(update: Update, context: CallbackContext) -> int
     )
     
     return ENEMY_SELECTING_SKILL
+
+def _build_enemy_skill_menu(skills):
+    """
+    根据 get_skill_availability 的结果生成敌方技能编号键盘和技能列表文本（跳过冷却中和情感等级不足的技能）
     
-    return ENEMY_SELECTING_SKILL
+    Returns:
+        (键盘, 可用技能列表, 技能列表文本)
+    """
+    keyboard = []
+    available_skills = []  # 存储可用技能信息
+    skill_info_text = "📋 可用技能列表:\n\n"
+    skill_index = 1
+    
+    for skill in skills:
+        # 检查技能是否在冷却中
+        if skill['cooldown_remaining'] > 0:
+            continue  # 跳过冷却中的技能
+        
+        # 检查技能的情感等级要求
+        if not skill['emotion_ok']:
+            continue  # 跳过情感等级不足的技能
+        
+        available_skills.append({
+            'index': skill_index,
+            'skill': skill,
+            'skill_info': skill
+        })
+        
+        # 按钮只显示编号
+        keyboard.append([
+            InlineKeyboardButton(f"{skill_index}", callback_data=f"enemy_skill_{skill['id']}")
+        ])
+        
+        # 构建技能信息文本
+        skill_category = skill.get('skill_category', 'damage')
+        damage_formula = skill.get('damage_formula', '')
+        
+        # 添加技能图标
+        skill_icon = "⚔️"
+        if skill_category == 'healing':
+            skill_icon = "💚"
+        elif skill_category == 'buff':
+            skill_icon = "✨"
+        elif skill_category == 'debuff':
+            skill_icon = "💀"
+        elif skill_category == 'self':
+            skill_icon = "🧘"
+        elif skill_category.startswith('aoe_'):
+            skill_icon = "🌀"
+        
+        # 添加到技能列表文本
+        skill_info_text += f"{skill_index}. {skill_icon} {skill['name']}"
+        if damage_formula:
+            skill_info_text += f" ({damage_formula})"
+        skill_info_text += "\n"
+        
+        skill_index += 1
+    
+    return keyboard, available_skills, skill_info_text
 
 async def enemy_select_skill(update: Update, context: CallbackContext) -> int:
     """处理敌方技能选择"""
@@ -642,12 +496,11 @@ async def enemy_select_skill(update: Update, context: CallbackContext) -> int:
     
     # 先检查技能是否在冷却中
     attacker_id = context.user_data['enemy_attacker_id']
-    if is_skill_on_cooldown(attacker_id, skill_id):
-        cooldown_remaining = get_skill_cooldown_remaining(attacker_id, skill_id)
+    cooldown_remaining, skill_info = await battle_actors.read(battle_key_for(update), lookup_skill, attacker_id, skill_id)
+    if cooldown_remaining > 0:
         await query.answer(f"技能还在冷却中，剩余 {cooldown_remaining} 次行动。", show_alert=True)
         return ENEMY_SELECTING_SKILL
     
-    skill_info = get_skill(skill_id)
     if not skill_info:
         await query.answer("找不到指定的技能。", show_alert=True)
         return ENEMY_SELECTING_SKILL
@@ -659,7 +512,7 @@ async def enemy_select_skill(update: Update, context: CallbackContext) -> int:
     context.user_data['enemy_skill_info'] = skill_info
     
     # 获取攻击者信息
-    attacker = get_character(context.user_data['enemy_attacker_id'])
+    attacker = await battle_actors.read(battle_key_for(update), get_character, context.user_data['enemy_attacker_id'])
     attacker_name = attacker['name'] if attacker else '未知'
     
     # # 更新群组消息，显示已选择的技能
@@ -683,7 +536,7 @@ async def enemy_show_target_selection(update: Update, context: CallbackContext,
         return ENEMY_SELECTING_TARGET
     
     attacker_id = context.user_data['enemy_attacker_id']
-    attacker = get_character(attacker_id)
+    attacker = await battle_actors.read(battle_key_for(update), get_character, attacker_id)
     
     # 确定技能类型和目标选择 - 统一使用 skill_category
     is_heal_skill = False
@@ -703,42 +556,18 @@ async def enemy_show_target_selection(update: Update, context: CallbackContext,
     
     # 如果是self技能，直接对自己生效，跳过目标选择
     if is_self_skill:
-        # 验证攻击者状态
-        if not attacker.get('in_battle'):
-            await query.edit_message_text("技能使用失败：施法者必须在战斗中。")
-            return ConversationHandler.END
-        
-        if attacker.get('health', 0) <= 0:
-            await query.edit_message_text("技能使用失败：施法者已经无法战斗。")
-            return ConversationHandler.END
-        
-        # 直接对自己使用技能
-        result_message = execute_skill_effect(attacker, attacker, skill_info)
-        
-        # 消耗攻击者的行动次数
-        if not use_character_action(attacker['id']):
-            result_message += "\n⚠️ 警告：消耗行动次数失败"
+        # 直接对自己使用技能（由战斗执行者验证施法者状态并执行）
+        result_message = await battle_actors.submit(battle_key_for(update), 'skill', perform_untargeted_skill,
+                                                    attacker_id, skill_info, True)
         
         await query.edit_message_text(result_message)
         return ConversationHandler.END
     
     # 如果是AOE技能，跳过目标选择，直接执行
     if is_aoe_skill:
-        # 验证攻击者状态
-        if not attacker.get('in_battle'):
-            await query.edit_message_text("技能使用失败：施法者必须在战斗中。")
-            return ConversationHandler.END
-        
-        if attacker.get('health', 0) <= 0:
-            await query.edit_message_text("技能使用失败：施法者已经无法战斗。")
-            return ConversationHandler.END
-        
-        # 直接执行AOE技能
-        result_message = execute_skill_effect(attacker, None, skill_info)
-        
-        # 消耗攻击者的行动次数
-        if not use_character_action(attacker['id']):
-            result_message += "\n⚠️ 警告：消耗行动次数失败"
+        # 直接执行AOE技能（由战斗执行者验证施法者状态并执行）
+        result_message = await battle_actors.submit(battle_key_for(update), 'skill', perform_untargeted_skill,
+                                                    attacker_id, skill_info, False)
         
         await query.edit_message_text(result_message)
         return ConversationHandler.END
@@ -746,7 +575,7 @@ async def enemy_show_target_selection(update: Update, context: CallbackContext,
     # 根据技能类型选择目标
     if is_heal_skill or is_buff_skill:
         # 治疗技能和纯buff技能：选择敌方角色（包括自己）
-        target_characters = get_characters_by_type("enemy", in_battle=True)
+        target_characters = await battle_actors.read(battle_key_for(update), get_characters_by_type, "enemy", in_battle=True)
         if is_heal_skill:
             target_type_text = "治疗目标"
         else:
@@ -754,12 +583,12 @@ async def enemy_show_target_selection(update: Update, context: CallbackContext,
         skill_name = skill_info['name'] if skill_info else ("治疗" if is_heal_skill else "增益技能")
     elif is_debuff_skill:
         # 纯debuff技能：选择友方角色
-        target_characters = get_characters_by_type("friendly", in_battle=True)
+        target_characters = await battle_actors.read(battle_key_for(update), get_characters_by_type, "friendly", in_battle=True)
         target_type_text = "减益目标"
         skill_name = skill_info['name'] if skill_info else "减益技能"
     else:
         # 攻击技能：选择友方角色
-        target_characters = get_characters_by_type("friendly", in_battle=True)
+        target_characters = await battle_actors.read(battle_key_for(update), get_characters_by_type, "friendly", in_battle=True)
         target_type_text = "攻击目标"
         skill_name = skill_info['name'] if skill_info else "普通攻击"
     
@@ -812,27 +641,9 @@ async def enemy_select_target(update: Update, context: CallbackContext) -> int:
     skill_id = context.user_data['enemy_skill_id']
     skill_info = context.user_data['enemy_skill_info']
     
-    attacker = get_character(attacker_id)
-    target = get_character(target_id)
-    
-    if not attacker or not target:
-        await query.edit_message_text("找不到指定的角色。")
-        return ConversationHandler.END
-    
-    if attacker['health'] <= 0:
-        await query.edit_message_text("攻击者已经无法战斗。")
-        return ConversationHandler.END
-    
-    if target['health'] <= 0:
-        await query.edit_message_text("目标已经无法战斗。")
-        return ConversationHandler.END
-    
-    # 执行攻击
-    result = execute_skill_effect(attacker, target, skill_info)
-    
-    # 消耗攻击者的行动次数
-    if not use_character_action(attacker['id']):
-        result += "\n⚠️ 警告：消耗行动次数失败"
+    # 执行攻击（验证与结算都由本场战斗的执行者完成）
+    result = await battle_actors.submit(battle_key_for(update), 'attack', perform_enemy_attack,
+                                        attacker_id, target_id, skill_info)
     
     await query.edit_message_text(result)
     return ConversationHandler.END
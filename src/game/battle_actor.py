@@ -0,0 +1,253 @@
+"""
+战斗执行者模块
+每个聊天的战斗由一个 asyncio 执行者负责：处理函数把命令（攻击、回合结束、加入/撤出战斗等）
+放进这场战斗的邮箱并等待结果，执行者按到达顺序逐条执行：
+
+- 同一场战斗的修改严格串行，两名玩家同时点选目标也不会交错修改生命值、行动次数或护盾
+- 每场战斗有自己的执行线程，不同战斗互不排队（SQLite写锁由 busy_timeout 协调）
+- 每条命令在一个工作单元中执行，命令内的所有写入在命令结束时一次提交
+- 命令在该聊天进行中的战斗范围内执行（见 database.battles），没有则先开始一场
+- 回合结算命令可以带一个预写步骤，它在命令的工作单元之前单独提交「回合结算中」标记（用于崩溃恢复）；
+  命令本身失败时清除标记，只有进程中途退出才会留下标记
+
+处理函数中使用：
+
+    message = await battle_actors.submit(battle_key, 'attack', perform_attack, attacker_id, target_id, skill_id)
+    targets = await battle_actors.read(battle_key, get_characters_by_type, 'enemy', in_battle=True)
+
+空闲超过 IDLE_TIMEOUT 秒的执行者自动退出，下次有命令时重新创建。
+"""
+
+import asyncio
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from database.battles import (
+    NO_BATTLE, battle_scope, clear_turn_in_progress, get_active_battle_id, get_or_create_battle
+)
+from database.db_connection import connection_manager
+from database.unit_of_work import unit_of_work
+from game.executor import game_executor
+
+logger = logging.getLogger(__name__)
+
+# 无法确定聊天时使用的战斗键
+DEFAULT_BATTLE_KEY = 0
+
+# 执行者空闲多久后退出（秒）
+IDLE_TIMEOUT = 300.0
+
+# 邮箱容量（排满时提交命令的处理函数会等待）
+MAILBOX_SIZE = 100
+
+
+def battle_key_for(update) -> Hashable:
+    """处理函数对应的战斗（按 Telegram 聊天区分）"""
+    chat = getattr(update, 'effective_chat', None)
+    if chat is None:
+        return DEFAULT_BATTLE_KEY
+    return chat.id
+
+
+def _read_in_battle(battle_key: Hashable, func: Callable, args: tuple, kwargs: dict) -> Any:
+    """在聊天进行中的战斗范围内执行只读查询（还没有战斗时查不到任何参战角色）"""
+    battle_id = get_active_battle_id(battle_key)
+    with battle_scope(NO_BATTLE if battle_id is None else battle_id):
+        return func(*args, **kwargs)
+
+
+@dataclass
+class BattleCommand:
+    """邮箱中的一条命令"""
+    kind: str
+    func: Callable
+    args: tuple
+    kwargs: dict
+    future: asyncio.Future
+    context: contextvars.Context
+    submitted_at: float
+    write_ahead: Optional[Callable[[], Any]] = None
+
+
+class BattleActor:
+    """一场战斗的执行者"""
+
+    def __init__(self, battle_key: Hashable, registry: 'BattleActorRegistry'):
+        self.battle_key = battle_key
+        self._registry = registry
+        self._mailbox: asyncio.Queue = asyncio.Queue(maxsize=MAILBOX_SIZE)
+        self._thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"battle-{battle_key}")
+        self._task: Optional[asyncio.Task] = None
+        self.current: Optional[str] = None
+        self.processed = 0
+        self.failed = 0
+        self.max_queued = 0
+        self.total_wait = 0.0
+        self.total_run = 0.0
+        self.command_counts: Dict[str, int] = {}
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run(), name=f"battle-actor-{self.battle_key}")
+
+    @property
+    def queued(self) -> int:
+        return self._mailbox.qsize()
+
+    async def submit(self, kind: str, func: Callable, *args, **kwargs) -> Any:
+        """把命令放进邮箱并等待执行结果（命令抛出的异常原样抛出）"""
+        return await self._enqueue(kind, func, args, kwargs)
+
+    async def submit_write_ahead(self, kind: str, write_ahead: Callable[[], Any],
+                                 func: Callable, *args, **kwargs) -> Any:
+        """同 submit，但先在单独提交的事务中执行 write_ahead()（返回标记的回合，见 TurnManager.begin_turn）"""
+        return await self._enqueue(kind, func, args, kwargs, write_ahead)
+
+    async def _enqueue(self, kind: str, func: Callable, args: tuple, kwargs: dict,
+                       write_ahead: Optional[Callable[[], Any]] = None) -> Any:
+        loop = asyncio.get_running_loop()
+        command = BattleCommand(kind, func, args, kwargs, loop.create_future(),
+                                contextvars.copy_context(), time.perf_counter(), write_ahead)
+        await self._mailbox.put(command)
+        if self._mailbox.qsize() > self.max_queued:
+            self.max_queued = self._mailbox.qsize()
+        return await command.future
+
+    # ---------- 执行 ----------
+
+    async def _run(self):
+        try:
+            while True:
+                try:
+                    command = await asyncio.wait_for(self._mailbox.get(), IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    if self._registry._retire(self):
+                        return
+                    continue
+                await self._execute(command)
+        finally:
+            # 关闭执行线程前释放它的数据库连接
+            self._thread.submit(connection_manager.close_current)
+            self._thread.shutdown(wait=False)
+
+    async def _execute(self, command: BattleCommand):
+        started = time.perf_counter()
+        self.total_wait += started - command.submitted_at
+        self.current = command.kind
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                self._thread, command.context.run, self._call, command
+            )
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"战斗 {self.battle_key} 执行命令 {command.kind} 时出错: {e}")
+            if not command.future.done():
+                command.future.set_exception(e)
+        else:
+            self.processed += 1
+            # 等待结果的处理函数已被取消时，命令照常生效，只是不再回传结果
+            if not command.future.done():
+                command.future.set_result(result)
+        finally:
+            self.current = None
+            self.total_run += time.perf_counter() - started
+            self.command_counts[command.kind] = self.command_counts.get(command.kind, 0) + 1
+
+    def _call(self, command: BattleCommand) -> Any:
+        """在执行线程中运行命令：整条命令是一个工作单元，在本场战斗范围内执行，结束时统一提交"""
+        if command.write_ahead is None:
+            with unit_of_work():
+                with battle_scope(self._battle_id()):
+                    return command.func(*command.args, **command.kwargs)
+
+        # 预写步骤单独提交，进程在命令中途退出时它仍然保留，重启后据此恢复
+        with unit_of_work():
+            battle_id = self._battle_id()
+            with battle_scope(battle_id):
+                turn = command.write_ahead()
+        try:
+            with unit_of_work():
+                with battle_scope(battle_id):
+                    return command.func(*command.args, **command.kwargs)
+        except Exception:
+            # 命令失败时工作单元已回滚，战斗停留在结算前；清除标记，以免重启后重新结算玩家已看到失败的回合
+            clear_turn_in_progress(battle_id, turn)
+            raise
+
+    def _battle_id(self) -> int:
+        battle_id = get_or_create_battle(self.battle_key)
+        if battle_id is None:
+            raise RuntimeError(f"无法为聊天 {self.battle_key} 开始战斗")
+        return battle_id
+
+    def stats(self) -> Dict[str, Any]:
+        done = self.processed + self.failed
+        return {
+            'queued': self.queued,
+            'current': self.current,
+            'processed': self.processed,
+            'failed': self.failed,
+            'max_queued': self.max_queued,
+            'avg_wait_ms': round(self.total_wait / done * 1000, 3) if done else 0.0,
+            'avg_run_ms': round(self.total_run / done * 1000, 3) if done else 0.0,
+            'commands': dict(self.command_counts),
+        }
+
+
+class BattleActorRegistry:
+    """按战斗管理执行者（只在事件循环线程中使用）"""
+
+    def __init__(self):
+        self._actors: Dict[Hashable, BattleActor] = {}
+
+    def get(self, battle_key: Hashable) -> BattleActor:
+        """获取战斗的执行者，不存在时创建并启动"""
+        actor = self._actors.get(battle_key)
+        if actor is None:
+            actor = BattleActor(battle_key, self)
+            self._actors[battle_key] = actor
+            actor.start()
+        return actor
+
+    async def submit(self, battle_key: Hashable, kind: str, func: Callable, *args, **kwargs) -> Any:
+        """向指定战斗提交命令并等待结果"""
+        return await self.get(battle_key).submit(kind, func, *args, **kwargs)
+
+    async def submit_write_ahead(self, battle_key: Hashable, kind: str, write_ahead: Callable[[], Any],
+                                 func: Callable, *args, **kwargs) -> Any:
+        """向指定战斗提交带预写步骤的命令并等待结果"""
+        return await self.get(battle_key).submit_write_ahead(kind, write_ahead, func, *args, **kwargs)
+
+    async def read(self, battle_key: Hashable, func: Callable, *args, **kwargs) -> Any:
+        """在读线程池中、在指定战斗范围内执行只读查询（不经过邮箱排队）"""
+        return await game_executor.read(_read_in_battle, battle_key, func, args, kwargs)
+
+    def _retire(self, actor: BattleActor) -> bool:
+        """空闲的执行者退出；邮箱里还有命令时不退出"""
+        if actor.queued or self._actors.get(actor.battle_key) is not actor:
+            return False
+        del self._actors[actor.battle_key]
+        return True
+
+    def stats(self) -> Dict[Hashable, Dict[str, Any]]:
+        return {battle_key: actor.stats() for battle_key, actor in self._actors.items()}
+
+    def format_stats(self) -> str:
+        """生成可读的统计文本"""
+        if not self._actors:
+            return "战斗执行者: 无"
+        lines = []
+        for battle_key, s in self.stats().items():
+            lines.append(
+                f"战斗 {battle_key}: 排队 {s['queued']} (峰值 {s['max_queued']}) | "
+                f"执行中 {s['current'] or '-'} | 完成 {s['processed']} | 失败 {s['failed']} | "
+                f"平均等待 {s['avg_wait_ms']}ms | 平均执行 {s['avg_run_ms']}ms"
+            )
+        return "\n".join(lines)
+
+
+# 全局执行者注册表
+battle_actors = BattleActorRegistry()
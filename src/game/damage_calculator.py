@@ -1,12 +1,14 @@
-import random
-import re
 import json
-from typing import List
+from typing import List, Optional, Tuple
+
+# 导入骰子公式编译缓存与批量投掷
+from game.dice import compile_dice_formula, roll, roll_formula_many, roll_groups
 
 # 导入混乱值管理器
 from character.stagger_manager import stagger_manager
 # 导入状态效果查询
 from character.status_effects import get_character_status_effects
+from game.spans import timed
 
 def parse_dice_formula(formula):
     """
@@ -20,40 +22,18 @@ def parse_dice_formula(formula):
         tuple: (base_value, dice_rolls) 
         例如: (5, [(2, 3)]) 表示基础值5，2个3面骰子
     """
-    formula = formula.strip()
-    base_value = 0
-    dice_rolls = []
-    
-    # 分割公式中的各部分（用+号分隔）
-    parts = formula.split('+')
-    
-    for part in parts:
-        part = part.strip()
-        
-        # 检查是否是骰子格式 (如 "2d3")
-        dice_match = re.match(r'(\d+)d(\d+)', part)
-        if dice_match:
-            num_dice = int(dice_match.group(1))
-            dice_faces = int(dice_match.group(2))
-            dice_rolls.append((num_dice, dice_faces))
-        else:
-            # 否则当作固定数值
-            try:
-                base_value += int(part)
-            except ValueError:
-                # 如果解析失败，忽略这部分
-                continue
-    
-    return base_value, dice_rolls
+    # 解析结果按公式缓存，见 game.dice.compile_dice_formula
+    compiled = compile_dice_formula(formula)
+    return compiled.base, [tuple(term) for term in compiled.dice]
 
 def roll_dice(num_dice, faces):
     """投掷指定数量和面数的骰子，返回总和和详细结果"""
-    results = [random.randint(1, faces) for _ in range(num_dice)]
+    results = roll(num_dice, faces)
     return sum(results), results
 
 def roll_dice_simple(num_dice, faces):
     """投掷指定数量和面数的骰子，只返回总和（向后兼容）"""
-    return sum(random.randint(1, faces) for _ in range(num_dice))
+    return sum(roll(num_dice, faces))
 
 def calculate_race_bonus(special_damage_tags, target_race_tags):
     """
@@ -93,7 +73,8 @@ def calculate_resistance_reduction(damage_type, target_resistances):
     reduction_multiplier = 1.0 - min(resistance, 0.9)  # 最多减伤90%
     return max(0.1, reduction_multiplier)  # 最少造成10%伤害
 
-def calculate_advanced_damage_modular(skill, attacker, target):
+@timed('calculate_advanced_damage')
+def calculate_advanced_damage_modular(skill, attacker, target, base_roll=None):
     """
     使用新的模块化效果系统计算技能伤害
     
@@ -101,18 +82,22 @@ def calculate_advanced_damage_modular(skill, attacker, target):
         skill (dict): 技能信息，包含damage_formula, damage_type, special_damage_tags等
         attacker (dict): 攻击者信息，包含attack等属性
         target (dict): 目标信息，包含defense, physical_resistance, magic_resistance, race_tags等
+        base_roll (tuple): 已投掷好的基础伤害 (total_damage, detail_text, dice_results_info)，
+            AOE批量投掷时传入（见 roll_base_damage_many），默认在此投掷
         
     Returns:
         tuple: (final_damage, damage_details, dice_results_info, additional_messages)
     """
     # 1. 基础伤害计算
-    base_damage, dice_detail, dice_results_info = calculate_damage_from_formula(
-        skill.get('damage_formula', '1d6'), 
-        attacker.get('id')  # 传入攻击者ID以检查麻痹状态
-    )
+    if base_roll is None:
+        base_roll = calculate_damage_from_formula(
+            skill.get('damage_formula', '1d6'), 
+            attacker.get('id')  # 传入攻击者ID以检查麻痹状态
+        )
+    base_damage, dice_detail, dice_results_info = base_roll
     
     # 2. 使用新的效果系统计算所有追加伤害
-    from special_effect_integration import effect_integration_manager
+    from special_effect_integration import get_effect_integration_manager
     
     # 构建效果上下文
     context = {
@@ -123,16 +108,15 @@ def calculate_advanced_damage_modular(skill, attacker, target):
         'skill_effects': {}
     }
     
-    # 解析技能效果
-    if skill:
-        try:
-            import json
-            context['skill_effects'] = json.loads(skill.get('effects', '{}'))
-        except (json.JSONDecodeError, TypeError):
-            context['skill_effects'] = {}
+    # 技能效果、特攻标签等使用编译缓存，不再每次解析JSON
+    from skill.skill_cache import get_compiled_skill
+    compiled_skill = get_compiled_skill(skill)
+    if compiled_skill:
+        context['skill_effects'] = compiled_skill.effects
+        context['enhancers'] = compiled_skill.enhancers
     
     # 使用效果管理器计算统一伤害
-    calculated_base, additional_damage, damage_detail, additional_messages = effect_integration_manager.calculate_unified_damage(context)
+    calculated_base, additional_damage, damage_detail, additional_messages = get_effect_integration_manager().calculate_unified_damage(context)
     
     # 提取追加伤害详情
     additional_damage_details = []
@@ -153,15 +137,7 @@ def calculate_advanced_damage_modular(skill, attacker, target):
     )
     
     # 5. 种族特攻加成
-    special_tags_str = skill.get('special_damage_tags', '{}')
-    # 处理空字符串的情况
-    if not special_tags_str or special_tags_str.strip() == '':
-        special_damage_tags = {}
-    else:
-        try:
-            special_damage_tags = json.loads(special_tags_str)
-        except json.JSONDecodeError:
-            special_damage_tags = {}
+    special_damage_tags = compiled_skill.special_damage_tags if compiled_skill else {}
     
     target_race_tags_str = target.get('race_tags', '[]')
     if not target_race_tags_str or target_race_tags_str.strip() == '':
@@ -239,6 +215,7 @@ def calculate_advanced_damage(skill, attacker, target):
     # 调用新的模块化版本
     return calculate_advanced_damage_modular(skill, attacker, target)
 
+@timed('stagger')
 def apply_damage_with_stagger(target_id: int, damage: int) -> List[str]:
     """
     应用伤害并处理混乱值
@@ -274,7 +251,8 @@ def calculate_damage_from_formula(formula, character_id=None):
     Returns:
         tuple: (total_damage, detail_text, dice_results_info)
     """
-    base_value, dice_rolls = parse_dice_formula(formula)
+    compiled = compile_dice_formula(formula)
+    base_value = compiled.base
     total_damage = base_value
     detail_parts = []
     dice_results_info = []  # 存储所有骰子结果信息
@@ -292,26 +270,36 @@ def calculate_damage_from_formula(formula, character_id=None):
         except:
             pass
     
+    if not paralyzed:
+        return damage_from_rolls(compiled, roll_groups([(term.count, term.faces) for term in compiled.dice]))
+    
     if base_value > 0:
         detail_parts.append(str(base_value))
     
     remaining_paralysis = paralysis_layers  # 剩余可用的麻痹层数
     total_dice_nullified = 0  # 总共归零的骰子数量
     
-    for num_dice, faces in dice_rolls:
+    # 先按麻痹层数确定每组被归零的骰子数，再一次性投掷所有有效骰子
+    nullified_counts = []
+    for term in compiled.dice:
         if paralyzed and remaining_paralysis > 0:
-            # 计算这组骰子中有多少会被麻痹
-            dice_to_nullify = min(num_dice, remaining_paralysis)
+            dice_to_nullify = min(term.count, remaining_paralysis)
+            remaining_paralysis -= dice_to_nullify
+        else:
+            dice_to_nullify = 0
+        nullified_counts.append(dice_to_nullify)
+    remaining_paralysis = paralysis_layers
+    
+    rolled_groups = roll_groups([(term.count - nullified, term.faces)
+                                 for term, nullified in zip(compiled.dice, nullified_counts)])
+    
+    for (num_dice, faces), dice_to_nullify, active_results in zip(compiled.dice, nullified_counts, rolled_groups):
+        if paralyzed and remaining_paralysis > 0:
+            # 这组骰子中被麻痹的数量已在投掷前确定
             dice_active = num_dice - dice_to_nullify
             
-            # 投掷剩余的有效骰子
-            if dice_active > 0:
-                active_roll_total, active_results = roll_dice(dice_active, faces)
-            else:
-                active_roll_total, active_results = 0, []
-            
             # 计算总伤害
-            roll_total = active_roll_total
+            roll_total = sum(active_results)
             
             # 构建结果数组（归零的骰子+有效的骰子）
             roll_results = [0] * dice_to_nullify + active_results
@@ -332,7 +320,8 @@ def calculate_damage_from_formula(formula, character_id=None):
             total_dice_nullified += dice_to_nullify
         else:
             # 正常投骰
-            roll_total, roll_results = roll_dice(num_dice, faces)
+            roll_results = active_results
+            roll_total = sum(roll_results)
             detail_parts.append(f"{num_dice}d{faces}({roll_total})")
         
         total_damage += roll_total
@@ -358,6 +347,54 @@ def calculate_damage_from_formula(formula, character_id=None):
     
     return total_damage, detail_text, dice_results_info
 
+def damage_from_rolls(compiled, rolled_groups) -> Tuple[int, str, list]:
+    """
+    由已投掷的骰子计算公式伤害（没有麻痹时 calculate_damage_from_formula 的结果）
+    
+    Args:
+        compiled: 编译后的骰子公式（DiceFormula）
+        rolled_groups: 每组骰子的点数列表，顺序与 compiled.dice 一致
+        
+    Returns:
+        tuple: (total_damage, detail_text, dice_results_info)
+    """
+    total_damage = compiled.base
+    detail_parts = [str(compiled.base)] if compiled.base > 0 else []
+    dice_results_info = []
+    
+    for (num_dice, faces), roll_results in zip(compiled.dice, rolled_groups):
+        roll_total = sum(roll_results)
+        detail_parts.append(f"{num_dice}d{faces}({roll_total})")
+        total_damage += roll_total
+        dice_results_info.append({
+            'num_dice': num_dice,
+            'faces': faces,
+            'results': roll_results,
+            'total': roll_total,
+            'paralyzed': False
+        })
+    
+    detail_text = " + ".join(detail_parts) if detail_parts else "0"
+    return total_damage, detail_text, dice_results_info
+
+def roll_base_damage_many(formula, times: int, character_id: Optional[int] = None) -> List[Tuple[int, str, list]]:
+    """
+    为 AOE 的多个目标一次性投掷基础伤害（一次 roll_formula_many）
+    
+    攻击者处于麻痹状态时，每个目标仍依次调用 calculate_damage_from_formula，
+    按原来的顺序逐个目标归零骰子并消耗麻痹层数。
+    
+    Returns:
+        list: 每个目标的 (total_damage, detail_text, dice_results_info)
+    """
+    if character_id is not None and any(
+        effect.effect_name == 'paralysis' for effect in get_character_status_effects(character_id)
+    ):
+        return [calculate_damage_from_formula(formula, character_id) for _ in range(times)]
+    
+    compiled = compile_dice_formula(formula)
+    return [damage_from_rolls(compiled, rolled) for rolled in roll_formula_many(compiled, times)]
+
 def calculate_attack_defense_modifier(attacker_attack, target_defense):
     """
     计算攻防差值对伤害的影响
@@ -379,7 +416,7 @@ def calculate_attack_defense_modifier(attacker_attack, target_defense):
     
     return modifier
 
-def update_character_cooldowns(character_id, skill_id):
+def update_character_cooldowns(character_id, skill_id, skill_info=None):
     """
     更新角色的技能冷却时间
     在角色的status JSON中记录各技能的冷却状态
@@ -387,6 +424,7 @@ def update_character_cooldowns(character_id, skill_id):
     Args:
         character_id (int): 角色ID
         skill_id (int): 使用的技能ID
+        skill_info (dict): 调用方已读取的技能行（可选，提供时不再查询技能）
     """
     from database.queries import get_character, update_character_status
     
@@ -415,11 +453,14 @@ def update_character_cooldowns(character_id, skill_id):
         if status['cooldowns'][skill_key] <= 0:
             del status['cooldowns'][skill_key]
     
-    # 从数据库获取当前技能的冷却时间
-    from database.queries import get_skill
-    skill = get_skill(skill_id)
-    if skill and skill['cooldown'] > 0:
-        status['cooldowns'][str(skill_id)] = skill['cooldown']
+    # 从技能缓存获取当前技能的冷却时间
+    from skill.skill_cache import skill_cache
+    if skill_info is not None and skill_info.get('id') == skill_id:
+        skill = skill_cache.resolve(skill_info)
+    else:
+        skill = skill_cache.get(skill_id)
+    if skill and skill.cooldown > 0:
+        status['cooldowns'][str(skill_id)] = skill.cooldown
     
     # 更新角色状态
     update_character_status(character_id, json.dumps(status))
@@ -0,0 +1,381 @@
+"""
+伤害分布模块
+不投骰子、不修改任何数据，解析地算出一次技能攻击的精确伤害分布，供 /preview 使用：
+
+1. 骰子公式 → 点数分布：每组 NdF 是均匀分布多项式的 N 次幂，各组之间再做卷积
+   （有NumPy时用 np.convolve）；麻痹按结算规则从前往后归零骰子，结果按 (公式, 麻痹层数) 缓存
+2. 按 calculate_advanced_damage_modular 中的确定性倍率（攻防、种族特攻、抗性、混乱）映射
+3. 经过攻击者的暴击（呼吸法）与强壮/虚弱（calculate_damage_modifiers）
+4. 经过目标的黑夜领域死亡免疫与守护/易伤/护盾（process_hit_effects），破裂伤害计入击杀概率
+
+状态附带的追加伤害按基础伤害精确计入；硬血消耗、黑夜领域条件伤害等依赖并会消耗状态，
+不计入分布，只在结果中注明。
+"""
+
+import json
+import logging
+import math
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from database.queries import get_character, get_character_by_name, get_all_skills
+from character.effect_handlers import effect_registry, EffectContext, ON_CRIT_RATE, ON_DAMAGE_CALC, ON_HIT
+from character.status_effects import get_character_status_effects
+from character.stagger_manager import stagger_manager
+from game.dice import compile_dice_formula, get_numpy
+from game.damage_calculator import (
+    calculate_attack_defense_modifier, calculate_race_bonus, calculate_resistance_reduction
+)
+from skill.skill_cache import skill_cache
+
+logger = logging.getLogger(__name__)
+
+# 会造成伤害、可以预览的技能分类
+DAMAGE_CATEGORIES = ('damage', 'aoe_damage')
+
+# 预览中显示的分位数
+PREVIEW_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+class DiceDistribution(NamedTuple):
+    """骰子公式的点数分布：probabilities[i] 为总点数等于 offset + i 的概率"""
+    offset: int
+    probabilities: Tuple[float, ...]
+
+    def as_dict(self) -> Dict[int, float]:
+        return {self.offset + i: p for i, p in enumerate(self.probabilities) if p > 0}
+
+
+# ---------- 骰子分布 ----------
+
+def _convolve(a: Sequence[float], b: Sequence[float]) -> Sequence[float]:
+    """多项式乘法（两个分布相加）"""
+    np = get_numpy()
+    if np is not None:
+        return np.convolve(a, b)
+    result = [0.0] * (len(a) + len(b) - 1)
+    for i, x in enumerate(a):
+        if x:
+            for j, y in enumerate(b):
+                result[i + j] += x * y
+    return result
+
+
+def _power(poly: Sequence[float], exponent: int) -> Sequence[float]:
+    """多项式的 exponent 次幂（快速幂）"""
+    result: Sequence[float] = [1.0]
+    while exponent > 0:
+        if exponent & 1:
+            result = _convolve(result, poly)
+        exponent >>= 1
+        if exponent:
+            poly = _convolve(poly, poly)
+    return result
+
+
+@lru_cache(maxsize=512)
+def dice_distribution(formula: str, paralysis: int = 0) -> DiceDistribution:
+    """
+    骰子公式的精确点数分布
+
+    Args:
+        formula: 骰子公式，如 "5+2d3+1d6"
+        paralysis: 攻击者的麻痹层数（按结算规则从第一组开始归零对应数量的骰子）
+    """
+    compiled = compile_dice_formula(formula)
+    remaining = max(paralysis, 0)
+    offset = compiled.base
+    poly: Sequence[float] = [1.0]
+
+    for term in compiled.dice:
+        nullified = min(term.count, remaining)
+        remaining -= nullified
+        active = term.count - nullified
+        if active <= 0 or term.faces <= 0:
+            continue
+        # 每个骰子点数为 1..faces，多项式从 x^1 开始，最小值计入 offset
+        offset += active
+        poly = _convolve(poly, _power([1.0 / term.faces] * term.faces, active))
+
+    return DiceDistribution(offset, tuple(float(p) for p in poly))
+
+
+def _map_distribution(distribution: Dict[int, float], func: Callable[[int], int]) -> Dict[int, float]:
+    """把分布中的每个伤害值经过 func 映射（相同结果的概率合并）"""
+    result: Dict[int, float] = {}
+    for damage, probability in distribution.items():
+        mapped = func(damage)
+        result[mapped] = result.get(mapped, 0.0) + probability
+    return result
+
+
+# ---------- 受击修正（process_hit_effects 中影响伤害数值的部分，不修改状态） ----------
+
+def _guard(damage: int, intensity: int) -> int:
+    return max(0, damage - int(damage * intensity * 0.1))
+
+
+def _vulnerable(damage: int, intensity: int) -> int:
+    return damage + int(damage * intensity * 0.1)
+
+
+def _shield(damage: int, intensity: int) -> int:
+    return max(0, damage - min(damage, intensity))
+
+
+HIT_DAMAGE_RULES: Dict[str, Callable[[int, int], int]] = {
+    'guard': _guard,
+    'vulnerable': _vulnerable,
+    'shield': _shield,
+}
+
+# 受击时不改变伤害数值的效果
+HIT_DAMAGE_NEUTRAL = frozenset({'rupture'})
+
+
+# ---------- 预览 ----------
+
+@dataclass
+class DamagePreview:
+    """一次攻击的伤害分布预览"""
+    attacker_name: str
+    skill_name: str
+    target_name: str
+    formula: str
+    target_health: int
+    distribution: Dict[int, float]
+    crit_chance: float = 0.0
+    paralyzed_dice: int = 0
+    rupture_damage: int = 0
+    notes: List[str] = field(default_factory=list)
+    elapsed_ms: float = 0.0
+
+    @property
+    def mean(self) -> float:
+        return sum(damage * p for damage, p in self.distribution.items())
+
+    @property
+    def stddev(self) -> float:
+        mean = self.mean
+        return math.sqrt(sum(p * (damage - mean) ** 2 for damage, p in self.distribution.items()))
+
+    @property
+    def min_damage(self) -> int:
+        return min(self.distribution, default=0)
+
+    @property
+    def max_damage(self) -> int:
+        return max(self.distribution, default=0)
+
+    def percentile(self, p: float) -> int:
+        """累计概率首次达到 p% 的伤害值"""
+        seen = 0.0
+        for damage in sorted(self.distribution):
+            seen += self.distribution[damage]
+            if seen >= p / 100 - 1e-12:
+                return damage
+        return self.max_damage
+
+    @property
+    def kill_probability(self) -> float:
+        """一击击杀目标的概率（破裂伤害在受击时先结算）"""
+        if self.target_health <= 0:
+            return 1.0
+        threshold = self.target_health - self.rupture_damage
+        return min(1.0, sum(p for damage, p in self.distribution.items() if damage >= threshold))
+
+
+def _status_additional_damage(skill_effects, base_damage: int) -> int:
+    """状态效果附带的追加伤害（与 StatusBasedDamageEnhancer 的计算一致）"""
+    total = 0
+    status_list = skill_effects.get('status') if isinstance(skill_effects, dict) else None
+    if not isinstance(status_list, list):
+        return 0
+    for status_info in status_list:
+        if isinstance(status_info, dict) and isinstance(status_info.get('additional_damage'), dict):
+            add_damage_info = status_info['additional_damage']
+            damage_percentage = add_damage_info.get('damage_percentage', 0)
+            if damage_percentage > 0:
+                total += int(base_damage * damage_percentage / 100)
+            fixed_damage = add_damage_info.get('fixed_damage', 0)
+            if fixed_damage > 0:
+                total += fixed_damage
+    return total
+
+
+def _parse_race_tags(raw) -> List[str]:
+    """解析目标的种族标签（与 calculate_advanced_damage_modular 一致）"""
+    if not raw or not str(raw).strip():
+        return []
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        return []
+
+
+def preview_damage(attacker_id: int, skill_id: int, target_id: int) -> DamagePreview:
+    """
+    计算攻击者用指定技能攻击目标时的伤害分布（只读，不修改任何数据）
+
+    Raises:
+        ValueError: 角色或技能不存在、技能不造成伤害
+    """
+    started = time.perf_counter()
+
+    attacker = get_character(attacker_id)
+    target = get_character(target_id)
+    if not attacker or not target:
+        raise ValueError("找不到攻击者或目标角色")
+    skill = skill_cache.get(skill_id)
+    if not skill:
+        raise ValueError("找不到该技能")
+    if skill.skill_category not in DAMAGE_CATEGORIES:
+        raise ValueError(f"技能「{skill.name}」不造成伤害，无法预览")
+
+    notes = []
+    attacker_effects = get_character_status_effects(attacker_id)
+    target_effects = get_character_status_effects(target_id)
+
+    # 1. 骰子分布（麻痹只取第一条麻痹效果的强度，与结算一致）
+    paralysis = next((effect.intensity for effect in attacker_effects if effect.effect_name == 'paralysis'), 0)
+    compiled_formula = skill.formula
+    distribution = dice_distribution(compiled_formula.source, paralysis).as_dict()
+    paralyzed_dice = min(paralysis, compiled_formula.dice_count)
+
+    # 状态附带的追加伤害只取决于基础伤害，可以精确计入；其他增强器依赖并消耗状态，只作提示
+    if 'status_based_damage' in skill.enhancers:
+        distribution = _map_distribution(distribution,
+                                         lambda damage: damage + _status_additional_damage(skill.effects, damage))
+    skipped = [name for name in skill.enhancers if name != 'status_based_damage']
+    if skipped:
+        notes.append("技能含追加伤害效果（" + "、".join(skipped) + "），预览未计入")
+
+    # 2. 确定性倍率
+    multiplier = (
+        calculate_attack_defense_modifier(attacker.get('attack', 10), target.get('defense', 5))
+        * calculate_race_bonus(skill.special_damage_tags, _parse_race_tags(target.get('race_tags', '[]')))
+        * calculate_resistance_reduction(skill.damage_type, {
+            'physical': target.get('physical_resistance', 0.0),
+            'magic': target.get('magic_resistance', 0.0)
+        })
+        * stagger_manager.get_stagger_damage_multiplier(target_id)
+    )
+    distribution = _map_distribution(distribution, lambda damage: max(int(damage * multiplier), 1))
+
+    # 3. 攻击者的暴击率和伤害修正（这两类处理函数只修改上下文，可以直接复用）
+    attacker_buckets = effect_registry.bucket(attacker_effects, (ON_CRIT_RATE, ON_DAMAGE_CALC))
+    crit_rate = effect_registry.dispatch(ON_CRIT_RATE, EffectContext(attacker), attacker_buckets[ON_CRIT_RATE]).crit_rate
+    crit_chance = min(max(crit_rate, 0), 100) / 100
+    if crit_chance > 0:
+        crit_distribution: Dict[int, float] = {}
+        for damage, p in distribution.items():
+            crit_distribution[damage] = crit_distribution.get(damage, 0.0) + p * (1 - crit_chance)
+            crit_damage = int(damage * 1.2)
+            crit_distribution[crit_damage] = crit_distribution.get(crit_damage, 0.0) + p * crit_chance
+        distribution = crit_distribution
+
+    damage_calc_effects = attacker_buckets[ON_DAMAGE_CALC]
+    if damage_calc_effects:
+        distribution = _map_distribution(distribution, lambda damage: effect_registry.dispatch(
+            ON_DAMAGE_CALC, EffectContext(attacker, damage), damage_calc_effects).damage)
+
+    # 4. 目标的受击修正
+    target_health = target['health']
+    death_immune = any(effect.effect_name == 'dark_domain' and effect.duration > 0 for effect in target_effects)
+    hit_effects = effect_registry.bucket(target_effects, (ON_HIT,))[ON_HIT]
+    rupture_damage = sum(effect.intensity for effect in hit_effects if effect.effect_name == 'rupture')
+    unknown = sorted({effect.effect_name for effect in hit_effects
+                      if effect.effect_name not in HIT_DAMAGE_RULES and effect.effect_name not in HIT_DAMAGE_NEUTRAL})
+    if unknown:
+        notes.append("目标的受击效果（" + "、".join(unknown) + "）未计入")
+    if death_immune:
+        notes.append("目标处于黑夜领域，致命伤害会被免疫")
+
+    def apply_hit(damage: int) -> int:
+        if death_immune and target_health - damage <= 0:
+            return 0
+        for effect in hit_effects:
+            rule = HIT_DAMAGE_RULES.get(effect.effect_name)
+            if rule is not None:
+                damage = rule(damage, effect.intensity)
+        return damage
+
+    if death_immune or hit_effects:
+        distribution = _map_distribution(distribution, apply_hit)
+
+    return DamagePreview(
+        attacker_name=attacker['name'],
+        skill_name=skill.name,
+        target_name=target['name'],
+        formula=compiled_formula.source,
+        target_health=target_health,
+        distribution=distribution,
+        crit_chance=crit_chance,
+        paralyzed_dice=paralyzed_dice,
+        rupture_damage=0 if death_immune else rupture_damage,
+        notes=notes,
+        elapsed_ms=(time.perf_counter() - started) * 1000,
+    )
+
+
+def format_preview(preview: DamagePreview) -> str:
+    """生成预览消息"""
+    lines = [f"🎲 伤害预览: {preview.attacker_name} 的「{preview.skill_name}」→ {preview.target_name}", ""]
+
+    formula = f"公式: {preview.formula}"
+    if preview.paralyzed_dice:
+        formula += f"（麻痹归零 {preview.paralyzed_dice} 个骰子）"
+    lines.append(formula)
+    lines.append(f"伤害: {preview.min_damage} ~ {preview.max_damage}，"
+                 f"期望 {preview.mean:.1f}，标准差 {preview.stddev:.1f}")
+    lines.append("分位数: " + " | ".join(f"P{p} {preview.percentile(p)}" for p in PREVIEW_PERCENTILES))
+    if preview.crit_chance > 0:
+        lines.append(f"暴击率: {preview.crit_chance:.0%}")
+    if preview.rupture_damage:
+        lines.append(f"破裂: 受击时额外受到 {preview.rupture_damage} 点伤害")
+    lines.append(f"目标生命: {preview.target_health}，一击击杀概率: {preview.kill_probability:.1%}")
+
+    if preview.notes:
+        lines.append("")
+        lines.extend(f"注: {note}" for note in preview.notes)
+    lines.append(f"\n（计算用时 {preview.elapsed_ms:.1f}ms）")
+    return "\n".join(lines)
+
+
+# ---------- 命令参数解析 ----------
+
+def _resolve_character(text: str) -> Optional[Dict]:
+    """按ID或名称查找角色"""
+    if text.isdigit():
+        return get_character(int(text))
+    return get_character_by_name(text)
+
+
+def _resolve_skill_id(text: str) -> Optional[int]:
+    """按ID或名称查找技能"""
+    if text.isdigit():
+        return int(text)
+    for skill in get_all_skills():
+        if skill['name'] == text:
+            return skill['id']
+    return None
+
+
+def build_preview_message(attacker_text: str, skill_text: str, target_text: str) -> str:
+    """/preview 命令：按ID或名称解析参数并生成预览消息"""
+    attacker = _resolve_character(attacker_text)
+    if not attacker:
+        return f"找不到攻击者 '{attacker_text}'。"
+    target = _resolve_character(target_text)
+    if not target:
+        return f"找不到目标 '{target_text}'。"
+    skill_id = _resolve_skill_id(skill_text)
+    if skill_id is None:
+        return f"找不到技能 '{skill_text}'。"
+
+    try:
+        return format_preview(preview_damage(attacker['id'], skill_id, target['id']))
+    except ValueError as e:
+        return str(e)
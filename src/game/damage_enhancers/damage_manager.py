@@ -102,7 +102,12 @@ class DamageEnhancerManager:
         damage_details = []
         messages = []
         
+        # 上下文中带有编译技能的增强器列表时，只检查这些增强器
+        enabled = context.get('enhancers')
+        
         for enhancer in self.enhancers:
+            if enabled is not None and enhancer.name not in enabled:
+                continue
             if enhancer.can_apply(context):
                 additional_damage, damage_detail, enhancer_messages = enhancer.calculate_additional_damage(context)
                 
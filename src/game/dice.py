@@ -0,0 +1,211 @@
+"""
+骰子模块
+负责骰子公式的编译缓存与批量投掷
+
+- compile_dice_formula: 把 "5+2d3+1d6" 这样的公式编译成不可变的 DiceFormula，按公式字符串做LRU缓存
+- roll_groups: 一次调用投掷多组骰子（安装了NumPy且骰子数量较多时使用向量化实现）
+- roll_formula_many: 为多个独立目标（AOE）或模拟器一次性投掷同一公式
+
+NumPy 只在第一次需要向量化投掷时导入（见 get_numpy），普通的小规模投掷不会拖慢启动。
+"""
+
+import random
+import re
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+# 骰子项格式，如 "2d3"（与原解析逻辑一致，只匹配开头）
+_DICE_TERM = re.compile(r'(\d+)d(\d+)')
+
+# 单次投掷的骰子数达到该值时才使用NumPy（数量太少时Python更快）
+NUMPY_MIN_DICE = 64
+
+_numpy = None
+_numpy_checked = False
+_np_rng = None
+_np_seed: Optional[int] = None
+
+
+def get_numpy():
+    """导入并返回NumPy（首次调用时导入）；NumPy为可选依赖，没有时返回None，调用方使用纯Python实现"""
+    global _numpy, _numpy_checked
+    if not _numpy_checked:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy = numpy
+        _numpy_checked = True
+    return _numpy
+
+
+def _get_np_rng():
+    """NumPy随机数生成器（首次使用时按 seed_dice 设置的种子创建），没有NumPy时返回None"""
+    global _np_rng
+    if _np_rng is None:
+        np = get_numpy()
+        if np is not None:
+            _np_rng = np.random.default_rng(_np_seed)
+    return _np_rng
+
+
+class DiceTerm(NamedTuple):
+    """一组骰子，如 2d3 -> DiceTerm(2, 3)"""
+    count: int
+    faces: int
+
+
+class DiceFormula(NamedTuple):
+    """编译后的骰子公式"""
+    source: str
+    base: int
+    dice: Tuple[DiceTerm, ...]
+
+    @property
+    def dice_count(self) -> int:
+        """公式中骰子的总个数"""
+        return sum(term.count for term in self.dice)
+
+    @property
+    def min_value(self) -> int:
+        return self.base + self.dice_count
+
+    @property
+    def max_value(self) -> int:
+        return self.base + sum(term.count * term.faces for term in self.dice)
+
+
+@lru_cache(maxsize=1024)
+def compile_dice_formula(formula: str) -> DiceFormula:
+    """
+    编译骰子公式（结果按公式字符串缓存）
+
+    支持 "5+2d3"、"1d6"、"10"、"3d4+2" 等格式，用+号分隔；
+    无法识别的部分会被忽略。
+    """
+    base_value = 0
+    dice = []
+
+    for part in formula.strip().split('+'):
+        part = part.strip()
+
+        dice_match = _DICE_TERM.match(part)
+        if dice_match:
+            dice.append(DiceTerm(int(dice_match.group(1)), int(dice_match.group(2))))
+        else:
+            try:
+                base_value += int(part)
+            except ValueError:
+                continue
+
+    return DiceFormula(formula, base_value, tuple(dice))
+
+
+def seed_dice(seed: Optional[int] = None):
+    """设置骰子随机种子（模拟器、基准测试复现结果用）"""
+    global _np_rng, _np_seed
+    random.seed(seed)
+    _np_seed = seed
+    _np_rng = None
+
+
+def roll(num_dice: int, faces: int) -> List[int]:
+    """投掷一组骰子，返回每个骰子的点数"""
+    if num_dice <= 0:
+        return []
+    if num_dice >= NUMPY_MIN_DICE:
+        rng = _get_np_rng()
+        if rng is not None:
+            return rng.integers(1, faces + 1, size=num_dice).tolist()
+    rand = random.random
+    return [int(rand() * faces) + 1 for _ in range(num_dice)]
+
+
+def roll_groups(groups: Sequence[Tuple[int, int]]) -> List[List[int]]:
+    """
+    一次投掷多组骰子
+
+    Args:
+        groups: [(骰子个数, 面数), ...]
+
+    Returns:
+        每组骰子的点数列表，顺序与groups一致
+    """
+    rng = None
+    if sum(count for count, _ in groups if count > 0) >= NUMPY_MIN_DICE:
+        rng = _get_np_rng()
+    if rng is None:
+        rand = random.random
+        return [[int(rand() * f) + 1 for _ in range(count)] for count, f in groups]
+
+    np = get_numpy()
+    counts = [max(count, 0) for count, _ in groups]
+    faces = np.repeat([f for _, f in groups], counts)
+    flat = ((rng.random(len(faces)) * faces).astype(np.int64) + 1).tolist()
+
+    results = []
+    offset = 0
+    for count in counts:
+        results.append(flat[offset:offset + count])
+        offset += count
+    return results
+
+
+def roll_formula_many(formula, times: int) -> List[List[List[int]]]:
+    """
+    对同一公式进行多次独立投掷（AOE的每个目标、模拟器的每次试验）
+
+    Args:
+        formula: 公式字符串或已编译的DiceFormula
+        times: 投掷次数
+
+    Returns:
+        results[i][j] 为第i次投掷中第j组骰子的点数列表
+    """
+    compiled = formula if isinstance(formula, DiceFormula) else compile_dice_formula(formula)
+    groups = [(term.count, term.faces) for term in compiled.dice]
+    per_roll = compiled.dice_count
+
+    if times <= 0:
+        return []
+    if per_roll == 0:
+        return [[[] for _ in groups] for _ in range(times)]
+
+    rng = _get_np_rng() if per_roll * times >= NUMPY_MIN_DICE else None
+    if rng is not None:
+        np = get_numpy()
+        faces = np.repeat([term.faces for term in compiled.dice], [term.count for term in compiled.dice])
+        matrix = (rng.random((times, per_roll)) * faces).astype(np.int64) + 1
+        rows = matrix.tolist()
+    else:
+        rand = random.random
+        flat_faces = [term.faces for term in compiled.dice for _ in range(term.count)]
+        rows = [[int(rand() * f) + 1 for f in flat_faces] for _ in range(times)]
+
+    results = []
+    for row in rows:
+        split = []
+        offset = 0
+        for count, _ in groups:
+            split.append(row[offset:offset + count])
+            offset += count
+        results.append(split)
+    return results
+
+
+def roll_totals_array(formula, times: int):
+    """
+    对同一公式投掷多次，只返回每次的总点数（含基础值）
+
+    有NumPy时返回ndarray，否则返回list，供模拟器做大规模统计。
+    """
+    compiled = formula if isinstance(formula, DiceFormula) else compile_dice_formula(formula)
+    rng = _get_np_rng()
+    if rng is not None:
+        np = get_numpy()
+        totals = np.full(times, compiled.base, dtype=np.int64)
+        for term in compiled.dice:
+            if term.count > 0:
+                totals += rng.integers(1, term.faces + 1, size=(times, term.count)).sum(axis=1)
+        return totals
+    return [compiled.base + sum(sum(group) for group in rolled) for rolled in roll_formula_many(compiled, times)]
@@ -0,0 +1,159 @@
+"""
+游戏执行器模块
+把阻塞的只读数据库访问从 asyncio 事件循环中移出：读通道是一个线程池，
+用于生成键盘、列出角色等只读查询，可以并发执行。
+
+会修改战斗数据的操作（技能结算、回合结束等）不经过这里，而是交给每场战斗的执行者
+（见 game.battle_actor），同一场战斗的修改在执行者中按到达顺序串行执行。
+
+处理函数中使用：
+
+    skills = await game_executor.read(get_character_skills, attacker_id)
+
+读通道的排队深度、执行次数和耗时可通过 game_executor.stats() 查看。
+"""
+
+import asyncio
+import atexit
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 读线程池的默认线程数（SQLite读并发有限，不需要太多）
+DEFAULT_READ_WORKERS = 4
+
+READER_THREAD_NAME = 'game-reader'
+
+
+class _LaneStats:
+    """单个通道的统计信息"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.max_queued = 0
+        self.total_wait = 0.0
+        self.total_run = 0.0
+        self.max_wait = 0.0
+
+    def submitted(self):
+        with self._lock:
+            self.queued += 1
+            if self.queued > self.max_queued:
+                self.max_queued = self.queued
+
+    def started(self, wait: float):
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.total_wait += wait
+            if wait > self.max_wait:
+                self.max_wait = wait
+
+    def finished(self, run: float, ok: bool):
+        with self._lock:
+            self.running -= 1
+            self.total_run += run
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            done = self.completed + self.failed
+            return {
+                'queued': self.queued,
+                'running': self.running,
+                'completed': self.completed,
+                'failed': self.failed,
+                'max_queued': self.max_queued,
+                'avg_wait_ms': round(self.total_wait / done * 1000, 3) if done else 0.0,
+                'max_wait_ms': round(self.max_wait * 1000, 3),
+                'avg_run_ms': round(self.total_run / done * 1000, 3) if done else 0.0,
+            }
+
+
+class GameExecutor:
+    """只读查询的线程池执行器"""
+
+    def __init__(self, read_workers: int = DEFAULT_READ_WORKERS):
+        self.read_workers = read_workers
+        self._lock = threading.Lock()
+        self._reader: Optional[ThreadPoolExecutor] = None
+        self._reader_stats = _LaneStats()
+
+    # ---------- 线程池 ----------
+
+    def _get_reader(self) -> ThreadPoolExecutor:
+        if self._reader is None:
+            with self._lock:
+                if self._reader is None:
+                    self._reader = ThreadPoolExecutor(max_workers=self.read_workers,
+                                                      thread_name_prefix=READER_THREAD_NAME)
+        return self._reader
+
+    # ---------- 提交 ----------
+
+    @staticmethod
+    def _wrap(stats: _LaneStats, func: Callable, args, kwargs) -> Callable[[], Any]:
+        """包装任务：记录排队/执行耗时，并在调用方的上下文中执行"""
+        ctx = contextvars.copy_context()
+        submitted_at = time.perf_counter()
+        stats.submitted()
+
+        def run():
+            started_at = time.perf_counter()
+            stats.started(started_at - submitted_at)
+            ok = False
+            try:
+                result = ctx.run(func, *args, **kwargs)
+                ok = True
+                return result
+            finally:
+                stats.finished(time.perf_counter() - started_at, ok)
+
+        return run
+
+    def submit_read(self, func: Callable, *args, **kwargs) -> Future:
+        """提交读任务（同步接口），返回 concurrent.futures.Future"""
+        return self._get_reader().submit(self._wrap(self._reader_stats, func, args, kwargs))
+
+    async def read(self, func: Callable, *args, **kwargs) -> Any:
+        """在读线程池中执行 func 并等待结果"""
+        return await asyncio.wrap_future(self.submit_read(func, *args, **kwargs))
+
+    # ---------- 统计与关闭 ----------
+
+    def stats(self) -> Dict[str, Any]:
+        """读通道的排队深度、执行次数与平均耗时"""
+        return self._reader_stats.snapshot()
+
+    def format_stats(self) -> str:
+        """生成可读的统计文本"""
+        s = self.stats()
+        return (
+            f"读通道: 排队 {s['queued']} (峰值 {s['max_queued']}) | 执行中 {s['running']} | "
+            f"完成 {s['completed']} | 失败 {s['failed']} | "
+            f"平均等待 {s['avg_wait_ms']}ms (最大 {s['max_wait_ms']}ms) | 平均执行 {s['avg_run_ms']}ms"
+        )
+
+    def shutdown(self, wait: bool = True):
+        """关闭线程池（进程退出时自动调用）"""
+        with self._lock:
+            reader, self._reader = self._reader, None
+        if reader is not None:
+            reader.shutdown(wait=wait)
+
+
+# 全局执行器实例
+game_executor = GameExecutor()
+atexit.register(game_executor.shutdown)
@@ -0,0 +1,447 @@
+"""
+回放式压测工具（离线命令行工具）
+
+不联网地驱动真实的攻击会话处理器（get_attack_conv_handler / get_enemy_attack_conv_handler），
+测量多名玩家同时点按钮时每个处理函数的延迟和吞吐：
+
+    cd src
+    python -m game.load_test --players 50 --chats 10 --flows 20
+
+- 机器人的 HTTP 层换成 RecordingRequest：不发出任何网络请求，记录 sendMessage /
+  editMessageText / answerCallbackQuery 等调用并返回伪造的成功响应
+- 每名玩家在自己的协程中按脚本执行完整流程：/attack（或 /enemy）→ 选角色 → 选技能 → 选目标，
+  每一步从机器人上一条消息的键盘中随机点一个按钮，构造对应的 Update 交给 Application 处理
+- 友方攻击会话按聊天区分（per_user=False），同一聊天中的 /attack 流程依次进行；
+  敌方攻击会话按用户区分，同一聊天的多名玩家可以同时操作
+- 没有可行动的角色时由该玩家结束回合（与 /end_turn 相同，经战斗执行者排队）
+
+数据库只使用副本：副本中原有角色全部撤出战斗，再为每个聊天创建一场战斗和一组带技能的角色。
+"""
+
+import argparse
+import asyncio
+import contextvars
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import tempfile
+import time
+import warnings
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from telegram import Update
+from telegram.ext import Application
+from telegram.request import BaseRequest, RequestData
+from telegram.warnings import PTBUserWarning
+
+import database.db_connection as db_connection
+from database.battles import battle_scope, get_or_create_battle
+from database.db_connection import backup_database, get_db_connection
+from database.db_migration import run_migrations
+from database.log_sink import log_sink
+from database.queries import (
+    add_skill_to_character, create_character, reset_all_characters, set_character_battle_status
+)
+from game.attack import get_attack_conv_handler, get_enemy_attack_conv_handler
+from game.battle_actor import battle_actors
+from game.turn_manager import turn_manager
+
+logger = logging.getLogger(__name__)
+
+# 输出的分位数
+PERCENTILES = (50, 95, 99)
+
+# 一次流程最多点击的按钮数（防止键盘异常时死循环）
+MAX_STEPS = 6
+
+# 压测用的假令牌（只用于拼接 API 地址，不会发出请求）
+FAKE_TOKEN = '123456:LOADTEST'
+
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'DewBot', 'username': 'dewbot_load_test'}
+
+# 压测角色使用的技能 (名称, 冷却, 伤害公式, 效果, 伤害类型, 技能类别)
+LOAD_TEST_SKILLS = (
+    ('压测·重击', 0, '1d6', {}, 'physical', 'damage'),
+    ('压测·火球', 2, '5+2d3+1d6',
+     {"status": [{"effect": "burn", "value": 3, "turns": 2, "target": "skill_target"}]}, 'magic', 'damage'),
+    ('压测·横扫', 1, '2d6',
+     {"status": [{"effect": "rupture", "value": 2, "turns": 3, "target": "all_enemies"}]}, 'physical', 'aoe_damage'),
+    ('压测·群疗', 1, '1d8', {}, 'magic', 'aoe_healing'),
+    ('压测·血刃', 0, '1d10',
+     {"hardblood_consume": {"max_consume": 5, "damage_per_point": 2},
+      "status": [{"effect": "hardblood", "value": 4, "turns": 999, "target": "self"}]}, 'physical', 'damage'),
+    ('压测·守护', 0, '0',
+     {"buff": {"type": "shield", "intensity": 8, "duration": 3, "target": "skill_target"}}, 'magic', 'buff'),
+    ('压测·麻痹针', 0, '1d4',
+     {"debuff": {"type": "paralysis", "intensity": 2, "duration": 2, "target": "skill_target"}}, 'physical', 'debuff'),
+)
+
+# 命令 / 回调数据前缀 -> 处理函数名称
+HANDLER_NAMES = {
+    'attack': 'start_attack',
+    'attacker': 'select_attacker',
+    'skill': 'select_skill',
+    'target': 'select_target',
+    'enemy': 'start_enemy_attack',
+    'enemy_attacker': 'enemy_select_attacker',
+    'enemy_skill': 'enemy_select_skill',
+    'enemy_target': 'enemy_select_target',
+}
+
+# 当前正在处理的更新产生的机器人调用
+_update_calls: contextvars.ContextVar[Optional[List['BotCall']]] = contextvars.ContextVar('update_calls', default=None)
+
+
+@dataclass
+class BotCall:
+    """机器人发出的一次 API 调用"""
+    method: str
+    chat_id: Optional[int]
+    message_id: Optional[int]
+    text: Optional[str]
+    buttons: Tuple[str, ...] = ()
+
+
+def _callback_buttons(reply_markup) -> Tuple[str, ...]:
+    """取出内联键盘上所有按钮的回调数据"""
+    if not reply_markup:
+        return ()
+    if isinstance(reply_markup, str):
+        reply_markup = json.loads(reply_markup)
+    return tuple(
+        button['callback_data']
+        for row in reply_markup.get('inline_keyboard', ())
+        for button in row
+        if button.get('callback_data')
+    )
+
+
+class RecordingRequest(BaseRequest):
+    """代替 HTTPXRequest 的桩：记录机器人发出的调用并返回伪造的成功响应，不联网"""
+
+    def __init__(self):
+        self.calls: List[BotCall] = []
+        self._message_ids = itertools.count(1)
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        api_method = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data is not None else {}
+
+        message_id = params.get('message_id')
+        if api_method == 'sendMessage':
+            message_id = next(self._message_ids)
+        call = BotCall(api_method, params.get('chat_id'), message_id, params.get('text'),
+                       _callback_buttons(params.get('reply_markup')))
+        self.calls.append(call)
+        sink = _update_calls.get()
+        if sink is not None:
+            sink.append(call)
+
+        if api_method == 'getMe':
+            result = BOT_USER
+        elif api_method in ('sendMessage', 'editMessageText'):
+            result = {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': call.chat_id, 'type': 'group', 'title': f"压测 {call.chat_id}"},
+                'from': BOT_USER,
+                'text': call.text or '',
+            }
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode('utf-8')
+
+
+# ---------- 构造更新 ----------
+
+@dataclass
+class Player:
+    """一名虚拟玩家"""
+    user_id: int
+    chat_id: int
+
+    @property
+    def user(self) -> Dict:
+        return {'id': self.user_id, 'is_bot': False, 'first_name': f"玩家{self.user_id}"}
+
+    @property
+    def chat(self) -> Dict:
+        return {'id': self.chat_id, 'type': 'group', 'title': f"压测 {self.chat_id}"}
+
+
+_update_ids = itertools.count(1)
+
+
+def command_update(bot, player: Player, command: str) -> Update:
+    """玩家在群里发送命令"""
+    text = f"/{command}"
+    return Update.de_json({
+        'update_id': next(_update_ids),
+        'message': {
+            'message_id': next(_update_ids),
+            'date': int(time.time()),
+            'chat': player.chat,
+            'from': player.user,
+            'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text)}],
+        },
+    }, bot)
+
+
+def callback_update(bot, player: Player, message_id: int, data: str) -> Update:
+    """玩家点击机器人消息上的按钮"""
+    update_id = next(_update_ids)
+    return Update.de_json({
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': player.user,
+            'chat_instance': str(player.chat_id),
+            'data': data,
+            'message': {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': player.chat,
+                'from': BOT_USER,
+                'text': '',
+            },
+        },
+    }, bot)
+
+
+# ---------- 压测 ----------
+
+@dataclass
+class LoadTestReport:
+    """压测结果"""
+    latencies: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(list))
+    flows: int = 0
+    unanswered: int = 0
+    bot_calls: int = 0
+    elapsed: float = 0.0
+
+    def record(self, handler: str, seconds: float):
+        self.latencies[handler].append(seconds)
+
+
+def percentile(sorted_values: Sequence[float], p: float) -> float:
+    """最近秩法求分位数（输入需已排序）"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class LoadTest:
+    """按脚本让多名玩家同时走完攻击流程"""
+
+    def __init__(self, application: Application, rng: random.Random, enemy_ratio: float):
+        self.application = application
+        self.rng = rng
+        self.enemy_ratio = enemy_ratio
+        self.report = LoadTestReport()
+        # 友方攻击会话按聊天区分，同一聊天同时只能进行一个
+        self._attack_locks: Dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    async def _send(self, handler: str, update: Update) -> Optional[BotCall]:
+        """处理一个更新并计时，返回机器人回复或编辑的最后一条消息"""
+        calls: List[BotCall] = []
+        token = _update_calls.set(calls)
+        started = time.perf_counter()
+        try:
+            await self.application.process_update(update)
+        finally:
+            self.report.record(handler, time.perf_counter() - started)
+            _update_calls.reset(token)
+        replies = [call for call in calls if call.method in ('sendMessage', 'editMessageText')]
+        if not replies:
+            self.report.unanswered += 1
+            return None
+        return replies[-1]
+
+    async def _end_turn(self, player: Player):
+        started = time.perf_counter()
+        await battle_actors.submit_write_ahead(player.chat_id, 'end_turn',
+                                               turn_manager.begin_turn, turn_manager.end_turn)
+        self.report.record('end_turn', time.perf_counter() - started)
+
+    async def run_flow(self, player: Player, command: str):
+        """走完一次 /attack 或 /enemy 流程：每一步随机点击上一条消息上的按钮"""
+        bot = self.application.bot
+        self.report.flows += 1
+        reply = await self._send(HANDLER_NAMES[command], command_update(bot, player, command))
+        if reply is not None and not reply.buttons:
+            # 没有可行动的角色：结束回合
+            await self._end_turn(player)
+            return
+
+        for _ in range(MAX_STEPS):
+            if reply is None or not reply.buttons:
+                break
+            data = self.rng.choice(reply.buttons)
+            prefix = data.rsplit('_', 1)[0]
+            reply = await self._send(HANDLER_NAMES.get(prefix, prefix),
+                                     callback_update(bot, player, reply.message_id, data))
+
+    async def run_player(self, player: Player, flows: int):
+        for _ in range(flows):
+            if self.rng.random() < self.enemy_ratio:
+                await self.run_flow(player, 'enemy')
+            else:
+                async with self._attack_locks[player.chat_id]:
+                    await self.run_flow(player, 'attack')
+
+    async def run(self, players: Sequence[Player], flows: int) -> LoadTestReport:
+        started = time.perf_counter()
+        await asyncio.gather(*(self.run_player(player, flows) for player in players))
+        self.report.elapsed = time.perf_counter() - started
+        return self.report
+
+
+# ---------- 场景 ----------
+
+def _insert_skills() -> List[int]:
+    """在副本中添加压测技能，返回技能ID"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        skill_ids = []
+        for name, cooldown, formula, effects, damage_type, category in LOAD_TEST_SKILLS:
+            cursor.execute(
+                """INSERT INTO skills (name, description, cooldown, damage_formula, effects, damage_type, skill_category)
+                   VALUES (?, '压测技能', ?, ?, ?, ?, ?)""",
+                (name, cooldown, formula, json.dumps(effects, ensure_ascii=False), damage_type, category)
+            )
+            skill_ids.append(cursor.lastrowid)
+        conn.commit()
+        return skill_ids
+    except Exception as e:
+        logger.error(f"添加压测技能时出错: {e}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def seed_battles(chat_ids: Sequence[int], friendly: int, enemies: int, health: int):
+    """撤出副本中原有的参战角色，为每个聊天创建一场战斗和一组角色"""
+    reset_all_characters()
+    skill_ids = _insert_skills()
+    for chat_id in chat_ids:
+        with battle_scope(get_or_create_battle(chat_id)):
+            for character_type, count in (('friendly', friendly), ('enemy', enemies)):
+                for index in range(count):
+                    character_id = create_character(f"{character_type}{chat_id}-{index}", character_type,
+                                                    health=health, attack=12, defense=6, actions_per_turn=2)
+                    for skill_id in skill_ids:
+                        add_skill_to_character(character_id, skill_id)
+                    set_character_battle_status(character_id, True)
+
+
+async def run_load_test(players: Sequence[Player], flows: int, enemy_ratio: float,
+                        seed: Optional[int]) -> LoadTestReport:
+    """搭建只带攻击会话处理器的 Application 并运行压测"""
+    request = RecordingRequest()
+    application = (
+        Application.builder()
+        .token(FAKE_TOKEN)
+        .request(request)
+        .get_updates_request(RecordingRequest())
+        .build()
+    )
+    application.add_handler(get_attack_conv_handler())
+    application.add_handler(get_enemy_attack_conv_handler())
+
+    await application.initialize()
+    try:
+        report = await LoadTest(application, random.Random(seed), enemy_ratio).run(players, flows)
+    finally:
+        await application.shutdown()
+    report.bot_calls = len(request.calls)
+    return report
+
+
+def format_report(report: LoadTestReport) -> str:
+    """生成按处理函数统计的延迟和吞吐表"""
+    header = f"{'处理函数':<24} {'次数':>7}" + "".join(f" {'P' + str(p) + '(ms)':>10}" for p in PERCENTILES)
+    header += f" {'最大(ms)':>10} {'吞吐(次/秒)':>12}"
+    lines = [header, '-' * len(header)]
+
+    elapsed = max(report.elapsed, 1e-9)
+    total = 0
+    for handler in sorted(report.latencies):
+        values = sorted(report.latencies[handler])
+        total += len(values)
+        row = f"{handler:<24} {len(values):>7}"
+        row += "".join(f" {percentile(values, p) * 1000:>10.2f}" for p in PERCENTILES)
+        row += f" {values[-1] * 1000:>10.2f} {len(values) / elapsed:>12.1f}"
+        lines.append(row)
+
+    lines.append('')
+    lines.append(f"共 {report.flows} 次流程、{total} 个更新，用时 {report.elapsed:.2f} 秒"
+                 f"（{report.flows / elapsed:.1f} 流程/秒，{total / elapsed:.1f} 更新/秒）")
+    lines.append(f"机器人调用 {report.bot_calls} 次，无回复的更新 {report.unanswered} 个")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="攻击会话回放压测")
+    parser.add_argument('--db', help="源数据库路径（默认使用机器人数据库，只读取副本）")
+    parser.add_argument('--players', type=int, default=50, help="同时操作的玩家数")
+    parser.add_argument('--chats', type=int, default=10, help="聊天（战斗）数，玩家轮流分配到各聊天")
+    parser.add_argument('--flows', type=int, default=10, help="每名玩家执行的流程数")
+    parser.add_argument('--enemy-ratio', type=float, default=0.5, help="/enemy 流程所占比例")
+    parser.add_argument('--friendly', type=int, default=4, help="每场战斗的友方角色数")
+    parser.add_argument('--enemies', type=int, default=4, help="每场战斗的敌方角色数")
+    parser.add_argument('--health', type=int, default=100000, help="角色生命值（足够大时压测中不会有角色倒下）")
+    parser.add_argument('--seed', type=int, default=None, help="随机种子（按钮选择）")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    # 会话处理器的 per_message 提示与压测无关
+    warnings.filterwarnings('ignore', category=PTBUserWarning)
+
+    source_db = args.db or db_connection.DB_PATH
+    if not os.path.exists(source_db):
+        parser.error(f"数据库不存在: {source_db}")
+
+    chat_ids = [-1000000 - i for i in range(max(args.chats, 1))]
+    players = [Player(user_id=100000 + i, chat_id=chat_ids[i % len(chat_ids)]) for i in range(args.players)]
+
+    original_db_path = db_connection.DB_PATH
+    work_dir = tempfile.mkdtemp(prefix='dewbot-load-')
+    try:
+        db_connection.configure(backup_database(source_db, os.path.join(work_dir, 'load.db')))
+        run_migrations()
+        seed_battles(chat_ids, args.friendly, args.enemies, args.health)
+        report = asyncio.run(run_load_test(players, args.flows, args.enemy_ratio, args.seed))
+    finally:
+        # 压测出错时也先写完排队的日志，再切回原数据库
+        log_sink.flush()
+        db_connection.configure(original_db_path)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(format_report(report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,385 @@
+"""
+技能伤害模拟器（离线命令行工具）
+
+在数据库副本上反复结算"攻击者 → 目标"的技能伤害，统计期望、方差、分位数和击杀概率，
+用于新技能/人格上线前的数值平衡。不依赖Telegram，可在没有机器人的环境中运行：
+
+    cd src
+    python -m game.simulator --attacker 1 --target 41 --skill 2 --skill 5 --trials 200000
+
+每次试验都走实际战斗中的伤害流程：
+calculate_advanced_damage_modular（含混乱倍率） → calculate_damage_modifiers → process_hit_effects，
+每块试验共用一个工作单元和战斗状态快照：布置好场景后保存检查点，
+每次试验后把快照恢复到检查点并回滚到试验前的保存点，因此护盾、硬血等消耗不会跨试验累积；
+工作单元结束时丢弃全部修改。
+多进程运行时每个进程使用自己的数据库副本，互不争用写锁。
+"""
+
+import argparse
+import logging
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import database.db_connection as db_connection
+from database.unit_of_work import unit_of_work
+from database.queries import get_character, get_skill
+from character.status_effects import add_status_effect, calculate_damage_modifiers, process_hit_effects
+from character.stagger_manager import stagger_manager
+from game.damage_calculator import calculate_advanced_damage_modular
+from game.dice import seed_dice
+from game.spans import is_enabled, set_enabled
+
+logger = logging.getLogger(__name__)
+
+# 输出的分位数
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+
+# 击杀曲线最多统计的攻击次数
+MAX_HITS_TO_KILL = 10
+
+# 每个任务块的试验次数（多进程时的调度粒度）
+CHUNK_SIZE = 5000
+
+# 指定随机种子时，第 n 块试验使用 seed * SEED_STRIDE + n 作为种子
+SEED_STRIDE = 1_000_003
+
+
+@dataclass
+class Scenario:
+    """一组模拟设定"""
+    attacker_id: int
+    target_id: int
+    skill_id: int
+    attacker_effects: Tuple[Tuple[str, str, int, int], ...] = ()
+    target_effects: Tuple[Tuple[str, str, int, int], ...] = ()
+    target_staggered: bool = False
+
+
+@dataclass
+class SimulationResult:
+    """一组设定的模拟结果（伤害以直方图形式保存）"""
+    scenario: Scenario
+    skill_name: str = ''
+    target_name: str = ''
+    target_health: int = 0
+    trials: int = 0
+    crits: int = 0
+    histogram: Counter = field(default_factory=Counter)
+    elapsed: float = 0.0
+
+    def merge(self, histogram: Dict[int, int], crits: int, trials: int):
+        self.histogram.update(histogram)
+        self.crits += crits
+        self.trials += trials
+
+    @property
+    def mean(self) -> float:
+        if not self.trials:
+            return 0.0
+        return sum(damage * count for damage, count in self.histogram.items()) / self.trials
+
+    @property
+    def stddev(self) -> float:
+        if not self.trials:
+            return 0.0
+        mean = self.mean
+        variance = sum(count * (damage - mean) ** 2 for damage, count in self.histogram.items()) / self.trials
+        return math.sqrt(variance)
+
+    def percentile(self, p: float) -> int:
+        """最近秩法求分位数"""
+        if not self.trials:
+            return 0
+        rank = max(1, math.ceil(p / 100 * self.trials))
+        seen = 0
+        for damage in sorted(self.histogram):
+            seen += self.histogram[damage]
+            if seen >= rank:
+                return damage
+        return max(self.histogram)
+
+    def kill_curve(self, max_hits: int = MAX_HITS_TO_KILL) -> List[float]:
+        """
+        第1..max_hits次攻击内击杀目标的累计概率
+
+        把每次攻击视为独立同分布（护盾等跨攻击的消耗不计入），
+        对伤害分布做卷积得到累计伤害分布。
+        """
+        if not self.trials or self.target_health <= 0:
+            return [1.0] * max_hits
+
+        health = self.target_health
+        single = {damage: count / self.trials for damage, count in self.histogram.items()}
+        # alive[d]: 累计伤害为d（d < health）且目标仍存活的概率
+        alive = {0: 1.0}
+        curve = []
+        for _ in range(max_hits):
+            next_alive: Dict[int, float] = {}
+            for total, p_total in alive.items():
+                for damage, p_damage in single.items():
+                    new_total = total + damage
+                    if new_total < health:
+                        next_alive[new_total] = next_alive.get(new_total, 0.0) + p_total * p_damage
+            alive = next_alive
+            curve.append(max(0.0, 1.0 - sum(alive.values())))
+            if curve[-1] >= 0.9999:
+                curve.extend([curve[-1]] * (max_hits - len(curve)))
+                break
+        return curve
+
+
+# ---------- 多进程 ----------
+
+def _init_worker(master_copy: str):
+    """子进程初始化：使用独立的数据库副本"""
+    logging.getLogger().setLevel(logging.WARNING)
+    worker_copy = os.path.join(os.path.dirname(master_copy), f"worker-{os.getpid()}.db")
+    shutil.copyfile(master_copy, worker_copy)
+    db_connection.configure(worker_copy)
+    # 试验不需要分段计时
+    set_enabled(False)
+
+
+# ---------- 单次试验 ----------
+
+def _apply_scenario(scenario: Scenario):
+    """在当前工作单元中布置场景（状态效果、混乱状态）"""
+    for effect_type, effect_name, intensity, duration in scenario.attacker_effects:
+        add_status_effect(scenario.attacker_id, effect_type, effect_name, intensity, duration)
+    for effect_type, effect_name, intensity, duration in scenario.target_effects:
+        add_status_effect(scenario.target_id, effect_type, effect_name, intensity, duration)
+    if scenario.target_staggered:
+        stagger_manager._update_stagger_columns(
+            scenario.target_id,
+            stagger_value=0,
+            stagger_status='staggered',
+            stagger_turns_remaining=1
+        )
+
+
+def run_trial(scenario: Scenario, skill_info: Dict) -> Tuple[int, bool]:
+    """
+    执行一次伤害结算，返回 (最终伤害, 是否暴击)
+
+    需在带战斗状态快照的工作单元中调用，由调用方负责恢复状态。
+    """
+    attacker = get_character(scenario.attacker_id)
+    target = get_character(scenario.target_id)
+
+    base_damage, _, _, _ = calculate_advanced_damage_modular(skill_info, attacker, target)
+    modified_damage, is_crit, _ = calculate_damage_modifiers(attacker['id'], base_damage)
+    final_damage, _ = process_hit_effects(target['id'], modified_damage)
+    return final_damage, is_crit
+
+
+def _run_chunk(args) -> Tuple[int, Dict[int, int], int, int]:
+    """
+    执行一块试验，返回 (设定序号, 伤害直方图, 暴击次数, 试验次数)
+
+    每块试验按自己的种子重新设置骰子，结果与进程数和各块的调度顺序无关。
+    """
+    index, scenario, trials, chunk_seed = args
+    seed_dice(chunk_seed)
+    skill_info = get_skill(scenario.skill_id)
+    histogram = Counter()
+    crits = 0
+
+    with unit_of_work(immediate=False, battle_state=True) as uow:
+        try:
+            _apply_scenario(scenario)
+            state = uow.battle_state
+            state.peek_character(scenario.attacker_id)
+            state.peek_character(scenario.target_id)
+            checkpoint = state.checkpoint()
+
+            for _ in range(trials):
+                uow.conn.execute("SAVEPOINT sim_trial")
+                try:
+                    damage, is_crit = run_trial(scenario, skill_info)
+                finally:
+                    # 快照写回过的数据（如有）也一并回滚
+                    state.restore(checkpoint)
+                    uow.conn.execute("ROLLBACK TO sim_trial")
+                    uow.conn.execute("RELEASE sim_trial")
+                histogram[damage] += 1
+                crits += is_crit
+        finally:
+            uow.discard()
+
+    return index, dict(histogram), crits, trials
+
+
+# ---------- 调度 ----------
+
+def _chunks(scenarios: Sequence[Scenario], trials: int, seed: Optional[int]):
+    number = 0
+    for index, scenario in enumerate(scenarios):
+        remaining = trials
+        while remaining > 0:
+            size = min(CHUNK_SIZE, remaining)
+            yield index, scenario, size, None if seed is None else seed * SEED_STRIDE + number
+            remaining -= size
+            number += 1
+
+
+def simulate(scenarios: Sequence[Scenario], trials: int, db_path: Optional[str] = None,
+             workers: Optional[int] = None, seed: Optional[int] = None) -> List[SimulationResult]:
+    """
+    对每组设定运行trials次试验
+
+    Args:
+        scenarios: 模拟设定列表
+        trials: 每组设定的试验次数
+        db_path: 源数据库路径（默认为机器人使用的数据库），只读取不修改
+        workers: 进程数（默认CPU核数，1表示在当前进程中运行）
+        seed: 随机种子（便于复现，同一种子的结果与进程数无关）
+    """
+    db_path = db_path or db_connection.DB_PATH
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"数据库不存在: {db_path}")
+    workers = workers or os.cpu_count() or 1
+
+    work_dir = tempfile.mkdtemp(prefix='dewbot-sim-')
+    master_copy = db_connection.backup_database(db_path, os.path.join(work_dir, 'simulation.db'))
+    original_db_path = db_connection.DB_PATH
+
+    results = []
+    try:
+        db_connection.configure(master_copy)
+        for scenario in scenarios:
+            skill_info = get_skill(scenario.skill_id)
+            if not skill_info:
+                raise ValueError(f"技能不存在: {scenario.skill_id}")
+            attacker = get_character(scenario.attacker_id)
+            target = get_character(scenario.target_id)
+            if not attacker or not target:
+                raise ValueError(f"角色不存在: {scenario.attacker_id} / {scenario.target_id}")
+            results.append(SimulationResult(
+                scenario=scenario,
+                skill_name=skill_info['name'],
+                target_name=target['name'],
+                target_health=target['health']
+            ))
+
+        started = time.perf_counter()
+        if workers == 1:
+            spans_enabled = is_enabled()
+            set_enabled(False)
+            try:
+                for index, histogram, crits, count in map(_run_chunk, _chunks(scenarios, trials, seed)):
+                    results[index].merge(histogram, crits, count)
+            finally:
+                set_enabled(spans_enabled)
+        else:
+            db_connection.close_all()
+            with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(master_copy,)) as pool:
+                for index, histogram, crits, count in pool.imap_unordered(_run_chunk, _chunks(scenarios, trials, seed)):
+                    results[index].merge(histogram, crits, count)
+        elapsed = time.perf_counter() - started
+        for result in results:
+            result.elapsed = elapsed
+    finally:
+        db_connection.configure(original_db_path)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return results
+
+
+# ---------- 输出 ----------
+
+def format_results(results: Sequence[SimulationResult]) -> str:
+    """把模拟结果格式化为分位数表和击杀概率表"""
+    lines = []
+    header = f"{'技能':<10} {'目标':<10} {'期望':>8} {'标准差':>8} {'最小':>6}"
+    header += "".join(f" {'P' + str(p):>6}" for p in PERCENTILES)
+    header += f" {'最大':>6} {'暴击率':>7} {'一击必杀':>8}"
+    lines.append(header)
+    lines.append('-' * len(header))
+
+    for result in results:
+        row = f"{result.skill_name:<10} {result.target_name:<10} {result.mean:>8.2f} {result.stddev:>8.2f}"
+        row += f" {min(result.histogram, default=0):>6}"
+        row += "".join(f" {result.percentile(p):>6}" for p in PERCENTILES)
+        row += f" {max(result.histogram, default=0):>6}"
+        row += f" {result.crits / max(result.trials, 1):>7.1%}"
+        row += f" {result.kill_curve(1)[0]:>8.1%}"
+        lines.append(row)
+
+    lines.append('')
+    lines.append("N次攻击内击杀概率（独立同分布近似）")
+    header = f"{'技能':<10} {'目标':<10} {'生命':>6}" + "".join(f" {n:>6}" for n in range(1, MAX_HITS_TO_KILL + 1))
+    lines.append(header)
+    lines.append('-' * len(header))
+    for result in results:
+        row = f"{result.skill_name:<10} {result.target_name:<10} {result.target_health:>6}"
+        row += "".join(f" {p:>6.1%}" for p in result.kill_curve())
+        lines.append(row)
+
+    if results:
+        total_trials = sum(result.trials for result in results)
+        elapsed = results[0].elapsed
+        lines.append('')
+        lines.append(f"共 {total_trials} 次试验，用时 {elapsed:.1f} 秒（{total_trials / max(elapsed, 1e-9):.0f} 次/秒）")
+    return "\n".join(lines)
+
+
+def _parse_effect(text: str) -> Tuple[str, str, int, int]:
+    """解析 类型:名称:强度[:持续回合] 格式的状态效果，如 buff:guard:2:3"""
+    parts = text.split(':')
+    if len(parts) not in (3, 4):
+        raise argparse.ArgumentTypeError(f"状态效果格式应为 类型:名称:强度[:持续回合]，收到 {text}")
+    try:
+        intensity = int(parts[2])
+        duration = int(parts[3]) if len(parts) == 4 else 999
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"强度和持续回合必须是整数: {text}")
+    return parts[0], parts[1], intensity, duration
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="技能伤害蒙特卡洛模拟器")
+    parser.add_argument('--db', help="源数据库路径（默认使用机器人数据库，只读取副本）")
+    parser.add_argument('--attacker', type=int, required=True, help="攻击者角色ID")
+    parser.add_argument('--target', type=int, action='append', required=True, help="目标角色ID（可重复）")
+    parser.add_argument('--skill', type=int, action='append', required=True, help="技能ID（可重复）")
+    parser.add_argument('--trials', type=int, default=100000, help="每组技能/目标的试验次数")
+    parser.add_argument('--workers', type=int, default=None, help="进程数（默认CPU核数）")
+    parser.add_argument('--seed', type=int, default=None, help="随机种子")
+    parser.add_argument('--attacker-effect', type=_parse_effect, action='append', default=[],
+                        help="攻击者附加状态，如 buff:strong:2:3（可重复）")
+    parser.add_argument('--target-effect', type=_parse_effect, action='append', default=[],
+                        help="目标附加状态，如 buff:shield:10（可重复）")
+    parser.add_argument('--staggered', action='store_true', help="目标处于混乱状态")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(levelname)s - %(message)s', level=logging.WARNING)
+
+    scenarios = [
+        Scenario(
+            attacker_id=args.attacker,
+            target_id=target_id,
+            skill_id=skill_id,
+            attacker_effects=tuple(args.attacker_effect),
+            target_effects=tuple(args.target_effect),
+            target_staggered=args.staggered
+        )
+        for skill_id in args.skill
+        for target_id in args.target
+    ]
+
+    try:
+        results = simulate(scenarios, args.trials, db_path=args.db, workers=args.workers, seed=args.seed)
+    except (FileNotFoundError, ValueError) as e:
+        parser.error(str(e))
+    print(format_results(results))
+
+
+if __name__ == '__main__':
+    main()
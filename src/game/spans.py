@@ -0,0 +1,268 @@
+"""
+伤害流程分段计时模块
+给伤害结算的各个阶段（伤害公式、统一追加伤害、伤害修正、受击效果、混乱值、状态效果、情感硬币）
+打上轻量的计时区间，耗时记入进程内的 HDR 风格直方图，按「技能分类 + 阶段」分别统计：
+
+    @timed('process_hit_effects')
+    def process_hit_effects(...): ...
+
+    with span('execute_skill', root='aoe_damage'):     # 最外层区间决定 root，内层阶段都记在它名下
+        ...
+
+- 直方图以微秒为单位，每个 2 的幂区间再等分为 2^SUB_BUCKET_BITS 格，相对误差不超过 1/64，
+  记录一次是 O(1) 的字典累加，不保存原始样本
+- /latency 查看各阶段的 P50/P95/P99，/latency dump 按 Prometheus 文本格式写入 DUMP_PATH
+  （可由 node_exporter 的 textfile 收集器读取）
+- 模拟器等离线工具可以 set_enabled(False) 关闭计时，关闭后区间只多一次全局变量判断
+"""
+
+import functools
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 每个 2 的幂区间等分的格数（2^6 = 64 格）
+SUB_BUCKET_BITS = 6
+
+# Prometheus 直方图的桶上界（秒）
+PROMETHEUS_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+# 指标名
+METRIC_NAME = 'dewbot_stage_seconds'
+
+# /latency dump 写入的文件
+DUMP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'stage_latency.prom')
+
+_SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+# 小于此值的区间等分后每格不足 1 微秒，直接每微秒一格
+_EXACT_LIMIT = _SUB_BUCKETS << 1
+
+
+def _bucket_index(micros: int) -> int:
+    """微秒值所在的格（小于 _EXACT_LIMIT 时每微秒一格）"""
+    if micros < _EXACT_LIMIT:
+        return micros
+    shift = micros.bit_length() - SUB_BUCKET_BITS - 1
+    return (shift << SUB_BUCKET_BITS) + (micros >> shift)
+
+
+def _bucket_range(index: int) -> Tuple[int, int]:
+    """格所覆盖的微秒区间 [low, high]"""
+    if index < _EXACT_LIMIT:
+        return index, index
+    shift = (index >> SUB_BUCKET_BITS) - 1
+    top = index - (shift << SUB_BUCKET_BITS)
+    return top << shift, ((top + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """HDR 风格的延迟直方图（对数分段、段内线性分格，按微秒记录）"""
+
+    __slots__ = ('counts', 'count', 'sum', 'min', 'max')
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.sum = 0.0
+        self.min = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        index = _bucket_index(int(seconds * 1_000_000))
+        self.counts[index] = self.counts.get(index, 0) + 1
+        if self.count == 0 or seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.count += 1
+        self.sum += seconds
+
+    def percentile(self, percent: float) -> float:
+        """第 percent 百分位（秒，取所在格的上界，与 HDR 的 highest equivalent value 一致）"""
+        if self.count == 0:
+            return 0.0
+        rank = max(1, -(-self.count * percent // 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(_bucket_range(index)[1] / 1_000_000, self.max)
+        return self.max
+
+    def cumulative_counts(self, bounds: Tuple[float, ...]) -> List[int]:
+        """各上界（秒）以内的累计次数（格的上界不超过该上界才计入）"""
+        result = []
+        ordered = sorted(self.counts.items())
+        position = 0
+        seen = 0
+        for bound in bounds:
+            limit = bound * 1_000_000
+            while position < len(ordered) and _bucket_range(ordered[position][0])[1] <= limit:
+                seen += ordered[position][1]
+                position += 1
+            result.append(seen)
+        return result
+
+
+class StageHistograms:
+    """按 (root, 阶段) 保存的直方图"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, str], LatencyHistogram] = {}
+
+    def record(self, root: str, stage: str, seconds: float):
+        key = (root, stage)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def snapshot(self) -> Dict[Tuple[str, str], LatencyHistogram]:
+        """复制一份当前的直方图（格式化时不持有锁）"""
+        with self._lock:
+            copies = {}
+            for key, histogram in self._histograms.items():
+                copy = LatencyHistogram()
+                copy.counts = dict(histogram.counts)
+                copy.count, copy.sum, copy.min, copy.max = histogram.count, histogram.sum, histogram.min, histogram.max
+                copies[key] = copy
+            return copies
+
+    def format_stats(self) -> str:
+        """生成可读的统计文本：按 root 分组，阶段按总耗时排序"""
+        snapshot = self.snapshot()
+        if not snapshot:
+            return "暂无统计"
+        roots: Dict[str, List[Tuple[str, LatencyHistogram]]] = {}
+        for (root, stage), histogram in snapshot.items():
+            roots.setdefault(root, []).append((stage, histogram))
+
+        sections = []
+        for root in sorted(roots, key=lambda name: -sum(h.sum for _, h in roots[name])):
+            stages = sorted(roots[root], key=lambda item: -item[1].sum)
+            lines = [f"[{root}]"]
+            for stage, h in stages:
+                lines.append(
+                    f"{stage}: {h.count} 次 | P50 {h.percentile(50) * 1000:.3f}ms | "
+                    f"P95 {h.percentile(95) * 1000:.3f}ms | P99 {h.percentile(99) * 1000:.3f}ms | "
+                    f"最大 {h.max * 1000:.2f}ms | 合计 {h.sum * 1000:.1f}ms"
+                )
+            sections.append("\n".join(lines))
+        return "\n\n".join(sections)
+
+    def format_prometheus(self) -> str:
+        """Prometheus 文本格式（histogram 类型，stage/root 两个标签）"""
+        lines = [
+            f"# HELP {METRIC_NAME} 伤害结算各阶段耗时",
+            f"# TYPE {METRIC_NAME} histogram",
+        ]
+        for (root, stage), h in sorted(self.snapshot().items()):
+            labels = f'stage="{_escape_label(stage)}",root="{_escape_label(root)}"'
+            for bound, count in zip(PROMETHEUS_BUCKETS, h.cumulative_counts(PROMETHEUS_BUCKETS)):
+                lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{METRIC_NAME}_bucket{{{labels},le="+Inf"}} {h.count}')
+            lines.append(f'{METRIC_NAME}_sum{{{labels}}} {h.sum:.9f}')
+            lines.append(f'{METRIC_NAME}_count{{{labels}}} {h.count}')
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: Optional[str] = None) -> str:
+        """把 Prometheus 文本写入文件（先写临时文件再替换，读取方不会读到半个文件），返回路径"""
+        path = path or DUMP_PATH
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(self.format_prometheus())
+        os.replace(temp_path, path)
+        return path
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# 全局直方图
+stage_histograms = StageHistograms()
+
+# 当前最外层区间的 root
+_root: ContextVar[Optional[str]] = ContextVar('span_root', default=None)
+
+_enabled = True
+
+
+def set_enabled(enabled: bool):
+    """开启/关闭计时（关闭后区间不记录）"""
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+class span:
+    """
+    计时区间（上下文管理器）
+
+    Args:
+        stage: 阶段名
+        root: 作为最外层区间时使用的 root（默认为阶段名）；已在其他区间内时沿用外层的 root
+    """
+
+    __slots__ = ('stage', 'root', '_token', '_started')
+
+    def __init__(self, stage: str, root: Optional[str] = None):
+        self.stage = stage
+        self.root = root
+        self._token = None
+        self._started = None
+
+    def __enter__(self):
+        if not _enabled:
+            return self
+        outer = _root.get()
+        if outer is None:
+            self.root = self.root or self.stage
+            self._token = _root.set(self.root)
+        else:
+            self.root = outer
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._started is None:
+            return False
+        elapsed = time.perf_counter() - self._started
+        if self._token is not None:
+            _root.reset(self._token)
+        stage_histograms.record(self.root, self.stage, elapsed)
+        return False
+
+
+def timed(stage: str):
+    """把函数整体作为一个计时区间的装饰器"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
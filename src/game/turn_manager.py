@@ -4,20 +4,75 @@
 """
 
 import logging
-from typing import List, Dict
+from typing import List, Dict, Tuple
 from database.queries import get_characters_by_type, restore_character_actions
+from database.battles import (
+    advance_turn, current_battle_id, get_current_turn, get_interrupted_turns,
+    mark_turn_in_progress, set_current_turn
+)
+from database.unit_of_work import unit_of_work
 from character.status_effects import process_end_turn_effects, clear_all_status_effects
 
 logger = logging.getLogger(__name__)
 
 class TurnManager:
-    """回合管理器"""
+    """回合管理器
+    
+    在战斗范围内时回合数保存在 battles 表中（重启不丢失），见 database.battles；
+    不在任何战斗范围内时（命令行工具等）只在内存中计数。
+    """
     
     def __init__(self):
-        self.current_turn = 0
+        self._unscoped_turn = 0
+    
+    @property
+    def current_turn(self) -> int:
+        """当前战斗的回合数"""
+        battle_id = current_battle_id()
+        if battle_id is None:
+            return self._unscoped_turn
+        return get_current_turn(battle_id)
+    
+    @current_turn.setter
+    def current_turn(self, value: int):
+        battle_id = current_battle_id()
+        if battle_id is None:
+            self._unscoped_turn = value
+        else:
+            set_current_turn(battle_id, value)
+    
+    def begin_turn(self) -> int:
+        """
+        预写「回合结算中」标记，返回将要结算的回合（需在回合结算的工作单元之外调用并单独提交）
+        
+        结算提交时标记随回合数一起更新；进程在结算中途退出时标记保留，重启后由
+        get_interrupted_turns() 找出并重新结算或放弃。
+        """
+        battle_id = current_battle_id()
+        if battle_id is None:
+            return self._unscoped_turn + 1
+        return mark_turn_in_progress(battle_id)
+    
+    def _advance_turn(self) -> int:
+        """回合数加一（战斗范围内与回合结算在同一事务中，同时清除结算中标记）"""
+        battle_id = current_battle_id()
+        if battle_id is None:
+            self._unscoped_turn += 1
+            return self._unscoped_turn
+        return advance_turn(battle_id)
     
-    def end_turn_for_character(self, character_id: int) -> List[str]:
-        """结束指定角色的回合，处理状态效果，并开始新回合"""
+    @staticmethod
+    def get_interrupted_turns():
+        """重启前中断的回合结算 [(战斗ID, 聊天ID, 回合)]"""
+        return get_interrupted_turns()
+    
+    def end_turn_for_character(self, character_id: int, emotion_effects=None) -> List[str]:
+        """结束指定角色的回合，处理状态效果，并开始新回合
+        
+        Args:
+            character_id: 角色ID
+            emotion_effects: 预先批量加载的情感效果，为None时单独查询
+        """
         # 获取角色初始状态
         from database.queries import get_character
         initial_character = get_character(character_id)
@@ -48,7 +103,7 @@ class TurnManager:
         self._restore_single_character_actions(character_id)
         
         # 处理情感系统回合开始效果
-        emotion_messages = self._process_emotion_turn_start(character_id)
+        emotion_messages = self._process_emotion_turn_start(character_id, emotion_effects)
         if emotion_messages:
             if not end_messages:
                 end_messages = []
@@ -67,8 +122,17 @@ class TurnManager:
             update_character_actions(character_id, character['actions_per_turn'])
     
     def end_battle_turn(self) -> List[str]:
-        """结束整个战斗回合，处理所有在战斗中角色的状态效果"""
-        self.current_turn += 1
+        """结束整个战斗回合，处理所有在战斗中角色的状态效果
+        
+        整个回合在同一个工作单元中结算：参战角色和状态效果一次性加载到战斗快照，
+        烧伤、中毒、持续时间衰减等都在内存中计算，提交前批量写回。
+        """
+        with unit_of_work(battle_state=True):
+            return self._end_battle_turn()
+    
+    def _end_battle_turn(self) -> List[str]:
+        """回合结算主体（在工作单元中调用）"""
+        turn = self._advance_turn()
         all_messages = []
         
         # 获取所有在战斗中的角色
@@ -80,11 +144,15 @@ class TurnManager:
         if not all_characters:
             return ["没有角色在战斗中"]
         
-        all_messages.append(f"=== 第 {self.current_turn} 回合结束 ===")
+        all_messages.append(f"=== 第 {turn} 回合结束 ===")
+        
+        # 一次查询加载所有参战角色的情感效果
+        from character.emotion_system import emotion_system
+        emotion_effects = emotion_system.get_emotion_effects_bulk([character['id'] for character in all_characters])
         
         for character in all_characters:
             character_name = character.get('name', '未知角色')
-            character_messages = self.end_turn_for_character(character['id'])
+            character_messages = self.end_turn_for_character(character['id'], emotion_effects.get(character['id']))
             
             if character_messages:
                 all_messages.append(f"\n{character_name} 的状态效果:")
@@ -109,12 +177,13 @@ class TurnManager:
         return all_messages
     
     def reset_battle(self):
-        """重置战斗状态"""
+        """重置战斗状态（在战斗范围内时只重置本场战斗的角色）"""
         self.current_turn = 0
         
         # 清除所有角色的状态效果
-        friendly_characters = get_characters_by_type("friendly")
-        enemy_characters = get_characters_by_type("enemy")
+        in_battle = True if current_battle_id() is not None else None
+        friendly_characters = get_characters_by_type("friendly", in_battle=in_battle)
+        enemy_characters = get_characters_by_type("enemy", in_battle=in_battle)
         
         all_characters = friendly_characters + enemy_characters
         
@@ -128,7 +197,7 @@ class TurnManager:
         self.current_turn = 0
         logger.info("回合计数器已重置到0")
     
-    def _process_emotion_turn_start(self, character_id: int) -> List[str]:
+    def _process_emotion_turn_start(self, character_id: int, emotion_effects=None) -> List[str]:
         """处理角色回合开始时的情感系统效果"""
         messages = []
         
@@ -136,7 +205,7 @@ class TurnManager:
             from character.emotion_system import apply_emotion_effects
             
             # 应用情感效果（如强壮、守护等）
-            emotion_effect_messages = apply_emotion_effects(character_id)
+            emotion_effect_messages = apply_emotion_effects(character_id, emotion_effects)
             messages.extend(emotion_effect_messages)
             
         except Exception as e:
@@ -148,11 +217,25 @@ class TurnManager:
         """处理所有角色的情感升级"""
         try:
             from character.emotion_system import process_emotion_upgrades
-            return process_emotion_upgrades()
+            with unit_of_work():
+                return process_emotion_upgrades()
         except Exception as e:
             logger.error(f"处理情感升级时出错: {e}")
             return []
     
+    def end_turn(self) -> Tuple[List[str], List[str]]:
+        """结算一个完整回合（由战斗执行者调用）
+        
+        Returns:
+            (情感升级消息, 回合结束消息)
+        """
+        # 首先处理情感升级（回合开始时）
+        emotion_upgrade_messages = self.process_all_emotion_upgrades()
+        
+        # 然后处理其他回合结束效果
+        turn_messages = self.end_battle_turn()
+        return emotion_upgrade_messages, turn_messages
+    
     def get_current_turn(self) -> int:
         """获取当前回合数"""
         return self.current_turn
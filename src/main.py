@@ -1,4 +1,5 @@
 import os
+import re
 import httpx
 import logging
 from dotenv import load_dotenv
@@ -11,6 +12,11 @@ from character.persona_management import get_persona_management_handlers
 from skill.skill_management import get_skill_management_handlers
 from game.attack import get_attack_conv_handler, get_enemy_attack_conv_handler
 from game.turn_manager import turn_manager
+from game.executor import game_executor
+from game.battle_actor import battle_actors, battle_key_for
+from game.spans import stage_histograms
+from database.log_sink import log_sink
+from database.query_stats import query_stats, track_queries
 from database.queries import get_character_by_name, set_character_actions_per_turn
 from database.db_migration import run_migrations
 
@@ -36,8 +42,28 @@ request = HTTPXRequest(connection_pool_size=50000,
                        pool_timeout=60, 
                        proxy="socks5://127.0.0.1:7890")  # 根据需要配置代理
 
+def update_label(update: object) -> str:
+    """更新的处理入口：命令名或去掉ID的按钮回调数据（如 /attack、enemy_skill_#）"""
+    if isinstance(update, Update):
+        if update.callback_query is not None and update.callback_query.data:
+            return re.sub(r'\d+', '#', update.callback_query.data)
+        message = update.effective_message
+        if message is not None and message.text:
+            if message.text.startswith('/'):
+                return message.text.split()[0].split('@')[0]
+            return "消息"
+    return "其他更新"
+
+class InstrumentedApplication(Application):
+    """按更新统计SQL条数、行数和耗时的应用（/perf 查看，DEBUG日志输出每个更新的明细）"""
+    
+    async def process_update(self, update: object) -> None:
+        with track_queries(update_label(update)):
+            await super().process_update(update)
+
 # 创建应用
 application = Application.builder()\
+    .application_class(InstrumentedApplication)\
     .token(token)\
     .request(request)\
     .build()
@@ -78,8 +104,12 @@ async def help_command(update: Update, context: CallbackContext) -> None:
 /join <角色1> <角色2> ... - 批量加入多个角色
 /join all [friendly|enemy] - 全部加入战斗
 /leave <角色名> - 角色离开战斗
-/end_battle - 移除所有角色出战斗
+/end_battle - 移除本聊天所有角色出战斗并结束战斗
 /end_turn - 结束当前回合
+/queue - 查看游戏执行队列状态
+/perf - 查看各命令的SQL条数与耗时（/perf reset 清空）
+/latency - 查看伤害结算各阶段耗时（/latency dump 导出 | /latency reset 清空）
+/preview <攻击者> <技能> <目标> - 预览伤害分布与击杀概率
 
 🎯 技能管理:
 /sm <角色名> - 管理角色技能
@@ -115,32 +145,59 @@ async def help_command(update: Update, context: CallbackContext) -> None:
     """
     await update.message.reply_text(help_text)
 
+def _format_turn_result(emotion_upgrade_messages, turn_messages) -> str:
+    """把回合结算的消息合并成一条文本"""
+    # 合并所有消息
+    all_messages = []
+    if emotion_upgrade_messages:
+        all_messages.extend(emotion_upgrade_messages)
+    all_messages.extend(turn_messages)
+    
+    # 将消息合并成一个字符串发送
+    result_text = "\n".join(all_messages)
+    
+    # 限制消息长度，防止太长
+    if len(result_text) > 4000:
+        result_text = result_text[:4000] + "\n...(消息过长已截断)"
+    return result_text
+
 async def end_turn_command(update: Update, context: CallbackContext) -> None:
     """结束当前回合，处理状态效果"""
     try:
-        # 首先处理情感升级（回合开始时）
-        emotion_upgrade_messages = turn_manager.process_all_emotion_upgrades()
-        
-        # 然后处理其他回合结束效果
-        turn_messages = turn_manager.end_battle_turn()
-        
-        # 合并所有消息
-        all_messages = []
-        if emotion_upgrade_messages:
-            all_messages.extend(emotion_upgrade_messages)
-        all_messages.extend(turn_messages)
-        
-        # 将消息合并成一个字符串发送
-        result_text = "\n".join(all_messages)
-        
-        # 限制消息长度，防止太长
-        if len(result_text) > 4000:
-            result_text = result_text[:4000] + "\n...(消息过长已截断)"
+        # 回合结算会修改所有参战角色，与技能结算一起在本场战斗的执行者中排队执行；
+        # 结算前先单独提交「回合结算中」标记，进程中途退出时重启后可以恢复
+        emotion_upgrade_messages, turn_messages = await battle_actors.submit_write_ahead(
+            battle_key_for(update), 'end_turn', turn_manager.begin_turn, turn_manager.end_turn)
         
-        await update.message.reply_text(result_text)
+        await update.message.reply_text(_format_turn_result(emotion_upgrade_messages, turn_messages))
     except Exception as e:
         await update.message.reply_text(f"处理回合结束时出错: {str(e)}")
 
+async def recover_interrupted_turns(application: Application) -> None:
+    """
+    启动时恢复重启前中断的回合结算
+    
+    标记仍在说明结算事务没有提交、战斗数据停留在结算前，因此重新结算一次即可，
+    结果发回对应聊天；重新结算失败时放弃该回合（执行者已清除标记）。
+    """
+    for battle_id, chat_id, turn in await game_executor.read(turn_manager.get_interrupted_turns):
+        logging.warning(f"战斗 {battle_id} 的第 {turn} 回合结算在重启前中断，重新结算")
+        try:
+            emotion_upgrade_messages, turn_messages = await battle_actors.submit_write_ahead(
+                chat_id, 'end_turn', turn_manager.begin_turn, turn_manager.end_turn)
+        except Exception as e:
+            logging.error(f"重新结算战斗 {battle_id} 的第 {turn} 回合时出错，已放弃该回合: {e}")
+            continue
+        
+        try:
+            await application.bot.send_message(
+                chat_id,
+                f"⚠️ 机器人重启前第 {turn} 回合的结算被中断，已重新结算：\n\n"
+                + _format_turn_result(emotion_upgrade_messages, turn_messages)
+            )
+        except Exception as e:
+            logging.error(f"发送恢复的回合结算结果到聊天 {chat_id} 时出错: {e}")
+
 async def set_actions_command(update: Update, context: CallbackContext) -> None:
     """设置角色每回合行动次数"""
     args = context.args
@@ -160,12 +217,13 @@ async def set_actions_command(update: Update, context: CallbackContext) -> None:
             await update.message.reply_text("行动次数必须在1-5之间。")
             return
         
-        character = get_character_by_name(character_name)
+        character = await game_executor.read(get_character_by_name, character_name)
         if not character:
             await update.message.reply_text(f"找不到名为 '{character_name}' 的角色。")
             return
         
-        if set_character_actions_per_turn(character['id'], actions_per_turn):
+        if await battle_actors.submit(battle_key_for(update), 'set_actions',
+                                      set_character_actions_per_turn, character['id'], actions_per_turn):
             await update.message.reply_text(
                 f"✅ 已设置角色 '{character_name}' 的每回合行动次数为 {actions_per_turn}。"
             )
@@ -177,11 +235,76 @@ async def set_actions_command(update: Update, context: CallbackContext) -> None:
     except Exception as e:
         await update.message.reply_text(f"设置时出错: {str(e)}")
 
+async def queue_command(update: Update, context: CallbackContext) -> None:
+    """查看游戏执行器和日志写入队列的状态"""
+    sink = log_sink.stats()
+    await update.message.reply_text(
+        "📊 执行队列状态\n\n"
+        f"{game_executor.format_stats()}\n"
+        f"{battle_actors.format_stats()}\n"
+        f"日志队列: 排队 {sink['queued']} | 待写 {sink['pending']} | 已写 {sink['written']} | 丢弃 {sink['dropped']}"
+    )
+
+async def perf_command(update: Update, context: CallbackContext) -> None:
+    """查看各处理入口的SQL统计；/perf reset 清空统计"""
+    if context.args and context.args[0] == 'reset':
+        query_stats.reset()
+        await update.message.reply_text("已清空SQL统计。")
+        return
+    
+    text = "🧮 SQL统计\n\n" + query_stats.format_stats()
+    if len(text) > 4000:
+        text = text[:4000] + "\n...(消息过长已截断)"
+    await update.message.reply_text(text)
+
+async def latency_command(update: Update, context: CallbackContext) -> None:
+    """查看伤害结算各阶段的耗时分布；/latency dump 导出Prometheus文本，/latency reset 清空"""
+    if context.args and context.args[0] == 'reset':
+        stage_histograms.reset()
+        await update.message.reply_text("已清空阶段耗时统计。")
+        return
+    
+    if context.args and context.args[0] == 'dump':
+        try:
+            path = await game_executor.read(stage_histograms.dump)
+            await update.message.reply_text(f"已导出到 {path}")
+        except Exception as e:
+            await update.message.reply_text(f"导出时出错: {str(e)}")
+        return
+    
+    text = "⏱️ 伤害结算各阶段耗时\n\n" + stage_histograms.format_stats()
+    if len(text) > 4000:
+        text = text[:4000] + "\n...(消息过长已截断)"
+    await update.message.reply_text(text)
+
+async def preview_command(update: Update, context: CallbackContext) -> None:
+    """预览技能的伤害分布和一击击杀概率（只读，不修改战斗状态）"""
+    args = context.args
+    
+    if not args or len(args) != 3:
+        await update.message.reply_text(
+            "用法: /preview <攻击者> <技能> <目标>\n"
+            "角色和技能可以用名称或ID，例如: /preview 艾丽丝 火球 哥布林"
+        )
+        return
+    
+    try:
+        # 伤害分布引擎只在第一次预览时导入，不拖慢启动
+        from game.damage_distribution import build_preview_message
+        message = await game_executor.read(build_preview_message, *args)
+        await update.message.reply_text(message)
+    except Exception as e:
+        await update.message.reply_text(f"预览伤害时出错: {str(e)}")
+
 # 添加命令处理器
 application.add_handler(CommandHandler("start", start))
 application.add_handler(CommandHandler("help", help_command))
 application.add_handler(CommandHandler("end_turn", end_turn_command))
 application.add_handler(CommandHandler("set_actions", set_actions_command))
+application.add_handler(CommandHandler("queue", queue_command))
+application.add_handler(CommandHandler("perf", perf_command))
+application.add_handler(CommandHandler("latency", latency_command))
+application.add_handler(CommandHandler("preview", preview_command))
 
 # 添加角色管理处理器
 for handler in get_character_management_handlers():
@@ -205,6 +328,9 @@ application.add_handler(get_attack_conv_handler())
 # 添加敌方攻击处理器
 application.add_handler(get_enemy_attack_conv_handler())
 
+# 启动时恢复中断的回合结算
+application.post_init = recover_interrupted_turns
+
 # 启动Bot
 if __name__ == '__main__':
     application.run_polling()
@@ -0,0 +1,102 @@
+"""
+AOE 结算引擎
+AOE 伤害/治疗技能原先对每个目标完整地走一遍单体流程：各自投骰、各自读取攻击者的状态效果和麻痹层数。
+这里把与目标无关的部分提到循环外，一次完成：
+
+- 所有目标的骰子用一次 roll_formula_many 投掷（攻击者麻痹时仍逐个目标投掷并消耗层数）
+- 攻击者的伤害修正效果（呼吸法、强壮、虚弱）只读取一次，每个目标只做计算（见 DamageModifiers）
+- 目标的受击效果、生命值、战斗记录和情感硬币仍按目标顺序逐个结算，结果与逐个执行单体流程相同
+- 整个结算在一个带战斗快照的工作单元中完成（execute_skill 中调用时加入外层工作单元），
+  状态读写都在内存快照上进行，提交时批量写回
+
+    hits = resolve_aoe_damage(attacker, targets, skill_info)
+    for hit in hits:
+        print(hit.target['name'], hit.amount, hit.new_health)
+"""
+
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from character.status_effects import get_damage_modifiers, process_hit_effects
+from database.queries import record_battle, update_character_health
+from database.unit_of_work import unit_of_work
+from game.damage_calculator import calculate_advanced_damage_modular, roll_base_damage_many
+from game.dice import compile_dice_formula, roll_formula_many
+from game.spans import timed
+
+logger = logging.getLogger(__name__)
+
+# 无技能信息时使用的基础攻击（与 SkillEffect.calculate_skill_damage 一致）
+DEFAULT_ATTACK = {
+    'damage_formula': '1d6',
+    'damage_type': 'physical',
+    'special_damage_tags': '{}'
+}
+
+
+@dataclass
+class AoeHit:
+    """AOE 对一个目标的结算结果"""
+    target: Dict
+    amount: int  # 最终伤害或实际治疗量
+    new_health: int
+    emotion_messages: List[str] = field(default_factory=list)
+
+
+@timed('resolve_aoe_damage')
+def resolve_aoe_damage(attacker: Dict, targets: List[Dict], skill_info: Optional[Dict]) -> List[AoeHit]:
+    """
+    对所有目标结算 AOE 伤害（不含技能的次要效果、行动后效果、自我效果和冷却，由调用方处理）
+
+    Returns:
+        List[AoeHit]: 与 targets 顺序一致的结算结果
+    """
+    skill = skill_info or DEFAULT_ATTACK
+    skill_id = skill_info['id'] if skill_info else None
+
+    with unit_of_work(battle_state=True):
+        base_rolls = roll_base_damage_many(skill.get('damage_formula', '1d6'), len(targets), attacker.get('id'))
+        modifiers = get_damage_modifiers(attacker['id'])
+
+        hits = []
+        for target, base_roll in zip(targets, base_rolls):
+            base_damage = calculate_advanced_damage_modular(skill, attacker, target, base_roll)[0]
+            modified_damage = modifiers.apply(base_damage)[0] if modifiers else base_damage
+            final_damage, _ = process_hit_effects(target['id'], modified_damage)
+
+            new_health = max(0, target['health'] - final_damage)
+            update_character_health(target['id'], new_health)
+            record_battle(attacker['id'], target['id'], final_damage, skill_id)
+            hits.append(AoeHit(target, final_damage, new_health))
+        return hits
+
+
+@timed('resolve_aoe_healing')
+def resolve_aoe_healing(effect, healer: Dict, targets: List[Dict], skill_info: Optional[Dict]) -> List[AoeHit]:
+    """
+    对所有目标结算 AOE 治疗（治疗量不受攻防和抗性影响，只使用基础公式）
+
+    Args:
+        effect: 技能效果（SkillEffect），用于结算治疗相关的情感硬币
+
+    Returns:
+        List[AoeHit]: 与 targets 顺序一致的结算结果
+    """
+    formula = compile_dice_formula(skill_info.get('damage_formula', '1d6') if skill_info else '1d6')
+    skill_id = skill_info['id'] if skill_info else 1
+
+    with unit_of_work(battle_state=True):
+        rolls = roll_formula_many(formula, len(targets))
+
+        hits = []
+        for target, rolled in zip(targets, rolls):
+            heal_amount = formula.base + sum(sum(group) for group in rolled)
+            new_health = min(target['health'] + heal_amount, target['max_health'])
+            actual_heal = new_health - target['health']
+
+            update_character_health(target['id'], new_health)
+            record_battle(healer['id'], target['id'], -actual_heal, skill_id)
+            emotion_messages = effect.process_healing_emotion_coins(healer, target, actual_heal)
+            hits.append(AoeHit(target, actual_heal, new_health, emotion_messages))
+        return hits
@@ -68,5 +68,20 @@ class EffectTargetResolver:
         all_chars.extend(get_characters_by_type('enemy', in_battle=True))
         return all_chars
 
-# 创建全局目标解析器实例
-target_resolver = EffectTargetResolver()
+# 全局目标解析器实例（首次使用时创建）
+_target_resolver = None
+
+
+def get_target_resolver() -> EffectTargetResolver:
+    """获取全局目标解析器（首次调用时创建，解析器本身无状态，并发创建也无妨）"""
+    global _target_resolver
+    if _target_resolver is None:
+        _target_resolver = EffectTargetResolver()
+    return _target_resolver
+
+
+def __getattr__(name):
+    # 兼容 from skill.effect_target_resolver import target_resolver
+    if name == 'target_resolver':
+        return get_target_resolver()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
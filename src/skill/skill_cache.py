@@ -0,0 +1,247 @@
+"""
+技能编译缓存模块
+skills 表中的 effects、special_damage_tags 以 JSON 文本保存，damage_formula 为公式文本。
+原先每次命中都要重新 json.loads，这里把每个技能行编译成不可变的 CompiledSkill 并在进程内缓存：
+
+- effects / special_damage_tags 只解析一次，结果为只读的 dict / list
+- damage_formula 预编译为 DiceFormula
+- 预先整理效果中引用的目标类型和会触发的伤害增强器
+
+缓存按技能ID保存。已经取到技能行的调用方用 resolve()，会与缓存条目的原始字段比对，
+技能行被修改（包括直接修改数据库）后自动重新编译；按ID查找的 get() 只读缓存，
+未缓存时才查询数据库，因此修改技能的操作需要调用 invalidate_skill_cache()。
+"""
+
+import json
+import logging
+import threading
+from dataclasses import dataclass, field
+from operator import itemgetter
+from typing import Any, Dict, FrozenSet, Mapping, Optional, Tuple
+
+from database.queries import get_skill
+from game.dice import DiceFormula, compile_dice_formula
+
+logger = logging.getLogger(__name__)
+
+# 技能效果键 -> 伤害增强器名称（见 game.damage_enhancers.damage_manager）
+ENHANCER_TRIGGERS = {
+    'hardblood_consume': 'hardblood_consume',
+    'aoe_damage_enhance': 'hardblood_aoe_enhance',
+    'conditional_damage': 'dark_domain_conditional',
+    'status': 'status_based_damage',
+}
+
+# 参与编译的原始字段，用于判断缓存是否过期
+_SOURCE_FIELDS = ('name', 'skill_category', 'damage_type', 'damage_formula', 'cooldown',
+                  'required_emotion_level', 'effects', 'special_damage_tags')
+
+
+class _FrozenDict(dict):
+    """只读 dict（仍是 dict 的子类，isinstance 判断和 json.dumps 不受影响）"""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("编译后的技能数据是只读的")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+    __ior__ = _readonly
+
+    def __reduce__(self):
+        return (_FrozenDict, (dict(self),))
+
+
+class _FrozenList(list):
+    """只读 list"""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("编译后的技能数据是只读的")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = pop = remove = clear = sort = reverse = _readonly
+
+    def __reduce__(self):
+        return (_FrozenList, (list(self),))
+
+
+def _freeze(value):
+    """递归转换为只读结构"""
+    if isinstance(value, dict):
+        return _FrozenDict((k, _freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return _FrozenList(_freeze(v) for v in value)
+    return value
+
+
+def _parse_json(raw, default):
+    """解析JSON文本；已经是dict/list时直接使用，空值或格式错误时返回default"""
+    if isinstance(raw, (dict, list)):
+        return raw
+    if not raw or not isinstance(raw, str) or not raw.strip():
+        return default
+    try:
+        parsed = json.loads(raw)
+    except json.JSONDecodeError:
+        logger.warning(f"技能数据JSON格式错误: {raw!r}")
+        return default
+    return default if parsed is None else parsed
+
+
+def _collect_target_types(effects) -> FrozenSet[str]:
+    """效果中引用的目标类型（target / target_type 字段）"""
+    found = set()
+
+    def visit(value):
+        if isinstance(value, dict):
+            for key in ('target', 'target_type'):
+                if isinstance(value.get(key), str):
+                    found.add(value[key])
+            for item in value.values():
+                visit(item)
+        elif isinstance(value, list):
+            for item in value:
+                visit(item)
+
+    visit(effects)
+    return frozenset(found)
+
+
+@dataclass(frozen=True)
+class CompiledSkill:
+    """编译后的技能定义（不可变）"""
+    id: Optional[int]
+    name: str
+    skill_category: str
+    damage_type: str
+    damage_formula: str
+    formula: DiceFormula
+    cooldown: int
+    required_emotion_level: int
+    effects: Any                                  # 只读 dict（旧格式）或 list（数组格式）
+    special_damage_tags: Mapping[str, float]
+    target_types: FrozenSet[str]
+    enhancers: Tuple[str, ...]
+    source: Tuple = field(repr=False, compare=False, default=())
+
+    @property
+    def is_aoe(self) -> bool:
+        return self.skill_category.startswith('aoe')
+
+    def has_effect(self, key: str) -> bool:
+        """旧格式效果中是否包含指定键（数组格式始终返回False，与 `key in effects` 一致）"""
+        return isinstance(self.effects, dict) and key in self.effects
+
+
+_get_source = itemgetter(*_SOURCE_FIELDS)
+
+
+def _source_of(skill_info: Mapping) -> Tuple:
+    try:
+        return _get_source(skill_info)
+    except KeyError:
+        return tuple(skill_info.get(name) for name in _SOURCE_FIELDS)
+
+
+def compile_skill(skill_info: Mapping) -> CompiledSkill:
+    """把技能行（get_skill 返回的字典）编译为 CompiledSkill"""
+    effects = _freeze(_parse_json(skill_info.get('effects'), {}))
+    special_damage_tags = _freeze(_parse_json(skill_info.get('special_damage_tags'), {}))
+    if not isinstance(special_damage_tags, dict):
+        special_damage_tags = _FrozenDict()
+
+    damage_formula = skill_info.get('damage_formula')
+    if not isinstance(damage_formula, str):
+        damage_formula = '1d6'
+
+    enhancers = tuple(name for key, name in ENHANCER_TRIGGERS.items()
+                      if isinstance(effects, dict) and key in effects)
+
+    return CompiledSkill(
+        id=skill_info.get('id'),
+        name=skill_info.get('name') or '',
+        skill_category=skill_info.get('skill_category') or 'damage',
+        damage_type=skill_info.get('damage_type') or 'physical',
+        damage_formula=damage_formula,
+        formula=compile_dice_formula(damage_formula),
+        cooldown=skill_info.get('cooldown') or 0,
+        required_emotion_level=skill_info.get('required_emotion_level') or 0,
+        effects=effects,
+        special_damage_tags=special_damage_tags,
+        target_types=_collect_target_types(effects),
+        enhancers=enhancers,
+        source=_source_of(skill_info),
+    )
+
+
+class SkillCache:
+    """进程内的技能编译缓存（按技能ID）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[int, CompiledSkill] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, skill_info: Optional[Mapping]) -> Optional[CompiledSkill]:
+        """
+        获取技能字典对应的编译结果
+
+        缓存中已有同ID且原始字段相同的条目时直接返回，否则重新编译并缓存。
+        """
+        if not skill_info:
+            return None
+
+        skill_id = skill_info.get('id')
+        entry = self._entries.get(skill_id) if skill_id is not None else None
+        if entry is not None and entry.source == _source_of(skill_info):
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        compiled = compile_skill(skill_info)
+        if skill_id is not None:
+            with self._lock:
+                self._entries[skill_id] = compiled
+        return compiled
+
+    def get(self, skill_id: int) -> Optional[CompiledSkill]:
+        """按技能ID获取编译结果，未缓存时从数据库加载"""
+        entry = self._entries.get(skill_id)
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        skill_info = get_skill(skill_id)
+        if not skill_info:
+            return None
+        return self.resolve(skill_info)
+
+    def invalidate(self, skill_id: Optional[int] = None):
+        """使指定技能（不指定时为全部技能）的缓存失效"""
+        with self._lock:
+            if skill_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(skill_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+# 全局技能缓存实例
+skill_cache = SkillCache()
+
+
+def get_compiled_skill(skill_info: Optional[Mapping]) -> Optional[CompiledSkill]:
+    """获取技能字典对应的编译结果的便捷函数"""
+    return skill_cache.resolve(skill_info)
+
+
+def get_skill_effects(skill_info: Optional[Mapping]):
+    """获取技能的已解析效果（只读），无技能时返回空dict"""
+    compiled = skill_cache.resolve(skill_info)
+    return compiled.effects if compiled is not None else _FrozenDict()
+
+
+def invalidate_skill_cache(skill_id: Optional[int] = None):
+    """使技能缓存失效的便捷函数"""
+    skill_cache.invalidate(skill_id)
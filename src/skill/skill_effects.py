@@ -1,9 +1,10 @@
 import random
-import json
+import threading
 from abc import ABC, abstractmethod
 from database.queries import update_character_health, record_battle, get_character
 from character.status_effects import (
     add_status_effect, 
+    add_status_effects_bulk,
     process_hit_effects, 
     process_action_effects,
     calculate_damage_modifiers,
@@ -17,8 +18,12 @@ from game.damage_calculator import (
     update_character_cooldowns,
     apply_damage_with_stagger
 )
-from skill.effect_target_resolver import target_resolver
+from skill.effect_target_resolver import get_target_resolver
+from skill.aoe_engine import resolve_aoe_damage, resolve_aoe_healing
+from skill.skill_cache import get_skill_effects
 from character.emotion_system import add_emotion_coins
+from database.unit_of_work import unit_of_work
+from game.spans import span, timed
 
 class SkillEffect(ABC):
     """技能效果的抽象基类"""
@@ -90,7 +95,7 @@ class SkillEffect(ABC):
         action_messages = process_action_effects(attacker['id'])
         
         # 更新冷却时间
-        update_character_cooldowns(attacker['id'], skill_info['id'] if skill_info else 1)
+        update_character_cooldowns(attacker['id'], skill_info['id'] if skill_info else 1, skill_info)
         
         # 构建整合的伤害显示
         damage_type = damage_result['damage_type']
@@ -195,7 +200,7 @@ class SkillEffect(ABC):
         action_messages = process_action_effects(attacker['id'])
         
         # 更新冷却时间
-        update_character_cooldowns(attacker['id'], skill_info['id'] if skill_info else 1)
+        update_character_cooldowns(attacker['id'], skill_info['id'] if skill_info else 1, skill_info)
         
         result_text = f"💚 治疗：{heal_amount} 点 → 恢复了 {actual_heal} 点生命值"
         if actual_heal < heal_amount:
@@ -298,7 +303,7 @@ class SkillEffect(ABC):
         action_messages = process_action_effects(attacker['id'])
         
         # 更新冷却时间
-        update_character_cooldowns(attacker['id'], skill_info['id'] if skill_info else 1)
+        update_character_cooldowns(attacker['id'], skill_info['id'] if skill_info else 1, skill_info)
         
         skill_name = skill_info.get('name', '增益技能') if skill_info else '增益技能'
         target_name = target.get('name', '目标') if target else '目标'
@@ -330,7 +335,7 @@ class SkillEffect(ABC):
         action_messages = process_action_effects(attacker['id'])
         
         # 更新冷却时间
-        update_character_cooldowns(attacker['id'], skill_info['id'] if skill_info else 1)
+        update_character_cooldowns(attacker['id'], skill_info['id'] if skill_info else 1, skill_info)
         
         skill_name = skill_info.get('name', '减益技能') if skill_info else '减益技能'
         target_name = target.get('name', '目标') if target else '目标'
@@ -365,7 +370,7 @@ class SkillEffect(ABC):
         action_messages = process_action_effects(attacker['id'])
         
         # 更新冷却时间
-        update_character_cooldowns(attacker['id'], skill_info['id'] if skill_info else 1)
+        update_character_cooldowns(attacker['id'], skill_info['id'] if skill_info else 1, skill_info)
         
         skill_name = skill_info.get('name', '自我技能') if skill_info else '自我技能'
         result_text = f"🧘 {skill_name}：自我强化效果"
@@ -389,13 +394,9 @@ class SkillEffect(ABC):
     def execute_aoe(self, attacker, target, skill_info):
         """执行AOE技能 - 对所有敌方或友方目标生效"""
         from database.queries import get_battle_characters
-        import json
         
         # 分析技能效果来确定是否为治疗/友方技能
-        try:
-            effects = json.loads(skill_info.get('effects', '{}')) if skill_info else {}
-        except (json.JSONDecodeError, TypeError):
-            effects = {}
+        effects = get_skill_effects(skill_info)
         
         # 判断技能类型
         damage_formula = skill_info.get('damage_formula', '0') if skill_info else '0'
@@ -466,7 +467,7 @@ class SkillEffect(ABC):
         action_messages = process_action_effects(attacker['id'])
         
         # 更新冷却时间
-        update_character_cooldowns(attacker['id'], skill_info['id'] if skill_info else 1)
+        update_character_cooldowns(attacker['id'], skill_info['id'] if skill_info else 1, skill_info)
         
         # 构建结果文本
         if not is_friendly_skill:
@@ -494,18 +495,12 @@ class SkillEffect(ABC):
     
     def apply_aoe_status_effects(self, attacker, targets, skill_info, is_friendly_skill):
         """统一处理AOE技能的状态效果"""
-        from character.status_effects import add_status_effect
-        import json
-        
         messages = []
         
         if not skill_info or not targets:
             return messages
         
-        try:
-            effects = json.loads(skill_info.get('effects', '{}'))
-        except (json.JSONDecodeError, TypeError):
-            effects = {}
+        effects = get_skill_effects(skill_info)
         
         # 处理对目标的状态效果
         target_effect_key = 'buff' if is_friendly_skill else 'debuff'
@@ -521,14 +516,11 @@ class SkillEffect(ABC):
             effect_name = effect_names.get(effect_info['type'], effect_info['type'])
             effect_icon = "✨" if is_friendly_skill else "💀"
             
-            for target in targets:
-                success = add_status_effect(
-                    target['id'],
-                    target_effect_key,
-                    effect_info['type'],
-                    effect_info['intensity'],
-                    effect_info['duration']
-                )
+            applied = add_status_effects_bulk([
+                (target['id'], target_effect_key, effect_info['type'], effect_info['intensity'], effect_info['duration'])
+                for target in targets
+            ])
+            for target, success in zip(targets, applied):
                 if success:
                     if effect_info['type'] == 'shield':
                         messages.append(f"{effect_icon} {target['name']} 获得了 {effect_info['intensity']} 点{effect_name}")
@@ -553,14 +545,10 @@ class SkillEffect(ABC):
                 'target_health': 0
             }
         
-        # 对每个目标执行伤害
-        total_damage = 0
-        damage_messages = []
-        
-        for enemy_target in targets:
-            damage_result = self.execute_damage_without_self_effects(attacker, enemy_target, skill_info)
-            total_damage += damage_result['total_damage']
-            damage_messages.append(f"→ {enemy_target['name']}: 受到 {damage_result['total_damage']} 点伤害")
+        # 所有目标一次结算（批量投骰、攻击者修正只读取一次，见 skill.aoe_engine）
+        hits = resolve_aoe_damage(attacker, targets, skill_info)
+        total_damage = sum(hit.amount for hit in hits)
+        damage_messages = [f"→ {hit.target['name']}: 受到 {hit.amount} 点伤害" for hit in hits]
         
         # 处理技能的次要效果（传递总伤害作为主效果值）
         status_messages = self.apply_skill_status_effects(attacker, None, skill_info, total_damage)
@@ -572,7 +560,7 @@ class SkillEffect(ABC):
         self_effect_messages = self.apply_self_effects(attacker, skill_info, total_damage, 'aoe_damage')
         
         # 更新冷却时间
-        update_character_cooldowns(attacker['id'], skill_info['id'] if skill_info else 1)
+        update_character_cooldowns(attacker['id'], skill_info['id'] if skill_info else 1, skill_info)
         
         # 构建结果文本
         skill_name = skill_info.get('name', 'AOE攻击')
@@ -605,20 +593,13 @@ class SkillEffect(ABC):
                 'target_health': 0
             }
         
-        # 对每个目标执行治疗
-        total_healing = 0
-        healing_messages = []
-        all_emotion_messages = []  # 收集所有情感硬币消息
+        # 所有目标一次结算（批量投骰，见 skill.aoe_engine）
+        hits = resolve_aoe_healing(self, attacker, targets, skill_info)
+        total_healing = sum(hit.amount for hit in hits)
+        healing_messages = [f"→ {hit.target['name']}: 恢复 {hit.amount} 点生命值" for hit in hits]
         
-        for ally_target in targets:
-            healing_result = self.execute_healing_without_self_effects(attacker, ally_target, skill_info)
-            heal_amount = abs(healing_result['total_damage'])  # 治疗返回负伤害
-            total_healing += heal_amount
-            healing_messages.append(f"→ {ally_target['name']}: 恢复 {heal_amount} 点生命值")
-            
-            # 收集情感硬币消息
-            if 'emotion_messages' in healing_result:
-                all_emotion_messages.extend(healing_result['emotion_messages'])
+        # 收集情感硬币消息
+        all_emotion_messages = [message for hit in hits for message in hit.emotion_messages]
         
         # 处理技能的次要效果（传递总治疗量作为主效果值）
         status_messages = self.apply_skill_status_effects(attacker, None, skill_info, total_healing)
@@ -630,7 +611,7 @@ class SkillEffect(ABC):
         self_effect_messages = self.apply_self_effects(attacker, skill_info, total_healing, 'aoe_healing')
         
         # 更新冷却时间
-        update_character_cooldowns(attacker['id'], skill_info['id'] if skill_info else 1)
+        update_character_cooldowns(attacker['id'], skill_info['id'] if skill_info else 1, skill_info)
         
         # 构建结果文本
         skill_name = skill_info.get('name', 'AOE治疗')
@@ -677,7 +658,7 @@ class SkillEffect(ABC):
         self_effect_messages = self.apply_self_effects(attacker, skill_info, 0, 'aoe_buff')
         
         # 更新冷却时间
-        update_character_cooldowns(attacker['id'], skill_info['id'] if skill_info else 1)
+        update_character_cooldowns(attacker['id'], skill_info['id'] if skill_info else 1, skill_info)
         
         # 构建结果文本
         skill_name = skill_info.get('name', 'AOE增益')
@@ -720,7 +701,7 @@ class SkillEffect(ABC):
         self_effect_messages = self.apply_self_effects(attacker, skill_info, 0, 'aoe_debuff')
         
         # 更新冷却时间
-        update_character_cooldowns(attacker['id'], skill_info['id'] if skill_info else 1)
+        update_character_cooldowns(attacker['id'], skill_info['id'] if skill_info else 1, skill_info)
         
         # 构建结果文本
         skill_name = skill_info.get('name', 'AOE减益')
@@ -737,6 +718,7 @@ class SkillEffect(ABC):
             'target_health': 0
         }
     
+    @timed('apply_skill_status_effects')
     def apply_skill_status_effects(self, attacker, target, skill_info, main_effect_value=0):
         """应用技能的状态效果（使用新的目标解析系统，支持百分比计算）"""
         messages = []
@@ -744,10 +726,7 @@ class SkillEffect(ABC):
         if not skill_info:
             return messages
         
-        try:
-            effects = json.loads(skill_info.get('effects', '{}'))
-        except (json.JSONDecodeError, TypeError):
-            effects = {}
+        effects = get_skill_effects(skill_info)
         
         # 检查是否是数组格式（新的削弱光环技能格式）
         if isinstance(effects, list):
@@ -773,27 +752,22 @@ class SkillEffect(ABC):
                     else:
                         targets = [attacker]  # 默认自身
                     
-                    # 对所有目标施加状态效果
-                    for target_char in targets:
-                        if not target_char:
-                            continue
-                        
-                        # 确定效果类型
-                        if effect_name in ['weak', 'vulnerable', 'burn', 'poison', 'rupture', 'bleeding', 'paralysis']:
-                            status_type = 'debuff'
-                        elif effect_name in ['strong', 'breathing', 'guard', 'shield', 'haste']:
-                            status_type = 'buff'
-                        else:
-                            status_type = effect_info.get('effect_type', 'debuff')
-                        
-                        success = add_status_effect(
-                            target_char['id'],
-                            status_type,
-                            effect_name,
-                            intensity,
-                            duration
-                        )
-                        
+                    # 确定效果类型
+                    if effect_name in ['weak', 'vulnerable', 'burn', 'poison', 'rupture', 'bleeding', 'paralysis']:
+                        status_type = 'debuff'
+                    elif effect_name in ['strong', 'breathing', 'guard', 'shield', 'haste']:
+                        status_type = 'buff'
+                    else:
+                        status_type = effect_info.get('effect_type', 'debuff')
+                    
+                    # 对所有目标批量施加状态效果
+                    targets = [target_char for target_char in targets if target_char]
+                    applied = add_status_effects_bulk([
+                        (target_char['id'], status_type, effect_name, intensity, duration)
+                        for target_char in targets
+                    ])
+                    
+                    for target_char, success in zip(targets, applied):
                         if success:
                             effect_display_names = {
                                 'weak': '虚弱',
@@ -887,7 +861,7 @@ class SkillEffect(ABC):
                     
                     # 解析目标
                     target_type = status_info.get('target', 'skill_target')
-                    status_targets = target_resolver.resolve_target(target_type, attacker, target)
+                    status_targets = get_target_resolver().resolve_target(target_type, attacker, target)
                     
                     # 应用状态效果
                     for status_target in status_targets:
@@ -953,7 +927,7 @@ class SkillEffect(ABC):
             buff_info = effects['buff']
             # 解析目标
             target_type = buff_info.get('target', 'skill_target')
-            buff_targets = target_resolver.resolve_target(target_type, attacker, target)
+            buff_targets = get_target_resolver().resolve_target(target_type, attacker, target)
             
             # 应用buff效果
             for buff_target in buff_targets:
@@ -1011,7 +985,7 @@ class SkillEffect(ABC):
             debuff_info = effects['debuff']
             # 解析目标
             target_type = debuff_info.get('target', 'skill_target')
-            debuff_targets = target_resolver.resolve_target(target_type, attacker, target)
+            debuff_targets = get_target_resolver().resolve_target(target_type, attacker, target)
             
             # 应用debuff效果
             for debuff_target in debuff_targets:
@@ -1042,7 +1016,7 @@ class SkillEffect(ABC):
             damage_info = effects['damage']
             # 解析目标
             target_type = damage_info.get('target', 'skill_target')
-            damage_targets = target_resolver.resolve_target(target_type, attacker, target)
+            damage_targets = get_target_resolver().resolve_target(target_type, attacker, target)
             
             # 应用伤害效果
             for damage_target in damage_targets:
@@ -1061,7 +1035,7 @@ class SkillEffect(ABC):
             heal_info = effects['heal']
             # 解析目标
             target_type = heal_info.get('target', 'skill_target')
-            heal_targets = target_resolver.resolve_target(target_type, attacker, target)
+            heal_targets = get_target_resolver().resolve_target(target_type, attacker, target)
             
             # 应用治疗效果
             for heal_target in heal_targets:
@@ -1150,19 +1124,14 @@ class SkillEffect(ABC):
                     else:
                         effect_type = 'debuff'  # 默认为debuff
                     
-                    # 对所有敌方目标施加状态效果
-                    for enemy_target in enemy_targets:
-                        if not enemy_target:
-                            continue
-                        
-                        success = add_status_effect(
-                            enemy_target['id'],
-                            effect_type,
-                            effect_name,
-                            effect_value,
-                            effect_turns
-                        )
-                        
+                    # 对所有敌方目标批量施加状态效果
+                    valid_targets = [enemy_target for enemy_target in enemy_targets if enemy_target]
+                    applied = add_status_effects_bulk([
+                        (enemy_target['id'], effect_type, effect_name, effect_value, effect_turns)
+                        for enemy_target in valid_targets
+                    ])
+                    
+                    for enemy_target, success in zip(valid_targets, applied):
                         if success:
                             effect_display_names = {
                                 'weak': '虚弱',
@@ -1270,8 +1239,7 @@ class SkillEffect(ABC):
     
     def _apply_instant_cooldown_reduction(self, character_id: int, intensity: int) -> list:
         """立即应用冷却缩减效果"""
-        from database.queries import get_character
-        from database.db_connection import get_db_connection
+        from database.queries import get_character, update_character_status
         import json
         import logging
         
@@ -1305,26 +1273,12 @@ class SkillEffect(ABC):
                         status['cooldowns'][skill_id] = new_cooldown
                 
                 # 更新角色状态
-                conn = get_db_connection()
-                cursor = conn.cursor()
-                try:
-                    cursor.execute(
-                        "UPDATE characters SET status = ? WHERE id = ?",
-                        (json.dumps(status), character_id)
-                    )
-                    conn.commit()
-                    
+                if update_character_status(character_id, status):
                     if reduced_skills or intensity > 0:
                         if reduced_skills:
                             messages.append(f"❄️ {character_name} 的技能冷却时间缩短了，部分技能可立即使用")
                         else:
                             messages.append(f"❄️ {character_name} 的技能冷却时间得到了缩短")
-                            
-                except Exception as e:
-                    logger.error(f"更新冷却状态时出错: {e}")
-                    conn.rollback()
-                finally:
-                    conn.close()
             else:
                 # 没有冷却中的技能
                 messages.append(f"❄️ {character_name} 尝试缩短技能冷却时间，但当前没有技能在冷却中")
@@ -1375,8 +1329,7 @@ class SkillEffect(ABC):
             return messages
             
         try:
-            effects = skill_info.get('effects', '{}')
-            effects_dict = json.loads(effects) if isinstance(effects, str) else effects
+            effects_dict = get_skill_effects(skill_info)
             
             # 处理自我伤害
             if 'self_damage' in effects_dict:
@@ -1456,6 +1409,7 @@ class SkillEffect(ABC):
         
         return 0
     
+    @timed('emotion_coins')
     def process_damage_emotion_coins(self, attacker, target, damage_dealt, target_died):
         """
         处理伤害相关的情感硬币获取
@@ -1513,6 +1467,7 @@ class SkillEffect(ABC):
         
         return messages
     
+    @timed('emotion_coins')
     def process_healing_emotion_coins(self, healer, target, healing_amount):
         """
         处理治疗相关的情感硬币获取
@@ -1565,6 +1520,7 @@ class SkillEffect(ABC):
         
         return messages
     
+    @timed('emotion_coins')
     def process_dice_emotion_coins(self, character_id, dice_results, dice_sides, character_name):
         """
         处理骰子相关的情感硬币获取
@@ -1675,14 +1631,36 @@ class SkillEffectRegistry:
         return self.effects.get(skill_id, DefaultSkillEffect())
     
     def execute_skill(self, attacker, target, skill_info):
-        """执行技能"""
+        """执行技能（整个结算在同一个工作单元中完成，读写走战斗快照，结束时统一提交）"""
         if not skill_info:
             # 无技能时使用普通攻击
             effect = self.get_effect(1)
         else:
             effect = self.get_effect(skill_info['id'])
         
-        return effect.execute(attacker, target, skill_info)
+        # 整个结算作为最外层计时区间，各阶段的耗时按技能分类归组（/latency 查看）
+        category = skill_info.get('skill_category', 'damage') if skill_info else 'damage'
+        with span('execute_skill', root=category):
+            with unit_of_work(battle_state=True):
+                return effect.execute(attacker, target, skill_info)
+
+# 全局技能效果注册表实例（首次使用时创建）
+_skill_registry = None
+_skill_registry_lock = threading.Lock()
+
+
+def get_skill_registry() -> SkillEffectRegistry:
+    """获取全局技能效果注册表（首次调用时创建）"""
+    global _skill_registry
+    if _skill_registry is None:
+        with _skill_registry_lock:
+            if _skill_registry is None:
+                _skill_registry = SkillEffectRegistry()
+    return _skill_registry
+
 
-# 创建全局技能效果注册表实例
-skill_registry = SkillEffectRegistry()
+def __getattr__(name):
+    # 兼容 from skill.skill_effects import skill_registry
+    if name == 'skill_registry':
+        return get_skill_registry()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -16,6 +16,7 @@ from database.queries import (
     remove_skill_from_character,
     get_skill_by_id
 )
+from skill.skill_cache import invalidate_skill_cache
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -281,6 +282,7 @@ async def handle_skill_addition(update: Update, context: CallbackContext) -> int
         return ConversationHandler.END
     
     if add_skill_to_character(character['id'], skill_id):
+        invalidate_skill_cache(skill_id)
         await query.edit_message_text(
             f"成功为角色 '{character['name']}' 添加技能 '{skill['name']}'！"
         )
@@ -307,6 +309,7 @@ async def handle_skill_removal(update: Update, context: CallbackContext) -> int:
         return ConversationHandler.END
     
     if remove_skill_from_character(character['id'], skill_id):
+        invalidate_skill_cache(skill_id)
         await query.edit_message_text(
             f"成功从角色 '{character['name']}' 移除技能 '{skill['name']}'！"
         )
@@ -338,6 +341,7 @@ async def handle_batch_skill_toggle(update: Update, context: CallbackContext) ->
         
         for skill_id in selected_skills:
             if add_skill_to_character(character['id'], skill_id):
+                invalidate_skill_cache(skill_id)
                 success_count += 1
             else:
                 skill = get_skill_by_id(skill_id)
@@ -363,6 +367,7 @@ async def handle_batch_skill_toggle(update: Update, context: CallbackContext) ->
         
         for skill_id in selected_skills:
             if remove_skill_from_character(character['id'], skill_id):
+                invalidate_skill_cache(skill_id)
                 success_count += 1
             else:
                 skill = get_skill_by_id(skill_id)
@@ -110,28 +110,23 @@ class AOEStatusApplicator(BaseEffect):
         else:
             targets = [attacker]  # 默认自身
         
-        # 对所有目标施加状态效果
-        for target_char in targets:
-            if not target_char:
-                continue
-            
-            # 确定效果类型
-            if effect_name in ['weak', 'vulnerable', 'burn', 'poison', 'rupture', 'bleeding', 'paralysis']:
-                status_type = 'debuff'
-            elif effect_name in ['strong', 'breathing', 'guard', 'shield', 'haste']:
-                status_type = 'buff'
-            else:
-                status_type = effect_info.get('effect_type', 'debuff')
-            
-            from character.status_effects import add_status_effect
-            success = add_status_effect(
-                target_char['id'],
-                status_type,
-                effect_name,
-                intensity,
-                duration
-            )
-            
+        # 确定效果类型
+        if effect_name in ['weak', 'vulnerable', 'burn', 'poison', 'rupture', 'bleeding', 'paralysis']:
+            status_type = 'debuff'
+        elif effect_name in ['strong', 'breathing', 'guard', 'shield', 'haste']:
+            status_type = 'buff'
+        else:
+            status_type = effect_info.get('effect_type', 'debuff')
+        
+        # 对所有目标批量施加状态效果
+        from character.status_effects import add_status_effects_bulk
+        targets = [target_char for target_char in targets if target_char]
+        applied = add_status_effects_bulk([
+            (target_char['id'], status_type, effect_name, intensity, duration)
+            for target_char in targets
+        ])
+        
+        for target_char, success in zip(targets, applied):
             if success:
                 effect_display_names = {
                     'weak': '虚弱',
@@ -3,6 +3,7 @@
 整合所有效果系统，提供统一的接口
 """
 
+import threading
 from typing import Dict, Any, List, Tuple
 from effects import EffectRegistry
 from skill.special_effects.hardblood_effects import (
@@ -15,6 +16,7 @@ from skill.special_effects.aura_effects import (
     WeakenAuraStatus, AOEStatusApplicator
 )
 from game.damage_enhancers.damage_manager import DamageEnhancerManager
+from game.spans import timed
 
 
 class EffectIntegrationManager:
@@ -42,6 +44,7 @@ class EffectIntegrationManager:
         self.registry.register_status_effect(WeakenAuraStatus())
         self.registry.register_special_effect(AOEStatusApplicator())
     
+    @timed('calculate_unified_damage')
     def calculate_unified_damage(self, context: Dict[str, Any]) -> Tuple[int, int, str, List[str]]:
         """
         统一计算伤害（基础伤害 + 所有附加伤害）
@@ -160,5 +163,23 @@ class EffectIntegrationManager:
         return results
 
 
-# 全局效果集成管理器
-effect_integration_manager = EffectIntegrationManager()
+# 全局效果集成管理器（首次使用时创建）
+_effect_integration_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_effect_integration_manager() -> EffectIntegrationManager:
+    """获取全局效果集成管理器（首次调用时创建）"""
+    global _effect_integration_manager
+    if _effect_integration_manager is None:
+        with _manager_lock:
+            if _effect_integration_manager is None:
+                _effect_integration_manager = EffectIntegrationManager()
+    return _effect_integration_manager
+
+
+def __getattr__(name):
+    # 兼容 from special_effect_integration import effect_integration_manager
+    if name == 'effect_integration_manager':
+        return get_effect_integration_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")